@@ -133,6 +133,24 @@ bool isFrozen = false;
 elapsedMillis timeSinceFreeze;
 #define freezeTime 2000
 
+// Binary training packets - the trainer asks for these with >ATB, and plain >AT switches back to text.
+// Teensy is little-endian, and so is the wire format.
+#define binaryPacketMagic 0x5AA5  // Goes out as A5 5A
+struct __attribute__((packed)) BinaryPacket {
+  uint16_t magic;
+  uint8_t fingers;  // Bit n is set if finger n is extended
+  float bearing[3];
+  float acceleration[3];
+  uint32_t microseconds;
+  uint8_t checksum;  // Sum of every byte from fingers through microseconds
+};
+bool sendBinaryPackets = false;
+
+// Commands from the trainer (>AT, >ATB) can arrive split across loops, so they pile up here until their '\n' does
+#define btCommandMaxLength 8
+char btCommandBuffer[btCommandMaxLength];
+int btCommandLength = 0;
+
 void setup() {
   Serial.begin(115200);
   bt.begin(115200);
@@ -252,17 +270,27 @@ void loop() {
   }
 
   while (bt.available()) {
-    if (bt.peek() == '>') {
-      if (bt.available() >= 5
-          && bt.read() == '>'
-          && bt.read() == 'A'
-          && bt.read() == 'T'
-          && bt.read() == '\r'
-          && bt.read() == '\n') {
-        debug_println("Got AT - request to acknowledge");
-        bt.print(">OK\n");
+    if (btCommandLength > 0 || bt.peek() == '>') {
+      char incoming = bt.read();
+      btCommandBuffer[btCommandLength++] = incoming;
+
+      if (incoming == '\n') {
+        btCommandBuffer[btCommandLength] = '\0';
+        if (strcmp(btCommandBuffer, ">AT\r\n") == 0) {
+          debug_println("Got AT - request to acknowledge");
+          sendBinaryPackets = false;
+          bt.print(">OK\n");
+        }
+        else if (strcmp(btCommandBuffer, ">ATB\r\n") == 0) {
+          debug_println("Got ATB - switching to binary packets");
+          bt.print(">OKB\n");
+          sendBinaryPackets = true;
+        }
+        btCommandLength = 0;
+      }
+      else if (btCommandLength >= btCommandMaxLength - 1) {
+        btCommandLength = 0;  // Too long to be anything we know - drop it
       }
-      else break;
     }
     else {
 #ifdef debug_dump_bt_rx
@@ -516,49 +544,72 @@ void loop() {
     if (timeSinceLastDebugCommandChar >= commandLockout) {
       if (!digitalRead(btRtsPin)) {
 #ifdef training_mode
-        //   Packet format:
-        //   >[./|],[./|],[./|],[./|],[float h],[float p],[float r],[float accel x],[accel y],[accel z],[us since last sample]
-        char outgoingPacket[100] = {0};
-        outgoingPacket[0] = '>';
+        if (sendBinaryPackets) {
+          BinaryPacket packet;
+          packet.magic = binaryPacketMagic;
+          packet.fingers = 0;
+          for (int i = 0; i < 4; i++) {
+            if (lastFingerPositions[i]) packet.fingers |= 1 << i;
+          }
+          packet.bearing[0] = yaw;
+          packet.bearing[1] = pitch;
+          packet.bearing[2] = imu.Quat[2];
+          packet.acceleration[0] = imu.ax;
+          packet.acceleration[1] = imu.ay;
+          packet.acceleration[2] = imu.az;
+          packet.microseconds = sampleRate;
+
+          uint8_t* packetBytes = (uint8_t*)&packet;
+          packet.checksum = 0;
+          for (unsigned int i = 2; i < sizeof(BinaryPacket) - 1; i++) packet.checksum += packetBytes[i];
+
+          bt.write(packetBytes, sizeof(BinaryPacket));
+        }
+        else {
+          //   Packet format:
+          //   >[./|],[./|],[./|],[./|],[float h],[float p],[float r],[float accel x],[accel y],[accel z],[us since last sample]
+          char outgoingPacket[100] = {0};
+          outgoingPacket[0] = '>';
 
-        if (lastFingerPositions[0]) outgoingPacket[1] = '.';
-        else outgoingPacket[1] = '|';
-        outgoingPacket[2] = ',';
+          if (lastFingerPositions[0]) outgoingPacket[1] = '.';
+          else outgoingPacket[1] = '|';
+          outgoingPacket[2] = ',';
 
-        if (lastFingerPositions[1]) outgoingPacket[3] = '.';
-        else outgoingPacket[3] = '|';
-        outgoingPacket[4] = ',';
+          if (lastFingerPositions[1]) outgoingPacket[3] = '.';
+          else outgoingPacket[3] = '|';
+          outgoingPacket[4] = ',';
 
-        if (lastFingerPositions[2]) outgoingPacket[5] = '.';
-        else outgoingPacket[5] = '|';
-        outgoingPacket[6] = ',';
+          if (lastFingerPositions[2]) outgoingPacket[5] = '.';
+          else outgoingPacket[5] = '|';
+          outgoingPacket[6] = ',';
 
-        if (lastFingerPositions[3]) outgoingPacket[7] = '.';
-        else outgoingPacket[7] = '|';
-        outgoingPacket[8] = ',';
+          if (lastFingerPositions[3]) outgoingPacket[7] = '.';
+          else outgoingPacket[7] = '|';
+          outgoingPacket[8] = ',';
 
-        dtostrf(yaw, 6, 4, &outgoingPacket[strlen(outgoingPacket)]);
-        outgoingPacket[strlen(outgoingPacket)] = ',';
+          dtostrf(yaw, 6, 4, &outgoingPacket[strlen(outgoingPacket)]);
+          outgoingPacket[strlen(outgoingPacket)] = ',';
 
-        dtostrf(pitch, 6, 4, &outgoingPacket[strlen(outgoingPacket)]);
-        outgoingPacket[strlen(outgoingPacket)] = ',';
+          dtostrf(pitch, 6, 4, &outgoingPacket[strlen(outgoingPacket)]);
+          outgoingPacket[strlen(outgoingPacket)] = ',';
 
-        dtostrf(imu.Quat[2], 6, 4, &outgoingPacket[strlen(outgoingPacket)]);
-        outgoingPacket[strlen(outgoingPacket)] = ',';
+          dtostrf(imu.Quat[2], 6, 4, &outgoingPacket[strlen(outgoingPacket)]);
+          outgoingPacket[strlen(outgoingPacket)] = ',';
 
-        dtostrf(imu.ax, 7, 4, &outgoingPacket[strlen(outgoingPacket)]);
-        outgoingPacket[strlen(outgoingPacket)] = ',';
+          dtostrf(imu.ax, 7, 4, &outgoingPacket[strlen(outgoingPacket)]);
+          outgoingPacket[strlen(outgoingPacket)] = ',';
 
-        dtostrf(imu.ay, 7, 4, &outgoingPacket[strlen(outgoingPacket)]);
-        outgoingPacket[strlen(outgoingPacket)] = ',';
+          dtostrf(imu.ay, 7, 4, &outgoingPacket[strlen(outgoingPacket)]);
+          outgoingPacket[strlen(outgoingPacket)] = ',';
 
-        dtostrf(imu.az, 7, 4, &outgoingPacket[strlen(outgoingPacket)]);
-        outgoingPacket[strlen(outgoingPacket)] = ',';
+          dtostrf(imu.az, 7, 4, &outgoingPacket[strlen(outgoingPacket)]);
+          outgoingPacket[strlen(outgoingPacket)] = ',';
 
-        itoa(sampleRate, &outgoingPacket[strlen(outgoingPacket)], 10);
-        outgoingPacket[strlen(outgoingPacket)] = '\n';
+          itoa(sampleRate, &outgoingPacket[strlen(outgoingPacket)], 10);
+          outgoingPacket[strlen(outgoingPacket)] = '\n';
 
-        bt.write(outgoingPacket, strlen(outgoingPacket));
+          bt.write(outgoingPacket, strlen(outgoingPacket));
+        }
 #endif  // ifdef training_mode
 
 #ifdef hid_mode
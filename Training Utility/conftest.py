@@ -0,0 +1 @@
+# Lets pytest import somatictrainer when run from here
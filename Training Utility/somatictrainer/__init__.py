@@ -1,20 +1,25 @@
-from tkinter import *
-import tkinter
 import logging
-import somatictrainer.app
+import os
 
 logging.basicConfig(level=logging.DEBUG)
 
+# Set this and the trainer quits as soon as its first frame is up - see startup_benchmark.py
+exit_after_first_frame_variable = 'SOMATIC_EXIT_AFTER_FIRST_FRAME'
+
 
 def log_error(*args):
     logging.exception('whoops')
     pass  # Set breakpoints here
 
-tkinter.Tk.report_callback_exception = log_error
-
 
 def _main():
-    root = Tk()
+    # The GUI only gets imported here, so importing the package for a constant doesn't drag Tk and friends along
+    import tkinter
+    import somatictrainer.app
+
+    tkinter.Tk.report_callback_exception = log_error
+
+    root = tkinter.Tk()
     # root.attributes('-topmost', 1)
 
     root.minsize(560, 550)
@@ -22,6 +27,12 @@ def _main():
     window.start()
 
     root.protocol('WM_DELETE_WINDOW', window.stop)
+
+    if os.environ.get(exit_after_first_frame_variable):
+        root.wait_visibility()
+        root.update_idletasks()
+        return
+
     while True:
         try:
             root.mainloop()
@@ -0,0 +1,3 @@
+from somatictrainer import _main
+
+_main()
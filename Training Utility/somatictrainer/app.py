@@ -1,6 +1,5 @@
 import cProfile
 import pickle
-from datetime import datetime
 from random import randint
 from tkinter import *
 from tkinter import messagebox, filedialog, ttk, font
@@ -15,21 +14,20 @@ from queue import Queue, Empty
 from collections import deque
 import json
 import os
-from PIL import Image, ImageTk, ImageDraw
+from PIL import Image, ImageTk
 from enum import Enum
-import tensorflow.keras as keras
-from copy import deepcopy
 from somatictrainer.util import *
-from somatictrainer.gestures import Gesture, GestureTrainingSet, standard_gesture_length
+from somatictrainer.gestures import GestureTrainingSet, standard_gesture_length
+from somatictrainer.receiver import SerialReceiver
+from somatictrainer.segmenter import GestureSegmenter
+from somatictrainer.inference import InferenceWorker, load_recognizer
+from somatictrainer.thumbnails import ThumbnailCache, thumbnail_directory_for, render_thumbnails
 
 
 class SomaticTrainerHomeWindow(Frame):
-    model: keras.Model
     port: serial.Serial
     training_set: GestureTrainingSet
 
-    pointer_gesture = [True, True, True, False]
-
     class State(Enum):
         quitting = -1
         disconnected = 0
@@ -50,9 +48,6 @@ class SomaticTrainerHomeWindow(Frame):
         self.logger = logging.getLogger('HomeWindow')
         self.logger.setLevel(logging.DEBUG)
         self._log_parsing = False
-        self._log_angular_velocity = False
-
-        self.gesture_cone_angle = 2 / 3 * np.pi  # 120 degrees
 
         hand_icon_directory = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'Hands')
 
@@ -70,21 +65,19 @@ class SomaticTrainerHomeWindow(Frame):
             hand_bitmaps.append(hand_bitmap)
             self.hand_icons[i] = ImageTk.PhotoImage(image=hand_bitmap)
 
-        self.example_thumbnails = {}
+        self.thumbnail_cache = ThumbnailCache(lambda paths: render_thumbnails(paths, 50, 50, 2, 2, 2))
 
         self.state = self.State.disconnected
         self.training_mode = self.TrainingMode.not_set
 
         self.queue = Queue()
         self.port = None
-        self._line_reader = None
+        self._receiver = None
         self.receiving = False
         self.last_hand_id = -1
 
         self._config_file_version = 1
 
-        self.handling_samples = False
-
         self.open_file_pathspec = ''
         self.open_file_has_been_modified = False
         self.change_count_since_last_save = 0
@@ -92,23 +85,18 @@ class SomaticTrainerHomeWindow(Frame):
         self._autosave_timer = None
         self.training_set = GestureTrainingSet()
 
-        self.gesture_buffer = []
-        self.raw_data_buffer = []
-        self.current_gesture_duration = 0
-        self.last_gesture_timestamp = datetime.now()
-        self.minimum_velocity_to_start_gesture = 5.0
-        self.maximum_velocity_to_end_gesture = 1.5
-        self.gesture_lockout_time = 0.2  # Seconds to ignore gestures, to allow user to reposition their hand
-
-        self.samples_to_handle = []
-        self.bearing_zero = None
-        self.last_unprocessed_bearing_received = None
-        self.angular_velocity_window = deque(maxlen=5)
+        self.segmenter = GestureSegmenter()
         self.starting_velocity_estimation_buffer = deque(maxlen=10)
-        self.last_coordinate_visualized = None
+        self.live_path_coords = []  # Flattened x, y pairs of the gesture being recorded
+        self.frame_interval = 1000 // 60  # Milliseconds between redraws
 
         self.lipsum_examples = []
-        self.thumbnail_buttons = []
+        self.thumbnail_examples = []  # Everything in the thumbnail grid, whether or not it's scrolled into view
+        self._thumbnail_uuids = set()
+        self.thumbnail_buttons = []  # (button, canvas window) pairs, recycled as the grid scrolls
+        self.thumbnail_columns = 5
+        self.thumbnail_cell_size = 56  # Pixels - a 50px thumbnail plus the button's border
+        self.thumbnail_prefetch_rows = 10  # Rows above and below the visible ones to render ahead of scrolling
 
         self.master.title('Somatic Trainer')
         self.pack(fill=BOTH, expand=1)
@@ -142,6 +130,12 @@ class SomaticTrainerHomeWindow(Frame):
             value=self.TrainingMode.with_lipsum.value, command=handle_training_mode_change)
         self.menu_bar.add_cascade(label='Training mode', menu=self.training_mode_menu)
 
+        self.model_menu = Menu(self.menu_bar, tearoff=0)
+        self.model_menu.add_command(label='Load model...', command=self.load_model)
+        self.unload_model_entry_index = 1
+        self.model_menu.add_command(label='Unload model', command=self.unload_model, state=DISABLED)
+        self.menu_bar.add_cascade(label='Recognizer', menu=self.model_menu)
+
         # This baloney is needed to get the selector menu checkboxes to play nice
         self._serial_port_active_var = BooleanVar()
         self._serial_port_active_var.set(True)
@@ -162,6 +156,19 @@ class SomaticTrainerHomeWindow(Frame):
         self.path_display = Canvas(left_column, width=250, height=250, bg='white')
         self.path_display.pack(fill=X)
 
+        # The path display reuses these instead of making new items for every sample and every gesture
+        self.live_path_item = self.path_display.create_line(0, 0, 0, 0, width=2, fill='blue',
+                                                            state=HIDDEN, tags='reusable')
+        self.path_segment_items = []
+        for i in range(1, standard_gesture_length):
+            green = int(_scale(i, 0, standard_gesture_length, 255, 0))
+            blue = int(_scale(i, 0, standard_gesture_length, 0, 255))
+            self.path_segment_items.append(self.path_display.create_line(
+                0, 0, 0, 0, width=2, fill='#00{:02X}{:02X}'.format(green, blue), state=HIDDEN, tags='reusable'))
+        self.path_point_items = [self.path_display.create_oval(0, 0, 0, 0, fill='SeaGreen1', state=HIDDEN,
+                                                               tags=('reusable', 'path-point'))
+                                 for _ in range(standard_gesture_length)]
+
         label_width_locking_frame = Frame(right_column, height=20, width=250)
         label_width_locking_frame.grid(row=0, column=0, sticky=N + E + W)
         self.file_name_label = Label(label_width_locking_frame, text='No training file open', bg='white', relief=SUNKEN)
@@ -178,9 +185,11 @@ class SomaticTrainerHomeWindow(Frame):
         self.thumbnail_scrollbar = Scrollbar(picker_frame)
         self.thumbnail_scrollbar.grid(row=0, column=1, sticky=N + S)
 
-        self.thumbnail_canvas.configure(yscrollcommand=self.thumbnail_scrollbar.set)
         self.thumbnail_scrollbar.config(command=self.thumbnail_canvas.yview)
-        self.thumbnail_canvas.config(yscrollcommand=self.thumbnail_scrollbar.set)
+
+        # Only the rows in view get buttons, and they're recycled whenever the view scrolls or resizes
+        self.thumbnail_canvas.config(yscrollcommand=self.on_thumbnails_scrolled)
+        self.thumbnail_canvas.bind('<Configure>', lambda x: self.layout_thumbnails())
 
         def bind_wheel_to_thumbnails(event):
             self.thumbnail_canvas.bind_all('<MouseWheel>', on_wheel_scroll)
@@ -191,16 +200,8 @@ class SomaticTrainerHomeWindow(Frame):
         def on_wheel_scroll(event):
             self.thumbnail_canvas.yview_scroll(int(event.delta / -120), 'units')
 
-        self.thumbnail_frame = Frame(self.thumbnail_canvas, bg='white')
-        self.thumbnail_frame.bind('<Enter>', bind_wheel_to_thumbnails)
-        self.thumbnail_frame.bind('<Leave>', unbind_wheel_from_thumbnails)
-        self.thumbnail_frame.bind('<Configure>', lambda x: self.thumbnail_canvas.configure(
-            scrollregion=self.thumbnail_canvas.bbox(ALL)))
-
-        self.thumbnail_canvas.create_window((0, 0), window=self.thumbnail_frame, anchor=NW)
-
-        for i in range(5):
-            self.thumbnail_frame.grid_columnconfigure(i, weight=1)
+        self.thumbnail_canvas.bind('<Enter>', bind_wheel_to_thumbnails)
+        self.thumbnail_canvas.bind('<Leave>', unbind_wheel_from_thumbnails)
 
         self.glyph_picker = ttk.Treeview(right_column, column='count')
         self.glyph_picker.column("#0", width=100, stretch=False)
@@ -239,13 +240,7 @@ class SomaticTrainerHomeWindow(Frame):
 
         # self.grid_propagate(True)
 
-        # Debug code!
-        keras.backend.set_learning_phase(0)
-        # self.model = keras.models.load_model(
-        #     'E:\\Dropbox\\Projects\\Source-Controlled Projects\\Somatic\\Training Utility\\training_set_2.h5')
-        #     '/Users/zackfreedman/Dropbox/Projects/Source-Controlled Projects/Somatic/Training Utility/training_set_2.h5')
-
-        self.model = None
+        self.inference = InferenceWorker(self.queue)
 
     def save_state(self):
         datastore = {'port': self.port.port if self.port is not None and self.port.isOpen() else None,
@@ -386,73 +381,107 @@ class SomaticTrainerHomeWindow(Frame):
             return None
 
     def reload_example_list(self):
-        for button in self.thumbnail_buttons:
-            button.grid_forget()
-            button.destroy()
-
-        del self.thumbnail_buttons[:]
-
         if self.training_mode is self.TrainingMode.by_glyph:
             selected_glyph = self.get_selected_glyph()
-            if selected_glyph is None or not self.training_set.count(selected_glyph):
-                return
-
-            for example in self.training_set.get_examples_for(selected_glyph):
-                self.insert_thumbnail_button_for(example)
+            if selected_glyph is None:
+                examples = []
+            else:
+                examples = self.training_set.get_examples_for(selected_glyph)
 
         elif self.training_mode is self.TrainingMode.with_lipsum:
-            for example in self.lipsum_examples:
-                self.insert_thumbnail_button_for(example)
+            examples = list(self.lipsum_examples)
+        else:
+            examples = []
 
+        self.thumbnail_examples = examples
+        self._thumbnail_uuids = {example.uuid for example in examples}
+
+        self.update_thumbnail_scrollregion()
         self.thumbnail_canvas.yview_moveto(0)
+        self.layout_thumbnails()
 
-    def insert_thumbnail_button_for(self, example):
-        for button in self.thumbnail_buttons:
-            if button.gesture == example:
-                self.logger.debug('Already placed button for example w/ UUID {}'.format(example.uuid))
-                return
+    def insert_thumbnail_for(self, example):
+        if example.uuid in self._thumbnail_uuids:
+            self.logger.debug('Already placed thumbnail for example w/ UUID {}'.format(example.uuid))
+            return
 
-        if example in self.example_thumbnails:
-            thumbnail = self.example_thumbnails[example]
-        else:
-            thumbnail = ImageTk.PhotoImage(
-                image=_gesture_to_image(
-                    example.bearings, 50, 50, 2, 2, 2))
-            self.example_thumbnails[example] = thumbnail
+        self.thumbnail_examples.append(example)
+        self._thumbnail_uuids.add(example.uuid)
+
+        self.update_thumbnail_scrollregion()
+        self.layout_thumbnails()
+
+    def update_thumbnail_scrollregion(self):
+        # Don't do this in layout_thumbnails - reconfiguring the canvas makes it call on_thumbnails_scrolled again
+        rows = (len(self.thumbnail_examples) + self.thumbnail_columns - 1) // self.thumbnail_columns
+        self.thumbnail_canvas.configure(scrollregion=(0, 0,
+                                                      self.thumbnail_columns * self.thumbnail_cell_size,
+                                                      rows * self.thumbnail_cell_size))
+
+    def on_thumbnails_scrolled(self, first, last):
+        self.thumbnail_scrollbar.set(first, last)
+        self.layout_thumbnails()
+
+    def layout_thumbnails(self):
+        cell_size = self.thumbnail_cell_size
+        columns = self.thumbnail_columns
+
+        visible_rows = int(self.thumbnail_canvas.winfo_height() // cell_size) + 2  # Partial rows at top and bottom
+        while len(self.thumbnail_buttons) < visible_rows * columns:
+            self.thumbnail_buttons.append(self.make_thumbnail_button())
+
+        first_row = max(0, int(self.thumbnail_canvas.canvasy(0) // cell_size))
+
+        # Render what's about to scroll into view in one batch, rather than a thumbnail at a time as it shows up
+        margin = self.thumbnail_prefetch_rows
+        self.thumbnail_cache.prefetch(self.thumbnail_examples[max(0, first_row - margin) * columns:
+                                                              (first_row + visible_rows + margin) * columns])
 
-        button = Button(self.thumbnail_frame, image=thumbnail)
-        button.image = thumbnail  # Button doesn't have an image field - this monkey patch retains a reference
-        button.gesture = example  # Monkey-patch a reference to the gesture into the button to associate them
-        button.configure(command=lambda: self.visualize(example.bearings))
+        for slot, (button, window) in enumerate(self.thumbnail_buttons):
+            index = first_row * columns + slot
+
+            if index >= len(self.thumbnail_examples):
+                # Park unused buttons outside the scroll region
+                button.gesture = None
+                self.thumbnail_canvas.coords(window, -cell_size * 2, -cell_size * 2)
+                continue
+
+            example = self.thumbnail_examples[index]
+            if button.gesture is not example:
+                thumbnail = self.thumbnail_cache.get(example)
+                button.configure(image=thumbnail)
+                button.image = thumbnail  # Button doesn't have an image field - this monkey patch retains a reference
+                button.gesture = example  # Monkey-patch a reference to the gesture into the button to associate them
+
+            self.thumbnail_canvas.coords(window, (index % columns) * cell_size, (index // columns) * cell_size)
+
+    def make_thumbnail_button(self):
+        button = Button(self.thumbnail_canvas, bd=2, highlightthickness=0, padx=0, pady=0)
+        button.gesture = None
+        button.configure(command=lambda: button.gesture and self.visualize(button.gesture.bearings))
 
         # Right click on OSX
-        button.bind('<Button-2>', lambda x: self.delete_thumbnail_button(button))
+        button.bind('<Button-2>', lambda x: button.gesture and self.delete_thumbnail_for(button.gesture))
         # Right click on Windows
-        button.bind('<Button-3>', lambda x: self.delete_thumbnail_button(button))
+        button.bind('<Button-3>', lambda x: button.gesture and self.delete_thumbnail_for(button.gesture))
 
-        self.thumbnail_buttons.append(button)
-        position = len(self.thumbnail_buttons) - 1
-        button.grid(row=int(position / 5), column=int(position % 5))
+        window = self.thumbnail_canvas.create_window(-self.thumbnail_cell_size * 2, -self.thumbnail_cell_size * 2,
+                                                     window=button, anchor=NW)
+        return button, window
 
-        if len(self.thumbnail_buttons) == 1:
-            # This is the first thumbnail in the list - the scrollbar won't readjust automatically.
-            self.thumbnail_canvas.yview_moveto(0)
-
-    def delete_thumbnail_button(self, button):
+    def delete_thumbnail_for(self, example):
         self.logger.info('Removing example for {}, UUID {}'.format(
-            button.gesture.glyph, str(button.gesture.uuid)))
-        self.training_set.remove(button.gesture)
+            example.glyph, str(example.uuid)))
+        self.training_set.remove(example)
 
-        # self.reload_example_list()
-        position = self.thumbnail_buttons.index(button)
-        button.grid_forget()
-        button.destroy()
-        self.thumbnail_buttons.remove(button)
+        if example.uuid in self._thumbnail_uuids:
+            self.thumbnail_examples.remove(example)
+            self._thumbnail_uuids.discard(example.uuid)
 
-        for i in range(position, len(self.thumbnail_buttons)):
-            self.thumbnail_buttons[i].grid(row=int(i / 5), column=int(i % 5))
+        self.update_thumbnail_scrollregion()
+        self.layout_thumbnails()
 
-        self.glyph_picker.item(button.gesture.glyph, value=self.training_set.count(button.gesture.glyph))
+        self.glyph_picker.item(example.glyph, value=self.training_set.count(example.glyph))
 
         # We can save now! Yay!
         self.open_file_has_been_modified = True
@@ -469,7 +498,7 @@ class SomaticTrainerHomeWindow(Frame):
             self.master.after_cancel(self._autosave_timer)
 
         def autosave():
-            self.save_file()
+            self.save_file(incremental=True)
             self.change_count_since_last_save = 0
             self._autosave_timer = None
 
@@ -477,22 +506,29 @@ class SomaticTrainerHomeWindow(Frame):
         self._autosave_timer = self.master.after(10, autosave)
 
     def start(self):
+        self.inference.start()
         self.master.after(10, self.queue_handler)
         self.restore_state()
-        self.logger.debug('Gesture cone angle: {:.5f}'.format(self.gesture_cone_angle))  # TODO cut this
+        self.logger.debug('Gesture cone angle: {:.5f}'.format(self.segmenter.gesture_cone_angle))  # TODO cut this
 
     def stop(self):
         if self.open_file_has_been_modified:
             response = messagebox.askyesnocancel('Unsaved changes',
                                                  'Save before quitting?')
             if response:
-                self.save_file()
+                compaction = self.save_file()
+                if compaction is not None:
+                    self.training_set.wait_for_compaction()
+                    if compaction.exception() is not None:
+                        return  # Stick around - the error shows up once the queue gets to it
             elif response is None:
                 return
 
         self.state = self.State.quitting
         self.receiving = False
+        self.inference.stop()
 
+        self.thumbnail_cache.flush(self.training_set)
         self.save_state()
 
         self.queue.put({'type': 'quit'})
@@ -506,6 +542,11 @@ class SomaticTrainerHomeWindow(Frame):
         if queue_size:
             self.logger.debug('Queue has {} items'.format(self.queue.qsize()))
 
+        # Samples come in way faster than anybody can see, so only the newest status gets shown
+        # and all the new path points get drawn at once
+        latest_rx = None
+        new_path_points = []
+
         for i in range(queue_size):
             command = self.queue.get(block=False)
 
@@ -514,93 +555,56 @@ class SomaticTrainerHomeWindow(Frame):
                     self.state = self.State.connected
                     self.logger.info('Got ack - connected')
 
+            elif command['type'] is 'disconnected':
+                self.disconnect()
+
             elif command['type'] is 'viz':
                 path = command['path']
 
-                self.path_display.delete(ALL)
-
-                last_point = None
+                self.clear_path_display()
+                del new_path_points[:]
 
-                x_center = (max(path[:, 0] - min(path[:, 0]))) / 2
-                y_center = (max(path[:, 1] - min(path[:, 1]))) / 2
+                x_center = (max(path[:, 0]) - min(path[:, 0])) / 2
+                y_center = (max(path[:, 1]) - min(path[:, 1])) / 2
 
                 padding = 10
 
-                for i, coords in enumerate(path):
-                    x_coord = (coords[0] + 0.5 - x_center) * (250 - padding * 2) + padding
-                    y_coord = (coords[1] + 0.5 - y_center) * (250 - padding * 2) + padding
-
-                    if last_point:
-                        green = int(_scale(i, 0, len(path), 255, 0))
-                        blue = int(_scale(i, 0, len(path), 0, 255))
+                points = (path + 0.5 - [x_center, y_center]) * (250 - padding * 2) + padding
 
-                        self.path_display.create_line(last_point[0],
-                                                      last_point[1],
-                                                      x_coord, y_coord,
-                                                      width=2,
-                                                      fill='#00{:02X}{:02X}'.format(green, blue))
+                for item, (x_coord, y_coord) in zip(self.path_point_items, points):
+                    self.path_display.coords(item, x_coord - 2, y_coord - 2, x_coord + 2, y_coord + 2)
+                    self.path_display.itemconfigure(item, state=NORMAL)
 
-                    last_point = [x_coord, y_coord]
+                for item, start, end in zip(self.path_segment_items, points, points[1:]):
+                    self.path_display.coords(item, start[0], start[1], end[0], end[1])
+                    self.path_display.itemconfigure(item, state=NORMAL)
 
-                    self.path_display.create_oval((x_coord - 2, y_coord - 2, x_coord + 2, y_coord + 2),
-                                                  fill='SeaGreen1')
-
-                # self.master.update()
+                # Points go on top of the lines
+                self.path_display.tag_raise('path-point')
 
             elif command['type'] is 'rx':
-                bearing = command['bearing']
-                if self.state is not self.State.disconnected and self.state is not self.State.quitting:
-                    self.update_status(command['fingers'], bearing, command['freq'])
-
-                    fingers = command['fingers']
-                    hand_id = fingers[0] * 0b1000 + fingers[1] * 0b0100 + fingers[2] * 0b0010 + fingers[3] * 0b0001
-                    if hand_id != self.last_hand_id:
-                        self.hand_display.create_image((0, 0), image=self.hand_icons[hand_id], anchor=N + W)
-                        self.last_hand_id = hand_id
+                latest_rx = command
 
                 if self.state is self.State.recording:
+                    bearing = command['bearing']
                     x_coord = np.tan(bearing[0]) * 250
                     y_coord = np.tan(bearing[1]) * 250
 
                     if 0 <= x_coord <= 250 and 0 <= y_coord <= 250:
-                        # self.logger.debug('Rendering ({}, {})'.format(x_coord, y_coord))
-
-                        if self.last_coordinate_visualized:
-                            self.path_display.create_line(self.last_coordinate_visualized[0],
-                                                          self.last_coordinate_visualized[1],
-                                                          x_coord, y_coord,
-                                                          width=2, fill='blue')
-
-                        self.last_coordinate_visualized = [x_coord, y_coord]
-
-                        self.path_display.create_oval((x_coord - 2, y_coord - 2, x_coord + 2, y_coord + 2),
-                                                      fill='SeaGreen1')
+                        new_path_points.append([x_coord, y_coord])
                     else:
                         self.logger.debug('Coordinate ({}, {}) invalid - leftover from before gesture?'
                                           .format(x_coord, y_coord))
 
-                # self.master.update()
-
-            elif command['type'] is 'infer':
-                daters = command['data']
+            elif command['type'] is 'inference':
+                winning_glyph = command['glyph']
+                confidence = command['confidence']
                 selected_glyph = command['selected']
                 duration = command['duration']
                 selection_index = command['selection-index']
-                benchmark = time.perf_counter()
-                results = self.model.predict(daters.reshape(1, standard_gesture_length * 2))
-                logging.info('Inference took {:.2f} sec'.format(time.perf_counter() - benchmark))
-
-                # self.logger.info(len(results[0]))
-                try:
-                    winning_glyph, confidence = \
-                        sorted([[self.training_set.get_character_map()[i], j] for i, j in enumerate(results[0])],
-                               key=lambda item: item[1], reverse=True)[0]
-                except KeyError:
-                    winning_glyph = ''
-                    confidence = 0
 
                 logging.info('Predicted \'{}\' with {:.2f}% confidence - {}!'.format(
-                    hex(ord(winning_glyph)) if ord(winning_glyph) < ord(' ') else winning_glyph,
+                    hex(ord(winning_glyph)) if winning_glyph and ord(winning_glyph) < ord(' ') else winning_glyph,
                     confidence * 100, 'CORRECT' if winning_glyph == selected_glyph else 'WRONG'))
 
                 if confidence > 0.80:
@@ -609,11 +613,13 @@ class SomaticTrainerHomeWindow(Frame):
                                                                                if ord(winning_glyph) < ord(' ')
                                                                                else winning_glyph,
                                                                                font=font.Font(family='Comic Sans MS',
-                                                                                              size=200)))
+                                                                                              size=200),
+                                                                               tags='overlay'))
                 else:
                     self.master.after(1, lambda: self.path_display.create_text((125, 125), text='?',
                                                                                font=font.Font(family='Comic Sans MS',
-                                                                                              size=200)))
+                                                                                              size=200),
+                                                                               tags='overlay'))
                     logging.info('Too little confidence in this result to definitively call it')
                     winning_glyph = None
 
@@ -633,18 +639,34 @@ class SomaticTrainerHomeWindow(Frame):
 
                 # self.master.update()
 
+            elif command['type'] is 'saved':
+                self.on_saved(command['pathspec'], command['training-set'], command['future'])
+
             elif command['type'] is 'quit':
                 self.master.destroy()
                 return
 
+        if latest_rx and self.state is not self.State.disconnected and self.state is not self.State.quitting:
+            fingers = latest_rx['fingers']
+            self.update_status(fingers, latest_rx['bearing'], latest_rx['freq'])
+
+            hand_id = fingers[0] * 0b1000 + fingers[1] * 0b0100 + fingers[2] * 0b0010 + fingers[3] * 0b0001
+            if hand_id != self.last_hand_id:
+                self.hand_display.create_image((0, 0), image=self.hand_icons[hand_id], anchor=N + W)
+                self.last_hand_id = hand_id
+
+        if new_path_points:
+            self.live_path_coords.extend(np.ravel(new_path_points).tolist())
+
+            if len(self.live_path_coords) >= 4:
+                self.path_display.coords(self.live_path_item, *self.live_path_coords)
+                self.path_display.itemconfigure(self.live_path_item, state=NORMAL)
+
         if queue_size:
-            self.master.update()
+            self.master.update_idletasks()
             self.logger.debug("Redrew")
 
-        if self.queue.qsize() > 0:
-            self.master.after(1, self.queue_handler)
-        else:
-            self.master.after(5, self.queue_handler)
+        self.master.after(self.frame_interval, self.queue_handler)
 
     def new_file(self):
         if self.state is self.State.recording:
@@ -668,6 +690,7 @@ class SomaticTrainerHomeWindow(Frame):
             open(new_file_pathspec, 'w')  # Save empty file
 
             self.training_set = GestureTrainingSet()
+            self.thumbnail_cache.set_directory(thumbnail_directory_for(new_file_pathspec))
 
             self.file_menu.entryconfigure(self.save_entry_index, state=NORMAL)
             self.file_menu.entryconfigure(self.save_as_entry_index, state=NORMAL)
@@ -681,14 +704,15 @@ class SomaticTrainerHomeWindow(Frame):
             file_to_open = filedialog.askopenfilename(title='Select training data',
                                                       filetypes=(('Database file', '*.db'), ('All files', '*')))
 
-        if not os.path.isfile(file_to_open):
+        if not os.path.exists(file_to_open):
             self.logger.warning("Can't open training file because it doesn't exist - {}".format(file_to_open))
             return
 
         if file_to_open:
             try:
-                training_set = GestureTrainingSet.load(file_to_open)
+                training_set = GestureTrainingSet.load(file_to_open, lazy_raw_data=True)
                 self.training_set = training_set
+                self.thumbnail_cache.set_directory(thumbnail_directory_for(file_to_open))
                 self.reload_glyph_picker()
 
                 self.open_file_pathspec = file_to_open
@@ -702,7 +726,55 @@ class SomaticTrainerHomeWindow(Frame):
                                      "This file can't be loaded.\nError: {}".format(repr(e)))
                 return False
 
-    def save_file(self):
+    def load_model(self, model_pathspec=None):
+        """
+        Recognize every gesture from here on. The model's outputs get matched up with the open training set's glyphs,
+        so the set it was trained on needs to be open.
+
+        :param model_pathspec: A .tflite or Keras model, or None to ask for one
+        :type model_pathspec: str
+        :rtype: bool
+        """
+        if model_pathspec is None:
+            model_pathspec = filedialog.askopenfilename(title='Select model',
+                                                        filetypes=(('TensorFlow Lite model', '*.tflite'),
+                                                                   ('Keras model', '*.h5 *.keras'),
+                                                                   ('All files', '*')))
+
+        if not model_pathspec:
+            return False
+
+        glyphs = self.training_set.glyphs_represented
+        if not glyphs:
+            messagebox.showinfo("Can't load model",
+                                'Open the training set this model was trained on first,\n'
+                                'so it knows which glyph is which.')
+            return False
+
+        try:
+            self.inference.set_recognizer(load_recognizer(model_pathspec, glyphs))
+        except (OSError, ValueError, ImportError) as e:
+            self.logger.exception("Couldn't load model")
+            messagebox.showerror("Can't load model",
+                                 "This model can't be loaded.\nError: {}".format(repr(e)))
+            return False
+
+        self.logger.info('Recognizing gestures with {}'.format(model_pathspec))
+        self.model_menu.entryconfigure(self.unload_model_entry_index, state=NORMAL)
+        return True
+
+    def unload_model(self):
+        self.inference.set_recognizer(None)
+        self.model_menu.entryconfigure(self.unload_model_entry_index, state=DISABLED)
+
+    def save_file(self, incremental=False):
+        """
+        Incremental saves just journal what changed. Otherwise, the journal gets compacted in the background,
+        and a 'saved' message comes through the queue once it's on disk.
+
+        :return: The background compaction, if there is one
+        :rtype: concurrent.futures.Future
+        """
         if self.state is self.State.recording:
             self.state = self.State.connected
             self.cancel_gesture()
@@ -719,13 +791,41 @@ class SomaticTrainerHomeWindow(Frame):
             else:
                 return
 
-        self.training_set.save(self.open_file_pathspec)
-
-        self.logger.info('Saved {}'.format(self.open_file_pathspec))
+            self.thumbnail_cache.set_directory(thumbnail_directory_for(self.open_file_pathspec))
 
-        self.open_file_has_been_modified = False
         self.change_count_since_last_save = 0
 
+        if incremental:
+            self.training_set.save_incremental(self.open_file_pathspec)
+            self.logger.info('Journaled changes to {}'.format(self.open_file_pathspec))
+            self.open_file_has_been_modified = False
+            return None
+
+        pathspec = self.open_file_pathspec
+        compaction = self.training_set.compact(pathspec)
+        # Flushing rewrites whole sprite sheets, so autosaves leave it for a real save or quitting
+        self.thumbnail_cache.flush(self.training_set)
+
+        # This calls back on the compaction thread - let the Tk thread deal with it
+        compaction.add_done_callback(lambda future: self.queue.put({'type': 'saved', 'pathspec': pathspec,
+                                                                    'training-set': self.training_set,
+                                                                    'future': future}))
+        return compaction
+
+    def on_saved(self, pathspec, training_set, future):
+        error = future.exception()
+        if error is not None:
+            self.open_file_has_been_modified = True
+            messagebox.showerror("Couldn't save", "Saving {} failed.\nError: {}".format(pathspec, repr(error)))
+            return
+
+        self.logger.info('Saved {}'.format(pathspec))
+
+        # Only if nothing's changed since the save started, and it's still the same file
+        if training_set is self.training_set and pathspec == self.open_file_pathspec \
+                and future.result() == training_set.version:
+            self.open_file_has_been_modified = False
+
     def save_as(self):
         if self.state is self.State.recording:
             self.state = self.State.connected
@@ -744,6 +844,8 @@ class SomaticTrainerHomeWindow(Frame):
 
         self.training_set.save(self.open_file_pathspec)
 
+        self.thumbnail_cache.set_directory(thumbnail_directory_for(self.open_file_pathspec))
+
         self.open_file_has_been_modified = False
 
     def populate_serial_port_menu(self):
@@ -797,14 +899,15 @@ class SomaticTrainerHomeWindow(Frame):
 
         try:
             self.port = Serial(port=portspec, baudrate=115200)
-            self._line_reader = ReadLine(self.port)
+            self._receiver = SerialReceiver(self.port, self.queue)
 
             if not self.port.isOpen():
                 self.port.open()
             # self.serial_connect_button.configure(text='Disconnect')
             self.state = self.State.connecting
             self.status_line.configure(text='Waiting for response...', bg='DarkGoldenrod2')
-            self.port.write(bytes('>AT\r\n'.encode('utf-8')))
+            # Gloves that know binary packets acknowledge both of these. Older ones only answer the first.
+            self.port.write(bytes('>AT\r\n>ATB\r\n'.encode('utf-8')))
             self.start_receiving()
 
         except SerialException as e:
@@ -819,6 +922,7 @@ class SomaticTrainerHomeWindow(Frame):
             self.state = self.State.disconnected
             self.status_line.configure(text="Can't connect to {}".format(portspec), bg='firebrick1')
             self.port = None
+            self._receiver = None
 
     def disconnect(self):
         if self.port:
@@ -826,12 +930,10 @@ class SomaticTrainerHomeWindow(Frame):
 
             if self.receiving:
                 self.receiving = False
-                # if threading.current_thread() is not self.serial_sniffing_thread \
-                #         and self.serial_sniffing_thread \
-                #         and self.serial_sniffing_thread.is_alive():
-                #     self.logger.info('Quitting receive')
-                #     self.serial_sniffing_thread.join(timeout=1)
-                #     self.logger.info('No longer receiving')
+
+            if self._receiver:
+                self._receiver.stop()
+                self._receiver = None
 
             if self.port.isOpen():
                 self.logger.info('Port closed')
@@ -851,91 +953,30 @@ class SomaticTrainerHomeWindow(Frame):
             return
 
         self.receiving = True
-        self.logger.info('Now receiving')
+        self._receiver.start()
 
         self.master.after(1, self.handle_packets)
 
     def handle_packets(self):
-        if not self.receiving or not self.port or not self.port.isOpen():
+        if not self.receiving or not self._receiver:
             return
 
-        while self.port.in_waiting:
-            try:
-                incoming = self._line_reader.readline().decode()
-            except SerialException:
-                self.logger.exception('Lost serial connection, bailing out')
-                self.disconnect()
-                return
-
-            if incoming:
-                if self._log_parsing:
-                    self.logger.debug('Received packet {}'.format(incoming))
-
-                # Packet format:
-                # >[./|],[./|],[./|],[./|],
-                # [float o.h],[float o.p],[float o.r],
-                # [float a.x], [float a.y], [float a.z], [us since last sample]
-
-                if incoming.count('>') is not 1:
-                    if self._log_parsing:
-                        self.logger.debug('Packet corrupt - missing delimeter(s)')
-                    self.master.after(1, self.handle_packets)
-                    return
-
-                # Strip crap that arrived before the delimeter, and also the delimiter itself
-                incoming = incoming[incoming.index('>') + 1:].rstrip()
-
-                if incoming == 'OK':
-                    self.logger.info('Received ack')
-                    self.queue.put({'type': 'ack'}, block=False)
-                    self.master.after(1, self.handle_packets)
-                    return
-
-                if incoming.count(',') is not 10:
-                    if self._log_parsing:
-                        self.logger.debug('Packet corrupt - insufficient fields')
-                    self.master.after(1, self.handle_packets)
-                    return
+        # The receiver thread keeps buffering while we're busy, so take everything that piled up in one go
+        samples = self._receiver.samples.drain()
 
-                tokens = incoming.split(',')
-                if self._log_parsing:
-                    self.logger.debug('Tokens: {0}'.format(tokens))
+        if self._log_parsing and len(samples):
+            self.logger.debug('Handling {} samples'.format(len(samples)))
 
-                fingers = list(map(lambda i: i is '.', tokens[:4]))
-                if self._log_parsing:
-                    self.logger.debug('Fingers: {0}'.format(fingers))
-
-                bearing = np.array([float(t) for t in tokens[4:7]])
-                acceleration = np.array([float(t) for t in tokens[7:10]])
-
-                microseconds = float(tokens[-1])
-
-                if self._log_parsing:
-                    self.logger.debug('Sample parsed')
-
-                self.accept_sample(fingers, bearing, acceleration, microseconds)
-
-        self.master.after(1, self.handle_packets)
-        return
-
-    def accept_sample(self, *args):
-        self.samples_to_handle.append(args)
-
-        if not self.handling_samples:
-            self.handling_samples = True
-            self.master.after(1, self.sample_handling_loop)
+        for sample in samples:
+            if not self.receiving:
+                return
+            self.handle_sample(sample['f'].tolist(), sample['b'], sample['a'], float(sample['t']))
 
-    def sample_handling_loop(self):
-        if len(self.samples_to_handle):
-            fingers, bearing, acceleration, microseconds = self.samples_to_handle[0]
-            del self.samples_to_handle[0]
-            self.handle_sample(fingers, bearing, acceleration, microseconds)
-            self.master.after(1, self.sample_handling_loop)
-        else:
-            self.handling_samples = False
+        self.master.after(5, self.handle_packets)
 
     def handle_sample(self, fingers, bearing, acceleration, microseconds):
         """
+        Runs a sample through the segmenter, and files away whatever gesture comes out the other end
 
         :type fingers: list of bool
         :type bearing: np.array
@@ -948,130 +989,36 @@ class SomaticTrainerHomeWindow(Frame):
         else:
             frequency = 1 / (microseconds / 1000000)
 
-        raw_bearing = bearing
-
-        bearing = np.array([bearing[0], bearing[1]])  # We don't care about roll
-
-        if self.last_unprocessed_bearing_received is not None:
-            y, p = bearing_delta(self.last_unprocessed_bearing_received, bearing)
-            norm = np.sqrt(sum(np.square([abs(y), abs(p)])))
-
-            if self._log_angular_velocity:
-                self.logger.debug(
-                    'Last: {} Counter: {} Delta: {}'.format(self.last_unprocessed_bearing_received, bearing, [y, p]))
-                self.logger.debug('Norm: {}'.format(norm))
-
-            if norm:
-                theta = np.arcsin(norm)
-            else:
-                theta = 0
-
-            angular_velocity = theta * frequency
+        was_recording = self.segmenter.recording
+        new_gesture = self.segmenter.feed(fingers, bearing, acceleration, microseconds)
+        bearing = self.segmenter.bearing
 
-            self.angular_velocity_window.append(angular_velocity)
-
-            in_degrees = angular_velocity * 180 / np.pi
-
-            if self._log_angular_velocity:
-                self.logger.debug('Angular velocity {0:.2f} deg or {1:.2f} rad/s'.format(in_degrees, angular_velocity))
-        else:
-            angular_velocity = 0
-
-        self.last_unprocessed_bearing_received = bearing
-
-        # velocity_threshold = 1.5 if self.state is self.State.recording else 5
-
-        gesture_eligible = True
-
-        if self.state is not self.State.recording:
-            too_slow = angular_velocity < self.minimum_velocity_to_start_gesture
-            wrong_hand_sign = fingers != self.pointer_gesture
-
-            if too_slow:
-                gesture_eligible = False
-                if not wrong_hand_sign:
-                    logging.debug('Correct hand sign, but too slow')
-
-            if wrong_hand_sign:
-                gesture_eligible = False
-                # if not too_slow:
-                # logging.debug('Correct speed, but wrong hand sign')
-        else:
-            if len(self.angular_velocity_window) is 0 \
-                    or np.average(self.angular_velocity_window) < self.maximum_velocity_to_end_gesture:
-                gesture_eligible = False
-                logging.debug('Stopping recording because hand slowed down')
-
-        if gesture_eligible and (
-                datetime.now() - self.last_gesture_timestamp).total_seconds() <= self.gesture_lockout_time:
-            gesture_eligible = False
-            logging.debug('Locked out from gesturing')
-
-        if self.bearing_zero is not None:
-            # Constrain gesture to a cone
-            self.logger.debug('Raw bearing: ({:.3f}, {:.3f})'.format(bearing[0], bearing[1]))
-
-            bearing = bearing_delta(self.bearing_zero, bearing)
-            # self.logger.debug('Processed bearing 1: ({:.3f}, {:.3f})'.format(bearing[0], bearing[1]))
-
-            bearing = np.clip(bearing,
-                              -1 / 2 * self.gesture_cone_angle,
-                              1 / 2 * self.gesture_cone_angle)
-            # self.logger.debug('Processed bearing 2: ({:.3f}, {:.3f})'.format(bearing[0], bearing[1]))
-
-            # Scale bearings to ML-ready 0.0-1.0 values
-            bearing /= self.gesture_cone_angle
-            # self.logger.debug('Processed bearing 3: ({:.3f}, {:.3f})'.format(bearing[0], bearing[1]))
-
-            bearing += 0.5
-            # self.logger.debug('Processed bearing 4: ({:.3f}, {:.3f})'.format(bearing[0], bearing[1]))
-
-            self.logger.debug('Processed bearing: ({:.3f}, {:.3f})'.format(bearing[0], bearing[1]))
-
-        if gesture_eligible:
-            if self.state is not self.State.recording:
-                self.path_display.delete(ALL)
-                self.last_coordinate_visualized = None
+        if self.segmenter.recording:
+            if not was_recording:
+                self.clear_path_display()
 
                 self.logger.info('Starting sample!')
                 self.status_line.configure(bg='SeaGreen1')
 
-                self.bearing_zero = bearing
-                self.logger.debug('Bearing zero is ({:.3f}, {:.3f})'.format(self.bearing_zero[0], self.bearing_zero[1]))
-
-                bearing = np.array([0.5, 0.5])
-
-                self.gesture_buffer.append(bearing)
+                bearing_zero = self.segmenter.bearing_zero
+                self.logger.debug('Bearing zero is ({:.3f}, {:.3f})'.format(bearing_zero[0], bearing_zero[1]))
 
                 self.state = self.State.recording
-            else:
-                self.gesture_buffer.append(bearing)
-
-            self.raw_data_buffer.append({'b': raw_bearing.tolist(), 'a': acceleration.tolist(), 't': microseconds})
-            self.current_gesture_duration += microseconds
 
         else:
-            if self.state is self.State.recording:
-                self.logger.info('Sample done, {} points'.format(len(self.gesture_buffer)))
-
+            if was_recording:
                 # self.status_line.configure(bg='OliveDrab1')
+                duration = self.segmenter.last_gesture_duration
 
-                try:
-                    benchmark = time.perf_counter()
-                    processed_bearings = process_samples(np.array(self.gesture_buffer), standard_gesture_length)
-                    logging.info('Processing took {:.2f} sec'.format(time.perf_counter() - benchmark))
-
-                    for index, bearing in enumerate(processed_bearings):
-                        self.logger.debug("Point {}: ({:.4f}, {:.2f})".format(index, bearing[0], bearing[1]))
+                if new_gesture:
+                    processed_bearings = new_gesture.bearings
 
-                    new_gesture = Gesture('', processed_bearings, deepcopy(self.raw_data_buffer))
+                    for index, point in enumerate(processed_bearings):
+                        self.logger.debug("Point {}: ({:.4f}, {:.2f})".format(index, point[0], point[1]))
 
                     benchmark = time.perf_counter()
                     self.visualize(processed_bearings)
                     self.logger.info('Visualization took {:.2f} sec'.format(time.perf_counter() - benchmark))
-                except AttributeError:
-                    self.logger.exception("Couldn't create gesture")
-                    new_gesture = None
 
                 if new_gesture \
                         and (self.training_mode is self.TrainingMode.with_lipsum
@@ -1079,7 +1026,7 @@ class SomaticTrainerHomeWindow(Frame):
                                  and len(self.glyph_picker.selection()))) is 0:
                     self.overlay_text('Discarding - no glyph selected')
 
-                    if self.current_gesture_duration > 300000:
+                    if duration > 300000:
                         self.flash_blue()
                     else:
                         self.flash_red()
@@ -1091,17 +1038,14 @@ class SomaticTrainerHomeWindow(Frame):
                         if self.training_mode is self.TrainingMode.with_lipsum \
                         else None
 
-                    if self.model:
-                        self.queue.put({'type': 'infer',
-                                        'data': daters,
-                                        'selected': selected_glyph,
-                                        'duration': self.current_gesture_duration,
-                                        'selection-index': selection_index},
-                                       block=False)
+                    if self.inference.has_model:
+                        self.inference.submit(daters, **{'selected': selected_glyph,
+                                                         'duration': duration,
+                                                         'selection-index': selection_index})
 
                     short_glyph = selected_glyph in GestureTrainingSet.short_glyphs
 
-                    if self.current_gesture_duration > 0 and (short_glyph or self.current_gesture_duration > 300000):
+                    if duration > 0 and (short_glyph or duration > 300000):
                         # min_yaw = min(sample[0] for sample in self.gesture_buffer)
                         # max_yaw = max(sample[0] for sample in self.gesture_buffer)
                         # min_pitch = min(sample[1] for sample in self.gesture_buffer)
@@ -1126,7 +1070,7 @@ class SomaticTrainerHomeWindow(Frame):
                             if self.change_count_since_last_save >= self.autosave_change_threshold:
                                 self.plan_autosave()
 
-                        self.insert_thumbnail_button_for(new_gesture)
+                        self.insert_thumbnail_for(new_gesture)
                         self.glyph_picker.item(new_gesture.glyph,
                                                value=self.training_set.count(new_gesture.glyph))
                         self.thumbnail_canvas.yview_moveto(1)
@@ -1147,8 +1091,6 @@ class SomaticTrainerHomeWindow(Frame):
                         # else:
                         #     overlay_text('Discarding - too small')
                         #     self.flash_red()
-
-                        self.last_gesture_timestamp = datetime.now()
                     else:
                         self.overlay_text('Discarding - too short')
                         self.flash_red()
@@ -1176,12 +1118,13 @@ class SomaticTrainerHomeWindow(Frame):
         self.status_line.configure(text=text, bg='SeaGreen1' if self.state is self.State.recording else 'OliveDrab1')
 
     def cancel_gesture(self):
-        del self.gesture_buffer[:]
-        del self.raw_data_buffer[:]
-        self.current_gesture_duration = 0
-        self.bearing_zero = None
-        self.last_unprocessed_bearing_received = None
-        self.last_coordinate_visualized = None
+        self.segmenter.cancel_gesture()
+        del self.live_path_coords[:]
+
+    def clear_path_display(self):
+        self.path_display.delete('overlay')
+        self.path_display.itemconfigure('reusable', state=HIDDEN)
+        del self.live_path_coords[:]
 
     def visualize(self, path):
         self.queue.put({'type': 'viz', 'path': path},
@@ -1200,7 +1143,7 @@ class SomaticTrainerHomeWindow(Frame):
         self.path_display.after(200, lambda: self.path_display.configure(bg='light grey'))
 
     def overlay_text(self, text):
-        self.master.after(1, lambda: self.path_display.create_text((5, 245), text=text, anchor=SW))
+        self.master.after(1, lambda: self.path_display.create_text((5, 245), text=text, anchor=SW, tags='overlay'))
 
 
 def _scale(x, in_min, in_max, out_min, out_max):
@@ -1208,25 +1151,4 @@ def _scale(x, in_min, in_max, out_min, out_max):
 
 
 def _gesture_to_image(path, height, width, line_thiccness, xpad=0, ypad=0):
-    img = Image.new('RGBA', (height, width), (255, 255, 255, 255))
-    drawing = ImageDraw.Draw(img)
-
-    x_center = (max(path[:, 0] - min(path[:, 0]))) / 2
-    y_center = (max(path[:, 1] - min(path[:, 1]))) / 2
-
-    for i, coords in enumerate(path):
-        if i > 0:
-            prev_x_coord = (path[i - 1][0] + 0.5 - x_center) * (width - xpad * 2)
-            prev_y_coord = (path[i - 1][1] + 0.5 - y_center) * (height - ypad * 2)
-            x_coord = (coords[0] + 0.5 - x_center) * (width - xpad * 2)
-            y_coord = (coords[1] + 0.5 - y_center) * (height - ypad * 2)
-
-            green = int(_scale(i, 0, len(path), 255, 0))
-            blue = int(_scale(i, 0, len(path), 0, 255))
-            drawing.line(((prev_x_coord, prev_y_coord), (x_coord, y_coord)),
-                         fill=(0, green, blue, 255),
-                         width=line_thiccness)
-
-    # drawing.line(scaled_joints, fill=(0, 0, 255, 255), width=line_thiccness, joint='curve')
-
-    return img
+    return Image.fromarray(render_thumbnails(path, height, width, line_thiccness, xpad, ypad)[0], 'RGBA')
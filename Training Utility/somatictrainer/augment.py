@@ -0,0 +1,92 @@
+import logging
+
+import numpy as np
+
+from somatictrainer.gestures import standard_gesture_length, gesture_cone_angle
+from somatictrainer.util import standardize_raw_bearings, process_samples, process_samples_batch
+
+logger = logging.getLogger('augment')
+
+
+def distort_traces(traces, rng, max_rotation=np.radians(15), max_stretch=0.15, jitter=0.005):
+    """
+    Randomly rotate, stretch and jitter a batch of standardized traces, each one differently.
+    The whole batch is done at once, concatenated into one ragged array.
+
+    process_samples rescales gestures to fit and resamples them by arc length, so scaling both axes the same
+    wouldn't survive it - stretching happens per axis instead. Timing doesn't survive it at all, however uneven,
+    so there's no point warping it.
+
+    :param traces: Standardized traces from standardize_raw_bearings, each shaped (n, 2) with n > 1
+    :type traces: list of np.array
+    :type rng: np.random.Generator
+    :param max_rotation: Most radians to rotate each trace around its start point
+    :param max_stretch: Most each axis gets stretched or squashed, as a fraction of its size
+    :param jitter: Standard deviation of noise added to every point, as a fraction of the trace's size.
+    process_samples blows every gesture up to the same size, so noise has to be scaled down for small ones too.
+    :rtype: list of np.array
+    """
+
+    count = len(traces)
+    if not count:
+        return []
+
+    lengths = np.array([len(trace) for trace in traces])
+    samples = np.concatenate([np.asarray(trace, dtype=float)[:, :2] for trace in traces])
+    trace_ids = np.repeat(np.arange(count), lengths)
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+
+    # Stretch, then rotate, around each trace's start point
+    origins = samples[starts][trace_ids]
+    offsets = (samples - origins) * rng.uniform(1 - max_stretch, 1 + max_stretch, (count, 2))[trace_ids]
+
+    angles = rng.uniform(-max_rotation, max_rotation, count)[trace_ids]
+    cosines, sines = np.cos(angles), np.sin(angles)
+    samples = origins + np.stack((cosines * offsets[:, 0] - sines * offsets[:, 1],
+                                  sines * offsets[:, 0] + cosines * offsets[:, 1]), axis=1)
+
+    spans = (np.maximum.reduceat(samples, starts) - np.minimum.reduceat(samples, starts)).max(axis=1)
+    samples += rng.normal(0, jitter, samples.shape) * spans[trace_ids, np.newaxis]
+
+    return np.split(samples, starts[1:])
+
+
+def augment_raw_bearings(raw_bearings_list, fallback_bearings, rng, cone_angle=gesture_cone_angle, **distortions):
+    """
+    Make a fresh distorted copy of each gesture from its raw data, ready to train on.
+
+    :param raw_bearings_list: Raw (yaw, pitch, roll) readings for each gesture. Gestures with fewer than
+    two readings can't be distorted and get their fallback bearings instead.
+    :type raw_bearings_list: list of np.array
+    :param fallback_bearings: Each gesture's usual bearings, shaped (gestures, standard_gesture_length, 2)
+    :type fallback_bearings: np.array
+    :type rng: np.random.Generator
+    :type cone_angle: float
+    :param distortions: Passed along to distort_traces
+    :return: Bearings for every gesture, shaped (gestures, standard_gesture_length, 2)
+    :rtype: np.array
+    """
+
+    output = np.array(fallback_bearings, dtype=np.float32)
+
+    usable = [index for index, raw_bearings in enumerate(raw_bearings_list) if len(raw_bearings) > 1]
+    if not usable:
+        return output
+
+    traces = distort_traces([standardize_raw_bearings(raw_bearings_list[index], cone_angle) for index in usable],
+                            rng, **distortions)
+
+    try:
+        output[usable] = process_samples_batch(traces, standard_gesture_length)
+        return output
+    except (AttributeError, ValueError):
+        pass
+
+    # Somebody got distorted into a degenerate gesture - go one at a time, the rest can still be used
+    for index, trace in zip(usable, traces):
+        try:
+            output[index] = process_samples(trace, standard_gesture_length)
+        except (AttributeError, ValueError):
+            logger.debug('Couldn\'t augment gesture #{}, using it as-is'.format(index))
+
+    return output
@@ -0,0 +1,47 @@
+import argparse
+import logging
+import os
+import time
+
+from somatictrainer.gestures import GestureTrainingSet
+
+logger = logging.getLogger('convert')
+
+
+def _main():
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(
+        description='Convert a pickled training set to the memory-mappable columnar format, or back again')
+    parser.add_argument('input', help='Training set to convert - a pickled .db file or a columnar directory')
+    parser.add_argument('output', nargs='?',
+                        help='Where to save the result. Defaults to <input>_columnar, or <input>.db for columnar input')
+    args = parser.parse_args()
+
+    to_columnar = not GestureTrainingSet.is_columnar(args.input)
+
+    output_pathspec = args.output
+    if not output_pathspec:
+        stem = os.path.splitext(os.path.normpath(args.input))[0]
+        output_pathspec = stem + '_columnar' if to_columnar else stem + '.db'
+
+    if os.path.abspath(output_pathspec) == os.path.abspath(args.input):
+        parser.error('Refusing to overwrite the input')
+
+    benchmark = time.perf_counter()
+    training_set = GestureTrainingSet.load(args.input)
+    logger.info('Loaded {} gestures in {:.2f} sec'.format(len(training_set.examples),
+                                                          time.perf_counter() - benchmark))
+
+    benchmark = time.perf_counter()
+    if to_columnar:
+        training_set.save_columnar(output_pathspec)
+    else:
+        # Make sure the pickle holds plain lists, readable by older versions of the trainer
+        training_set.examples = [example.to_legacy() for example in training_set.examples]
+        training_set.save(output_pathspec)
+    logger.info('Saved {} in {:.2f} sec'.format(output_pathspec, time.perf_counter() - benchmark))
+
+
+if __name__ == "__main__":
+    _main()
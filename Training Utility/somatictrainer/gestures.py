@@ -6,28 +6,54 @@ import numpy as np
 import uuid
 import pickle
 import bisect
+import json
+import shutil
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
 
 standard_gesture_length = 50  # Length of (yaw, pitch) coordinates per gesture to be fed into ML algorithm
+gesture_cone_angle = 2 / 3 * np.pi  # 120 degrees - bearings are constrained to this cone around the start point
+
+# One raw sample as recorded by handle_sample - raw bearing, acceleration and microseconds since the last sample
+raw_sample_dtype = np.dtype([('b', '<f8', 3), ('a', '<f8', 3), ('t', '<f8')])
 
 _log_level = logging.DEBUG
 
 
+def raw_samples_from_dicts(samples):
+    """
+    Pack raw samples in the old {'b': bearing, 'a': acceleration, 't': microseconds} form into a structured array
+
+    :type samples: list of dict
+    :rtype: np.array
+    """
+    output = np.empty(len(samples), dtype=raw_sample_dtype)
+    if len(samples):
+        output['b'] = [sample['b'] for sample in samples]
+        output['a'] = [sample['a'] for sample in samples]
+        output['t'] = [sample['t'] for sample in samples]
+    return output
+
+
 class Gesture:
     logger = logging.getLogger(__name__)
     logger.setLevel(_log_level)
     
-    def __init__(self, glyph, bearings, raw_data, gesture_uuid=None):
+    def __init__(self, glyph, bearings, raw_data, gesture_uuid=None, raw_data_loader=None):
         """
 
         :param bearings: Standardized ordered list of (yaw/pitch) coordinates
         :type bearings: np.array
         :param raw_data: Raw data collected during training,
         in case we make a processing boo-boo and need to retroactively fix things
-        :type raw_data: list
+        :type raw_data: np.array of raw_sample_dtype, or list of {'b', 'a', 't'} dicts
         :param glyph: Which letter or opcode this gesture represents
         :type glyph: str
         :param gesture_uuid: A unique identifier used to tie the gesture to UI elements
         :type gesture_uuid: uuid.UUID
+        :param raw_data_loader: If raw_data is None, this gets called to fetch it whenever it's accessed
+        :type raw_data_loader: callable
         """
 
         if bearings.shape != (50, 2):
@@ -35,6 +61,7 @@ class Gesture:
                                  .format(len(bearings), standard_gesture_length))
         self.bearings = bearings
         self.raw_data = raw_data
+        self._raw_data_loader = raw_data_loader
         self.glyph = glyph
 
         if gesture_uuid is not None:
@@ -42,11 +69,73 @@ class Gesture:
         else:
             self.uuid = uuid.uuid4()
 
+    @property
+    def raw_data(self):
+        if self._raw_data is None and self._raw_data_loader is not None:
+            return self._raw_data_loader()
+        return self._raw_data
+
+    @raw_data.setter
+    def raw_data(self, raw_data):
+        # Lists of sample dicts (from old saves or JSON) are packed down - they're several times the size
+        if raw_data is not None and not isinstance(raw_data, np.ndarray):
+            raw_data = raw_samples_from_dicts(raw_data)
+
+        self._raw_data = raw_data
+        self._raw_data_loader = None
+
+    def __getstate__(self):
+        # Pickles always carry the raw data itself, under the attribute name older versions used
+        state = self.__dict__.copy()
+        del state['_raw_data'], state['_raw_data_loader']
+        state['raw_data'] = self.raw_data_as_dicts() if state.pop('_legacy', False) else self.raw_data
+        return state
+
+    def __setstate__(self, state):
+        state = state.copy()
+        raw_data = state.pop('raw_data', None)
+        self.__dict__.update(state)
+        self.raw_data = raw_data
+
+    def raw_bearings(self):
+        """
+        :return: The raw (yaw, pitch, roll) reading for every sample in raw_data
+        :rtype: np.array
+        """
+        return self.raw_data['b']
+
+    def raw_data_as_array(self):
+        """
+        :return: raw_data as a structured array of raw_sample_dtype
+        :rtype: np.array
+        """
+        return self.raw_data
+
+    def raw_data_as_dicts(self):
+        """
+        :return: raw_data as a list of {'b': bearing, 'a': acceleration, 't': microseconds} dicts
+        :rtype: list
+        """
+        raw_data = self.raw_data
+        return [{'b': bearing, 'a': acceleration, 't': microseconds}
+                for bearing, acceleration, microseconds
+                in zip(raw_data['b'].tolist(), raw_data['a'].tolist(), raw_data['t'].tolist())]
+
+    def to_legacy(self):
+        """
+        :return: A copy that pickles the way older versions of the trainer expect -
+        float64 bearings and raw data as a list of dicts
+        :rtype: Gesture
+        """
+        output = Gesture(self.glyph, np.array(self.bearings, dtype=float), self.raw_data_as_array(), self.uuid)
+        output._legacy = True
+        return output
+
     def to_dict(self):
         datastore = {
             'g': self.glyph,
             'b': self.bearings.tolist(),
-            'r': self.raw_data,
+            'r': self.raw_data_as_dicts(),
             'id': str(self.uuid)
         }
         return datastore
@@ -74,12 +163,85 @@ class Gesture:
         return None
 
 
+class _RawDataStore:
+    """
+    Reads gestures' raw data out of a columnar save's raw data file on demand,
+    keeping only the most recently used records in memory
+    """
+
+    def __init__(self, pathspec, raw_offsets, cache_size):
+        self.pathspec = pathspec
+        self.raw_offsets = raw_offsets
+        self.cache_size = cache_size
+
+        # Mapping the file doesn't read anything yet, but it keeps the records readable
+        # even after a newer save cleans the file up
+        self._raw_data = np.load(pathspec, mmap_mode='r')
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()  # Background compaction reads raw data too
+
+    def get(self, index):
+        with self._lock:
+            if index in self._cache:
+                self._cache.move_to_end(index)
+                return self._cache[index]
+
+            record = np.array(self._raw_data[self.raw_offsets[index]:self.raw_offsets[index + 1]])
+
+            self._cache[index] = record
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+            return record
+
+    def length(self, index):
+        return int(self.raw_offsets[index + 1] - self.raw_offsets[index])
+
+    def records(self, start, stop):
+        """
+        :return: Records start through stop - 1 back to back, straight off the memory map without caching them
+        :rtype: np.array
+        """
+        return self._raw_data[self.raw_offsets[start]:self.raw_offsets[stop]]
+
+
+class _RawDataRecord:
+    """
+    A lazy gesture's raw data loader. Saves use it to copy the record straight across without loading it.
+    """
+
+    def __init__(self, store, index):
+        self.store = store
+        self.index = index
+
+    def __call__(self):
+        return self.store.get(self.index)
+
+
 class GestureTrainingSet:
     examples: List[Gesture]
 
     big_ole_list_o_glyphs = '\x08\n !"#$\'+,-./0123456789?@ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
     short_glyphs = '., \x08l-/'
     current_version = 3  # For deleting old saves
+    columnar_version = 2
+
+    # Files making up a columnar save, which is a directory. Every array can be opened with np.load(mmap_mode='r').
+    # Raw data is ragged - gesture i's samples are raw_data[raw_offsets[i]:raw_offsets[i + 1]].
+    # Each save writes a new generation of these, named like bearings.3.npy, and metadata points at the current one.
+    # That way nothing another gesture still has memory-mapped ever gets overwritten. Version 1 saves had no
+    # generations, and used these names as they are.
+    columnar_files = {'bearings': 'bearings.npy',  # float32, (gestures, standard_gesture_length, 2)
+                      'glyphs': 'glyphs.npy',  # Fixed-width unicode, (gestures,)
+                      'uuids': 'uuids.npy',  # uint8 UUID bytes, (gestures, 16)
+                      'raw_data': 'raw_data.npy',  # raw_sample_dtype, (total samples,)
+                      'raw_offsets': 'raw_offsets.npy'}  # int64, (gestures + 1,)
+    columnar_metadata_file = 'metadata.json'
+
+    # Changes since the last full save get appended here, next to the save itself.
+    # While a compaction is folding the journal into a full save, its entries are set aside in the second file.
+    journal_suffix = '.journal'
+    compacting_journal_suffix = '.journal.compacting'
 
     logger = logging.getLogger(__name__)
     logger.setLevel(_log_level)
@@ -90,43 +252,555 @@ class GestureTrainingSet:
         self.glyphs_represented = []
         # self.unidentified_examples = []
 
+        # Indexes of self.examples - UUID -> position in the list, and glyph -> {UUID: example},
+        # the latter in the order the examples got that glyph
+        self._positions = {}
+        self._examples_by_glyph = {}
+
+        # Row i mirrors self.examples[i] - its bearings, and its glyph encoded per get_character_map('encoding').
+        # These grow geometrically, and to_training_set hands out views of them.
+        self._bearings_buffer = np.empty((0, standard_gesture_length, 2), dtype=np.float32)
+        self._labels_buffer = np.empty(0, dtype=np.int64)
+        self._version = 0  # Bumped on every change, so exports know when they're stale
+        self._export_cache = None
+
+        self._pending_changes = []  # ('add', gesture), ('remove', uuid) or ('move', uuid, glyph) - not journaled yet
+        self._compaction_thread = None
+
     @staticmethod
-    def load(pathspec):
-        with open(pathspec, 'rb') as f:
-            output = GestureTrainingSet()
+    def load(pathspec, lazy_raw_data=False):
+        """
+        :param lazy_raw_data: Leave raw data on disk until it's used - see load_columnar.
+        Pickled saves can't do this; they get loaded whole.
+        """
+        if GestureTrainingSet.is_columnar(pathspec):
+            output = GestureTrainingSet.load_columnar(pathspec, lazy_raw_data=lazy_raw_data)
+        else:
+            if lazy_raw_data:
+                GestureTrainingSet.logger.info("Can't lazily load raw data from a pickled save - "
+                                               "convert it with somatictrainer.convert to do that")
 
-            output.examples = pickle.load(f)
-            output.glyphs_represented = np.unique([x.glyph for x in output.examples])
+            with open(pathspec, 'rb') as f:
+                output = GestureTrainingSet()
 
-            GestureTrainingSet.logger.debug('GestureTrainingSet class: Loaded {}'.format(output))
+                output.examples = pickle.load(f)
+                output._rebuild_index()
 
-            return output
+        for suffix in (GestureTrainingSet.compacting_journal_suffix, GestureTrainingSet.journal_suffix):
+            output._replay_journal(pathspec + suffix)
+
+        GestureTrainingSet.logger.debug('GestureTrainingSet class: Loaded {}'.format(output))
+
+        return output
 
     def save(self, pathspec):
+        """
+        Write out the whole training set, folding in and deleting any journal
+        """
+        self.wait_for_compaction()
+
+        self._save_examples(pathspec, self._examples_in_glyph_order())
+        self._pending_changes.clear()
+
+        for suffix in (self.journal_suffix, self.compacting_journal_suffix):
+            if os.path.exists(pathspec + suffix):
+                os.remove(pathspec + suffix)
+
+    def save_incremental(self, pathspec):
+        """
+        Append changes since the last save to the journal, so saving costs the same no matter how big the set is.
+        Falls back to a full save if there's nothing to append to yet.
+        """
+        if not os.path.exists(pathspec) or (os.path.isfile(pathspec) and not os.path.getsize(pathspec)):
+            self.save(pathspec)
+            return
+
+        if not self._pending_changes:
+            return
+
+        t = time.perf_counter()
+
+        with open(pathspec + self.journal_suffix, 'ab') as f:
+            for change in self._pending_changes:
+                pickle.dump(change, f)
+            f.flush()
+            os.fsync(f.fileno())
+
+        GestureTrainingSet.logger.debug('Journaling {} changes took {}'.format(
+            len(self._pending_changes), time.perf_counter() - t))
+
+        self._pending_changes.clear()
+
+    def compact(self, pathspec, background=True):
+        """
+        Fold the journal into a full save. In the background, the set can keep changing meanwhile -
+        those changes go into a fresh journal, replayed on top of the compacted save.
+
+        :return: Finishes once the save is on disk, with the version of the set that got saved,
+        or with whatever went wrong. Not in the background, it's already finished and errors get raised right away.
+        :rtype: concurrent.futures.Future
+        """
+        self.wait_for_compaction()
+        self.save_incremental(pathspec)
+
+        journal_pathspec = pathspec + self.journal_suffix
+        compacting_pathspec = pathspec + self.compacting_journal_suffix
+
+        if os.path.exists(journal_pathspec):
+            if os.path.exists(compacting_pathspec):
+                # A previous compaction died halfway - its entries still need to go first
+                with open(compacting_pathspec, 'ab') as compacting, open(journal_pathspec, 'rb') as journal:
+                    shutil.copyfileobj(journal, compacting)
+                os.remove(journal_pathspec)
+            else:
+                os.replace(journal_pathspec, compacting_pathspec)
+
+        snapshot = self._examples_in_glyph_order()
+        version = self._version
+        future = Future()
+
+        def write_snapshot():
+            try:
+                self._save_examples(pathspec, snapshot)
+                if os.path.exists(compacting_pathspec):
+                    os.remove(compacting_pathspec)
+            except Exception as e:
+                GestureTrainingSet.logger.exception('Compacting {} failed'.format(pathspec))
+                future.set_exception(e)
+                return
+
+            GestureTrainingSet.logger.debug('Compacted {}'.format(pathspec))
+            future.set_result(version)
+
+        future.set_running_or_notify_cancel()
+        if background:
+            self._compaction_thread = threading.Thread(target=write_snapshot, name='Compaction')
+            self._compaction_thread.start()
+        else:
+            write_snapshot()
+            future.result()
+
+        return future
+
+    def wait_for_compaction(self):
+        if self._compaction_thread is not None:
+            self._compaction_thread.join()
+            self._compaction_thread = None
+
+    @property
+    def version(self):
+        # Goes up with every change, so whoever saved can tell whether anything's changed since
+        return self._version
+
+    def _save_examples(self, pathspec, examples):
+        if GestureTrainingSet.is_columnar(pathspec):
+            self.save_columnar(pathspec, examples)
+            return
+
         t = time.perf_counter()
         GestureTrainingSet.logger.debug('Generating save dict took {}'.format(time.perf_counter() - t))
 
         t = time.perf_counter()
         # Save unidentified samples here?
         with open(pathspec + '.tmp', 'wb') as f:
-            pickle.dump(self.examples, f)
+            pickle.dump(examples, f)
 
         GestureTrainingSet.logger.debug('Saving took {}'.format(time.perf_counter() - t))
 
-        if os.path.exists(pathspec):
-            os.remove(pathspec)
-        os.rename(pathspec + '.tmp', pathspec)
+        os.replace(pathspec + '.tmp', pathspec)
+
+    def _replay_journal(self, journal_pathspec):
+        if not os.path.exists(journal_pathspec):
+            return
+
+        replayed = 0
+        good_offset = 0  # Where the last change that loaded fine ends
+
+        with open(journal_pathspec, 'rb') as f:
+            while True:
+                try:
+                    change = pickle.load(f)
+                except Exception:
+                    # Either the end of the journal, or the tail end of a write that got cut short.
+                    # Garbage can fail to unpickle in just about any way, so don't be picky about how.
+                    break
+
+                self._apply_change(change)
+                replayed += 1
+                good_offset = f.tell()
+
+        if os.path.getsize(journal_pathspec) > good_offset:
+            GestureTrainingSet.logger.warning('Journal {} is corrupt after {} changes, ignoring the rest'
+                                              .format(journal_pathspec, replayed))
+
+            # Chop the garbage off, or everything journaled after it would be stuck behind it and never replayed
+            with open(journal_pathspec, 'r+b') as f:
+                f.truncate(good_offset)
+
+        self._pending_changes.clear()
+
+        GestureTrainingSet.logger.debug('Replayed {} changes from {}'.format(replayed, journal_pathspec))
+
+    def _apply_change(self, change):
+        # Replaying a change that's already in the save must be harmless - see compact()
+        if change[0] == 'add':
+            if self.get(change[1].uuid) is None:
+                self.add(change[1])
+        elif change[0] == 'remove':
+            self.remove(change[1])
+        elif change[0] == 'move':
+            example = self.get(change[1])
+            if example is not None and example.glyph != change[2]:
+                self.move(example, change[2])
+        else:
+            GestureTrainingSet.logger.warning('Unrecognized journal entry {}'.format(change[0]))
+
+    @staticmethod
+    def is_columnar(pathspec):
+        return os.path.isfile(os.path.join(pathspec, GestureTrainingSet.columnar_metadata_file))
+
+    @staticmethod
+    def load_columnar(pathspec, mmap_mode='r', lazy_raw_data=False, raw_data_cache_size=256):
+        """
+        Load a training set saved by save_columnar. Gestures' bearings and raw data are views into the
+        memory-mapped arrays, so nothing is read off disk until it's used.
+
+        :param mmap_mode: Passed to np.load. Use None to read everything into memory.
+        :param lazy_raw_data: Don't read any raw data until some gesture's raw_data is accessed.
+        Records get read in as they're needed, and only the most recently used ones are kept in memory.
+        :param raw_data_cache_size: How many gestures' raw data to keep in memory when lazy
+        :rtype: GestureTrainingSet
+        """
+        column_pathspecs = GestureTrainingSet._columnar_pathspecs(
+            pathspec, GestureTrainingSet._read_columnar_metadata(pathspec))
+
+        # np.asarray drops the memmap subclass, so views don't drag it into pickles
+        columns = {name: np.asarray(np.load(column_pathspec, mmap_mode=mmap_mode))
+                   for name, column_pathspec in column_pathspecs.items()
+                   if not (lazy_raw_data and name == 'raw_data')}
+
+        raw_offsets = np.array(columns['raw_offsets'])
+        output = GestureTrainingSet()
+
+        if lazy_raw_data:
+            raw_data_store = _RawDataStore(column_pathspecs['raw_data'], raw_offsets, raw_data_cache_size)
+
+        for i, (glyph, bearings, uuid_bytes) in enumerate(zip(columns['glyphs'].tolist(),
+                                                              columns['bearings'],
+                                                              columns['uuids'])):
+            gesture_uuid = uuid.UUID(bytes=uuid_bytes.tobytes())
+            if lazy_raw_data:
+                output.examples.append(Gesture(glyph, bearings, None, gesture_uuid,
+                                               raw_data_loader=_RawDataRecord(raw_data_store, i)))
+            else:
+                raw_data = columns['raw_data'][raw_offsets[i]:raw_offsets[i + 1]]
+                output.examples.append(Gesture(glyph, bearings, raw_data, gesture_uuid))
+
+        output._rebuild_index()
+
+        GestureTrainingSet.logger.debug('GestureTrainingSet class: Loaded {} columnar gestures from {}'.format(
+            len(output.examples), pathspec))
+
+        return output
+
+    @staticmethod
+    def _read_columnar_metadata(pathspec):
+        with open(os.path.join(pathspec, GestureTrainingSet.columnar_metadata_file), 'r') as f:
+            metadata = json.load(f)
+
+        if metadata.get('version') not in (1, GestureTrainingSet.columnar_version):
+            raise AttributeError('Columnar training set version {} is unsupported'.format(metadata.get('version')))
+
+        return metadata
+
+    @staticmethod
+    def _columnar_pathspecs(pathspec, metadata):
+        """
+        :return: Where each of columnar_files lives, for the generation metadata points at
+        :rtype: dict
+        """
+        generation = metadata.get('generation')
+        if generation is None:
+            return {name: os.path.join(pathspec, filename)
+                    for name, filename in GestureTrainingSet.columnar_files.items()}
+
+        return {name: os.path.join(pathspec, '{}.{}.npy'.format(os.path.splitext(filename)[0], generation))
+                for name, filename in GestureTrainingSet.columnar_files.items()}
+
+    @staticmethod
+    def load_training_columns(pathspec, with_raw_bearings=False):
+        """
+        Just what training needs, without building a single Gesture. A columnar save with nothing in its journal
+        gets memory-mapped straight off disk, so it can be bigger than RAM.
+        Anything else gets loaded the usual way and exported with to_training_set.
+
+        :param with_raw_bearings: Also return every example's raw (yaw, pitch, roll) readings
+        :return: Bearings as float32 (examples, standard_gesture_length, 2), labels encoded per
+        get_character_map('encoding'), and the glyph for each label. With raw bearings, also every example's
+        readings back to back, and offsets into them - example i's are raw_bearings[raw_offsets[i]:raw_offsets[i + 1]].
+        :rtype: tuple
+        """
+        journaled = any(os.path.exists(pathspec + suffix) for suffix in (GestureTrainingSet.compacting_journal_suffix,
+                                                                        GestureTrainingSet.journal_suffix))
+
+        if GestureTrainingSet.is_columnar(pathspec) and not journaled:
+            column_pathspecs = GestureTrainingSet._columnar_pathspecs(
+                pathspec, GestureTrainingSet._read_columnar_metadata(pathspec))
+
+            def column(name, mmap_mode='r'):
+                return np.asarray(np.load(column_pathspecs[name], mmap_mode=mmap_mode))
+
+            # Sorted, same as glyphs_represented
+            glyphs, labels = np.unique(column('glyphs', None), return_inverse=True)
+            output = (column('bearings'), labels.astype(np.int64), glyphs.tolist())
+
+            if with_raw_bearings:
+                output += (column('raw_data')['b'], column('raw_offsets', None))
+
+            return output
+
+        training_set = GestureTrainingSet.load(pathspec, lazy_raw_data=True)
+        bearings, labels = training_set.to_training_set()
+        output = (bearings, labels, list(training_set.glyphs_represented))
+
+        if with_raw_bearings:
+            raw_bearings = [example.raw_bearings() for example in training_set.examples]
+            raw_offsets = np.zeros(len(raw_bearings) + 1, dtype=np.int64)
+            np.cumsum([len(readings) for readings in raw_bearings], out=raw_offsets[1:])
+            output += (np.concatenate(raw_bearings) if raw_bearings else np.empty((0, 3)), raw_offsets)
+
+        return output
+
+    def save_columnar(self, pathspec, examples=None):
+        """
+        Save as a directory of flat numpy arrays (see columnar_files) that load_columnar can memory-map.
+        The examples themselves are left alone, so this is safe to run in the background.
+
+        :param examples: What to save, if not the whole set
+        """
+        t = time.perf_counter()
+
+        if examples is None:
+            examples = self._examples_in_glyph_order()
+
+        # Lazy gestures' raw data hasn't been read, and doesn't need to be - their records get copied over as-is
+        records = [example._raw_data_loader if example._raw_data is None
+                   and isinstance(example._raw_data_loader, _RawDataRecord) else None for example in examples]
+
+        raw_offsets = np.zeros(len(examples) + 1, dtype=np.int64)
+        np.cumsum([record.store.length(record.index) if record is not None else len(example.raw_data_as_array())
+                   for example, record in zip(examples, records)], out=raw_offsets[1:])
+
+        columns = {
+            'bearings': np.array([example.bearings for example in examples], dtype=np.float32).reshape(
+                (len(examples), standard_gesture_length, 2)),
+            'glyphs': np.array([example.glyph for example in examples], dtype=str),
+            'uuids': np.frombuffer(b''.join(example.uuid.bytes for example in examples),
+                                   dtype=np.uint8).reshape((len(examples), 16)),
+            'raw_offsets': raw_offsets
+        }
+
+        if self.is_columnar(pathspec):
+            # Add a generation next to the current one. Gestures loaded from older generations can keep using them.
+            directory = pathspec
+            generation = self._read_columnar_metadata(pathspec).get('generation', 0) + 1
+        else:
+            # Build it next door, then swap it in, so a crash doesn't leave a half-written save
+            directory = pathspec + '.tmp'
+            generation = 1
+            if os.path.exists(directory):
+                shutil.rmtree(directory)
+            os.makedirs(directory)
+
+        metadata = {'version': self.columnar_version, 'count': len(examples), 'generation': generation}
+        column_pathspecs = self._columnar_pathspecs(directory, metadata)
+
+        for name, column_pathspec in column_pathspecs.items():
+            if name == 'raw_data':
+                self._save_raw_data(column_pathspec, examples, records, raw_offsets)
+            else:
+                np.save(column_pathspec, columns[name])
+
+        # The new generation doesn't count until the metadata points at it
+        metadata_pathspec = os.path.join(directory, self.columnar_metadata_file)
+        with open(metadata_pathspec + '.tmp', 'w') as f:
+            json.dump(metadata, f)
+        os.replace(metadata_pathspec + '.tmp', metadata_pathspec)
+
+        if directory == pathspec:
+            self._remove_stale_columns(pathspec, column_pathspecs.values())
+        else:
+            if os.path.isdir(pathspec):
+                shutil.rmtree(pathspec)
+            elif os.path.exists(pathspec):
+                os.remove(pathspec)
+            os.rename(directory, pathspec)
+
+        GestureTrainingSet.logger.debug('Columnar save took {}'.format(time.perf_counter() - t))
+
+    @staticmethod
+    def _save_raw_data(pathspec, examples, records, raw_offsets):
+        # Streamed into the file, so the whole set's raw data is never in memory at once
+        output = np.lib.format.open_memmap(pathspec, mode='w+', dtype=raw_sample_dtype, shape=(int(raw_offsets[-1]),))
+
+        # Unchanged gestures usually sit in the same order they were loaded in, so their records get copied
+        # over in runs rather than one by one
+        run = None  # [store, first index, last index + 1, first gesture]
+
+        def copy_run():
+            store, start, stop, first = run
+            output[raw_offsets[first]:raw_offsets[first + stop - start]] = store.records(start, stop)
+
+        for i, (example, record) in enumerate(zip(examples, records)):
+            if run is not None and record is not None and record.store is run[0] and record.index == run[2]:
+                run[2] += 1
+                continue
+
+            if run is not None:
+                copy_run()
+                run = None
+
+            if record is not None:
+                run = [record.store, record.index, record.index + 1, i]
+            else:
+                output[raw_offsets[i]:raw_offsets[i + 1]] = example.raw_data_as_array()
+
+        if run is not None:
+            copy_run()
+
+        output.flush()
+        del output  # Windows won't swap the directory in while it's still mapped
+
+    @staticmethod
+    def _remove_stale_columns(pathspec, keepers):
+        keepers = {os.path.normcase(os.path.abspath(keeper)) for keeper in keepers}
+
+        for filename in os.listdir(pathspec):
+            stale_pathspec = os.path.join(pathspec, filename)
+            if not filename.endswith('.npy') or os.path.normcase(os.path.abspath(stale_pathspec)) in keepers:
+                continue
+
+            try:
+                os.remove(stale_pathspec)
+            except OSError:
+                # Windows won't delete files somebody still has memory-mapped. Next save can try again.
+                GestureTrainingSet.logger.debug('Couldn\'t remove {} yet'.format(stale_pathspec))
+
+    def _rebuild_index(self):
+        unique_examples = []
+        self._positions = {}
+
+        for example in self.examples:
+            if example.uuid in self._positions:
+                GestureTrainingSet.logger.warning('Dropping duplicate of gesture {}'.format(example.uuid))
+                continue
+            self._positions[example.uuid] = len(unique_examples)
+            unique_examples.append(example)
+
+        self.examples = unique_examples
+
+        self._examples_by_glyph = {}
+        for example in self.examples:
+            self._examples_by_glyph.setdefault(example.glyph, {})[example.uuid] = example
+
+        self.glyphs_represented = sorted(self._examples_by_glyph)
+
+        self._rebuild_buffers()
+
+    def _rebuild_buffers(self):
+        capacity = 16
+        while capacity < len(self.examples):
+            capacity *= 2
+
+        char_map = self.get_character_map(type='encoding')
+
+        self._bearings_buffer = np.empty((capacity, standard_gesture_length, 2), dtype=np.float32)
+        self._labels_buffer = np.empty(capacity, dtype=np.int64)
+
+        for position, example in enumerate(self.examples):
+            self._bearings_buffer[position] = example.bearings
+            self._labels_buffer[position] = char_map[example.glyph]
+
+        self._version += 1
+
+    def _index(self, example):
+        if example.glyph in self._examples_by_glyph:
+            self._examples_by_glyph[example.glyph][example.uuid] = example
+        else:
+            self._examples_by_glyph[example.glyph] = {example.uuid: example}
+            bisect.insort(self.glyphs_represented, example.glyph)
+
+            # Every glyph sorting after this one just got bumped up a label
+            labels = self._labels_buffer[:len(self.examples)]
+            labels[labels >= self.glyphs_represented.index(example.glyph)] += 1
+
+        position = self._positions[example.uuid]
+        self._labels_buffer[position] = self.glyphs_represented.index(example.glyph)
+        self._version += 1
+
+    def _unindex(self, example):
+        examples_for_glyph = self._examples_by_glyph[example.glyph]
+        del examples_for_glyph[example.uuid]
+
+        if not examples_for_glyph:
+            del self._examples_by_glyph[example.glyph]
+
+            labels = self._labels_buffer[:len(self.examples)]
+            labels[labels > self.glyphs_represented.index(example.glyph)] -= 1
+
+            self.glyphs_represented.remove(example.glyph)
+
+        self._version += 1
+
+    def _swap_remove(self, example):
+        # Fill the hole with the last example, so nothing else has to shift down
+        position = self._positions.pop(example.uuid)
+        last_example = self.examples.pop()
+        if position < len(self.examples):
+            self.examples[position] = last_example
+            self._positions[last_example.uuid] = position
+            self._bearings_buffer[position] = self._bearings_buffer[len(self.examples)]
+            self._labels_buffer[position] = self._labels_buffer[len(self.examples)]
 
     def add(self, example: Gesture):
+        if example.uuid in self._positions:
+            raise AttributeError('Already have a gesture with UUID {}'.format(example.uuid))
+
+        position = len(self.examples)
+        if position == len(self._bearings_buffer):
+            capacity = max(16, position * 2)
+            self._bearings_buffer = np.resize(self._bearings_buffer, (capacity, standard_gesture_length, 2))
+            self._labels_buffer = np.resize(self._labels_buffer, capacity)
+
+        self._positions[example.uuid] = position
         self.examples.append(example)
-        if example.glyph not in self.glyphs_represented:
-            bisect.insort(self.glyphs_represented, example.glyph)
+        self._bearings_buffer[position] = example.bearings
+        self._index(example)
+        self._pending_changes.append(('add', example))
+
+    def get(self, gesture_uuid):
+        """
+        :type gesture_uuid: uuid.UUID
+        :return: The example with this UUID, or None
+        :rtype: Gesture
+        """
+        position = self._positions.get(gesture_uuid)
+        return self.examples[position] if position is not None else None
 
     def get_examples_for(self, glyph):
-        return [example for example in self.examples if example.glyph == glyph]
+        """
+        :return: Examples of this glyph, in the order they got it. Saves keep that order, so it survives reloading.
+        :rtype: list of Gesture
+        """
+        return list(self._examples_by_glyph.get(glyph, {}).values())
+
+    def _examples_in_glyph_order(self):
+        # Removing swaps examples around in self.examples, so saves go by glyph instead.
+        # Loading a save rebuilds the glyph index in the order it's saved in, which keeps get_examples_for's order.
+        return [example for glyph in self.glyphs_represented for example in self._examples_by_glyph[glyph].values()]
 
     def count(self, glyph):
-        return len(self.get_examples_for(glyph))
+        return len(self._examples_by_glyph.get(glyph, ()))
 
     def summarize(self):
         return {glyph: self.count(glyph) for glyph in self.big_ole_list_o_glyphs}
@@ -134,28 +808,57 @@ class GestureTrainingSet:
     def remove(self, example_or_uuid):
         if type(example_or_uuid) is Gesture:
             example = example_or_uuid
-            if example in self.examples:
-                self.examples.remove(example)
-                if not self.count(example.glyph):
-                    self.glyphs_represented.remove(example.glyph)
-
+            if self.get(example.uuid) is not example:
+                return
         elif type(example_or_uuid) is uuid.UUID:
-            gesture_uuid = example_or_uuid
-            for example in self.examples:
-                if gesture_uuid == example.uuid:
-                    self.examples.remove(example)
-                    if not self.count(example.glyph):
-                        self.glyphs_represented.remove(example.glyph)
-                    break
+            example = self.get(example_or_uuid)
+            if example is None:
+                return
+        else:
+            return
+
+        self._swap_remove(example)
+        self._unindex(example)
+        self._pending_changes.append(('remove', example.uuid))
+
+    def remove_many(self, uuids):
+        """
+        Remove a bunch of examples at once - one pass over the set, no matter how many go
+
+        :type uuids: iterable of uuid.UUID
+        :return: How many examples were removed
+        :rtype: int
+        """
+        doomed = {gesture_uuid for gesture_uuid in uuids if gesture_uuid in self._positions}
+        if not doomed:
+            return 0
+
+        for gesture_uuid in doomed:
+            self._unindex(self.examples[self._positions[gesture_uuid]])
+            self._pending_changes.append(('remove', gesture_uuid))
+
+        keepers = np.array([example.uuid not in doomed for example in self.examples], dtype=bool)
+        kept_count = np.count_nonzero(keepers)
+
+        self._bearings_buffer[:kept_count] = self._bearings_buffer[:len(self.examples)][keepers]
+        self._labels_buffer[:kept_count] = self._labels_buffer[:len(self.examples)][keepers]
+
+        self.examples = [example for example in self.examples if example.uuid not in doomed]
+        self._positions = {example.uuid: position for position, example in enumerate(self.examples)}
+        self._version += 1
+
+        return len(doomed)
 
     def move(self, example, new_glyph):
-        if example in self.examples:
+        if self.get(example.uuid) is example:
+            self._unindex(example)
             example.glyph = new_glyph
+            self._index(example)
+            self._pending_changes.append(('move', example.uuid, new_glyph))
 
     def remove_at(self, glyph, index):
-        count = self.count(glyph)
-        if index < count:
-            self.examples.remove(self.get_examples_for(glyph)[index])
+        if index < self.count(glyph):
+            self.remove(self.get_examples_for(glyph)[index])
 
     def get_character_map(self, type='decoding'):
         if type is 'decoding':
@@ -166,14 +869,20 @@ class GestureTrainingSet:
             raise AttributeError('Char map type must be "encoding" or "decoding"')
 
     def to_training_set(self):
-        char_map = self.get_character_map(type='encoding')
-
-        data = []
-        labels = []
+        """
+        :return: Bearings for every example as float32 (examples, standard_gesture_length, 2),
+        and labels encoded per get_character_map('encoding').
+        These are read-only views of the set's own buffers, not copies - they're only valid until the set changes,
+        so copy them if they need to stick around.
+        :rtype: (np.array, np.array)
+        """
+        if self._export_cache is None or self._export_cache[0] != self._version:
+            data = self._bearings_buffer[:len(self.examples)]
+            labels = self._labels_buffer[:len(self.examples)]
+            data.flags.writeable = False
+            labels.flags.writeable = False
 
-        for example in self.examples:
-            data.append(example.bearings)
-            labels.append(char_map[example.glyph])
+            self._export_cache = (self._version, data, labels)
 
-        return np.array(data), np.array(labels)
+        return self._export_cache[1], self._export_cache[2]
 
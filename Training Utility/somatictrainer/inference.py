@@ -0,0 +1,265 @@
+import logging
+import threading
+from abc import ABC, abstractmethod
+import time
+import os
+from queue import Queue, Empty
+
+import numpy as np
+
+# TensorFlow takes seconds to import, so nothing in here imports it until somebody actually loads a model.
+# Recording-only sessions never pay for it.
+
+
+def _tflite_interpreter(**kwargs):
+    try:
+        # The standalone interpreter is a fraction of TensorFlow's size, use it if it's around
+        from tflite_runtime.interpreter import Interpreter
+    except ImportError:
+        import tensorflow as tf
+        Interpreter = tf.lite.Interpreter
+
+    return Interpreter(**kwargs)
+
+
+class Recognizer(ABC):
+    """
+    Something that scores gestures against every glyph. Subclasses just implement __call__.
+    """
+
+    def __init__(self, glyphs):
+        """
+        :param glyphs: The glyph for each of the model's outputs, in order - GestureTrainingSet.glyphs_represented
+        of the set it was trained on
+        :type glyphs: list of str
+        """
+        self.glyphs = list(glyphs)
+
+    @abstractmethod
+    def __call__(self, bearings):
+        """
+        :param bearings: Standardized bearings, shaped (gestures, standard_gesture_length, 2)
+        :type bearings: np.array
+        :return: Every glyph's score for every gesture, shaped (gestures, glyphs)
+        :rtype: np.array
+        """
+
+    def recognize(self, bearings):
+        """
+        :param bearings: Standardized bearings, shaped (gestures, standard_gesture_length, 2)
+        :type bearings: np.array
+        :return: The winning glyph and its confidence for each gesture. Outputs the glyph list doesn't cover
+        come back as ('', 0).
+        :rtype: list of (str, float)
+        """
+        scores = self(bearings)
+        winners = np.argmax(scores, axis=1)
+
+        return [(self.glyphs[winner], float(score[winner])) if winner < len(self.glyphs) else ('', 0)
+                for winner, score in zip(winners, scores)]
+
+
+class KerasRecognizer(Recognizer):
+    """
+    Runs a Keras model on whole batches of gestures. Calls go through a tf.function with a fixed input signature,
+    so they skip most of predict()'s per-call overhead and never retrace, whatever the batch size.
+    """
+
+    def __init__(self, model, glyphs):
+        """
+        :type model: keras.Model
+        :type glyphs: list of str
+        """
+        import tensorflow as tf
+
+        Recognizer.__init__(self, glyphs)
+
+        self.model = model
+        self.input_shape = tuple(model.input_shape[1:])
+
+        self._predict = tf.function(lambda bearings: model(bearings, training=False),
+                                    input_signature=[tf.TensorSpec((None,) + self.input_shape, tf.float32)])
+
+    def __call__(self, bearings):
+        return self._predict(np.asarray(bearings, dtype=np.float32).reshape((-1,) + self.input_shape)).numpy()
+
+
+class TFLiteRecognizer(Recognizer):
+    """
+    Runs the same .tflite flatbuffer that make_model builds for the glove, so results match the glove's exactly.
+    Gestures go through one at a time, same as on the glove - the interpreter's tensors get allocated once
+    and reused for every call.
+    """
+
+    def __init__(self, model_pathspec, glyphs, num_threads=1):
+        """
+        :param model_pathspec: A .tflite file from make_model
+        :type model_pathspec: str
+        :type glyphs: list of str
+        :type num_threads: int
+        """
+        Recognizer.__init__(self, glyphs)
+
+        self.interpreter = _tflite_interpreter(model_path=model_pathspec, num_threads=num_threads)
+        self.interpreter.allocate_tensors()
+
+        input_details = self.interpreter.get_input_details()[0]
+        output_details = self.interpreter.get_output_details()[0]
+
+        self.input_shape = tuple(input_details['shape'][1:])
+        self._output_size = int(np.prod(output_details['shape'][1:]))
+        self._input_dtype = input_details['dtype']
+        self._input_quantization = input_details['quantization']
+        self._output_quantization = output_details['quantization']
+
+        # These hand back views of the interpreter's own buffers - call them fresh every time,
+        # since invoke() refuses to run while anybody's holding onto a view
+        self._input = self.interpreter.tensor(input_details['index'])
+        self._output = self.interpreter.tensor(output_details['index'])
+
+    def __call__(self, bearings):
+        bearings = np.asarray(bearings, dtype=np.float32).reshape((-1,) + self.input_shape)
+
+        scale, zero_point = self._input_quantization
+        if scale:
+            limits = np.iinfo(self._input_dtype)
+            bearings = np.clip(np.round(bearings / scale + zero_point), limits.min, limits.max)
+
+        scores = np.empty((len(bearings), self._output_size), dtype=np.float32)
+        for index, gesture in enumerate(bearings):
+            self._input()[0] = gesture
+            self.interpreter.invoke()
+            scores[index] = self._output()[0].reshape(-1)
+
+        scale, zero_point = self._output_quantization
+        if scale:
+            scores = (scores - zero_point) * scale
+
+        return scores
+
+
+def load_recognizer(model_pathspec, glyphs):
+    """
+    :param model_pathspec: A .tflite flatbuffer, or anything Keras can load
+    :type model_pathspec: str
+    :param glyphs: The glyph for each of the model's outputs, in order
+    :type glyphs: list of str
+    :rtype: Recognizer
+    """
+    if os.path.splitext(model_pathspec)[1].lower() == '.tflite':
+        return TFLiteRecognizer(model_pathspec, glyphs)
+
+    import tensorflow as tf
+    return KerasRecognizer(tf.keras.models.load_model(model_pathspec), glyphs)
+
+
+class InferenceWorker(threading.Thread):
+    """
+    Owns the recognizer and runs it in the background, so recognizing a gesture never holds up the GUI.
+    Gestures go in through submit(), and results come back on a queue as {'type': 'inference'} messages.
+
+    Requests that arrive within batch_window of each other get recognized together in one call,
+    so a burst of gestures - a replayed session, or several gloves at once - costs one call instead of one apiece.
+    """
+
+    logger = logging.getLogger('InferenceWorker')
+
+    def __init__(self, queue, recognizer=None, batch_window=0.005, max_batch_size=64):
+        """
+        :param queue: Where to post results, unless a request says otherwise
+        :type queue: queue.Queue
+        :type recognizer: Recognizer
+        :param batch_window: Seconds to wait for more requests after the first one comes in
+        :type batch_window: float
+        :type max_batch_size: int
+        """
+        threading.Thread.__init__(self, name='InferenceWorker', daemon=True)
+
+        self.queue = queue
+        self.requests = Queue()
+        self.batch_window = batch_window
+        self.max_batch_size = max_batch_size
+
+        self._recognizer = recognizer
+        self._stopping = threading.Event()
+
+    @property
+    def has_model(self):
+        return self._recognizer is not None
+
+    def set_recognizer(self, recognizer):
+        """
+        :type recognizer: Recognizer
+        """
+        self._recognizer = recognizer
+
+    def set_model(self, model, glyphs):
+        """
+        :type model: keras.Model
+        :param glyphs: The glyph for each of the model's outputs, in order
+        :type glyphs: list of str
+        """
+        self.set_recognizer(KerasRecognizer(model, glyphs))
+
+    def submit(self, bearings, reply_to=None, **context):
+        """
+        Queue up a gesture for recognition. Anything in context comes back untouched along with the result,
+        so whoever's listening knows what the result was for.
+
+        :param bearings: Standardized bearings, shaped (standard_gesture_length, 2)
+        :type bearings: np.array
+        :param reply_to: Where to post the result, if not the worker's own queue
+        :type reply_to: queue.Queue
+        """
+        self.requests.put((bearings, reply_to, context))
+
+    def stop(self, timeout=1):
+        self._stopping.set()
+        self.requests.put(None)
+        if threading.current_thread() is not self and self.is_alive():
+            self.join(timeout=timeout)
+
+    def run(self):
+        while not self._stopping.is_set():
+            request = self.requests.get()
+            if request is None:
+                break
+
+            batch = [request] + self._collect_batch()
+
+            recognizer = self._recognizer
+            if recognizer is None:
+                continue
+
+            try:
+                benchmark = time.perf_counter()
+                results = recognizer.recognize(np.stack([bearings for bearings, reply_to, context in batch]))
+                self.logger.debug('Recognized {} gestures in {:.1f} ms'.format(
+                    len(batch), (time.perf_counter() - benchmark) * 1000))
+            except Exception:
+                self.logger.exception('Inference failed')
+                continue
+
+            for (bearings, reply_to, context), (glyph, confidence) in zip(batch, results):
+                (reply_to or self.queue).put(dict(context, type='inference', glyph=glyph, confidence=confidence),
+                                             block=False)
+
+    def _collect_batch(self):
+        # Grab whatever else shows up before the window closes
+        batch = []
+        deadline = time.perf_counter() + self.batch_window
+
+        while len(batch) < self.max_batch_size - 1:
+            try:
+                request = self.requests.get(timeout=max(0, deadline - time.perf_counter()))
+            except Empty:
+                break
+
+            if request is None:
+                # Finish this batch, then bail
+                self._stopping.set()
+                break
+
+            batch.append(request)
+
+        return batch
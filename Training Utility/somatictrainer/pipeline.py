@@ -0,0 +1,226 @@
+import argparse
+import asyncio
+import logging
+
+import numpy as np
+from serial import Serial
+
+from somatictrainer.gestures import GestureTrainingSet
+from somatictrainer.inference import InferenceWorker, load_recognizer
+from somatictrainer.receiver import parse_packet, ack
+from somatictrainer.segmenter import GestureSegmenter
+
+logger = logging.getLogger('pipeline')
+
+
+class AsyncReadLine:
+    """
+    Like util.ReadLine, but awaitable. pyserial only does blocking reads, so those happen on the
+    event loop's executor, a short timeout at a time.
+    """
+
+    def __init__(self, s):
+        self.buf = bytearray()
+        self.s = s  # Serial object
+        self.s.timeout = 0.1
+
+    def _read(self):
+        return self.s.read(max(1, min(2048, self.s.in_waiting)))
+
+    async def readline(self):
+        loop = asyncio.get_running_loop()
+
+        while True:
+            i = self.buf.find(b"\n")
+            if i >= 0:
+                r = self.buf[:i + 1]
+                del self.buf[:i + 1]
+                return r
+
+            self.buf.extend(await loop.run_in_executor(None, self._read))
+
+
+async def parse_packets(reader, samples, acked=None):
+    """
+    Read packets forever, putting (fingers, bearing, acceleration, microseconds) tuples on samples.
+    When samples is full this stops reading until there's room, and the glove's data waits in the serial buffer.
+
+    :type reader: AsyncReadLine
+    :type samples: asyncio.Queue
+    :param acked: Set whenever the glove acknowledges us
+    :type acked: asyncio.Event
+    """
+
+    while True:
+        packet = parse_packet((await reader.readline()).decode(errors='replace'))
+
+        if packet is None:
+            continue
+
+        if packet is ack:
+            logger.info('Received ack')
+            if acked is not None:
+                acked.set()
+            continue
+
+        fingers, bearing, acceleration, microseconds = packet
+
+        if samples.full():
+            logger.debug('Sample queue full - waiting for the segmenter to catch up')
+        await samples.put((fingers, np.array(bearing), np.array(acceleration), microseconds))
+
+
+async def segment_gestures(samples, gestures, segmenter=None):
+    """
+    Turn samples into gestures forever. When gestures is full, this stops taking samples until there's room.
+
+    :type samples: asyncio.Queue
+    :type gestures: asyncio.Queue
+    :type segmenter: GestureSegmenter
+    """
+
+    if segmenter is None:
+        segmenter = GestureSegmenter()
+
+    while True:
+        sample = await samples.get()
+        try:
+            gesture = segmenter.feed(*sample)
+        finally:
+            samples.task_done()
+
+        if gesture is not None:
+            if gestures.full():
+                logger.debug('Gesture queue full - waiting for a consumer')
+            await gestures.put(gesture)
+
+
+class _LoopQueue:
+    """
+    Lets InferenceWorker post results onto an asyncio queue from its own thread
+    """
+
+    def __init__(self, loop, queue):
+        self.loop = loop
+        self.queue = queue
+
+    def put(self, item, block=True):
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, item)
+
+
+async def recognize_gestures(gestures, predictions, inference_worker):
+    """
+    Hand gestures to the inference worker forever. Results land on predictions as the worker's
+    {'type': 'inference'} messages, with the gesture itself under 'gesture'.
+
+    :type gestures: asyncio.Queue
+    :param predictions: Unbounded, since the worker can't wait for room
+    :type predictions: asyncio.Queue
+    :param inference_worker: Already running. Gloves can share one, and get recognized in the same batches.
+    :type inference_worker: InferenceWorker
+    """
+
+    reply_to = _LoopQueue(asyncio.get_running_loop(), predictions)
+
+    while True:
+        gesture = await gestures.get()
+        inference_worker.submit(gesture.bearings, reply_to=reply_to, gesture=gesture)
+        gestures.task_done()
+
+
+class Glove:
+    """
+    One glove's whole pipeline - serial port to finished gestures, and their predictions - without Tk.
+    Run as many of these as you like on one event loop.
+    """
+
+    def __init__(self, port, sample_queue_size=256, gesture_queue_size=16, segmenter=None, inference_worker=None):
+        """
+        :type port: serial.Serial
+        :param sample_queue_size: Samples to hold between the parser and the segmenter
+        :param gesture_queue_size: Finished gestures to hold until somebody takes them
+        :type segmenter: GestureSegmenter
+        :param inference_worker: If given, gestures get recognized, and show up on predictions instead of gestures
+        :type inference_worker: InferenceWorker
+        """
+        self.port = port
+        self.reader = AsyncReadLine(port)
+        self.segmenter = segmenter if segmenter is not None else GestureSegmenter()
+        self.inference_worker = inference_worker
+
+        self.samples = asyncio.Queue(maxsize=sample_queue_size)
+        self.gestures = asyncio.Queue(maxsize=gesture_queue_size)
+        self.predictions = asyncio.Queue()
+        self.acked = asyncio.Event()
+
+    async def run(self):
+        """
+        Say hello to the glove, then parse, segment and recognize until cancelled or the port goes away
+        """
+        self.port.write(bytes('>AT\r\n'.encode('utf-8')))
+
+        tasks = [asyncio.ensure_future(parse_packets(self.reader, self.samples, self.acked)),
+                 asyncio.ensure_future(segment_gestures(self.samples, self.gestures, self.segmenter))]
+        if self.inference_worker is not None:
+            tasks.append(asyncio.ensure_future(recognize_gestures(self.gestures, self.predictions,
+                                                                  self.inference_worker)))
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+async def _print_gestures(name, glove):
+    while True:
+        gesture = await glove.gestures.get()
+        logger.info('{}: gesture {} - {} raw samples'.format(name, gesture.uuid, len(gesture.raw_data)))
+
+
+async def _print_predictions(name, glove):
+    while True:
+        prediction = await glove.predictions.get()
+        logger.info('{}: predicted {!r} with {:.2f}% confidence'.format(name, prediction['glyph'],
+                                                                       prediction['confidence'] * 100))
+
+
+async def _run_gloves(portspecs, inference_worker=None):
+    gloves = [Glove(Serial(port=portspec, baudrate=115200), inference_worker=inference_worker)
+              for portspec in portspecs]
+    printer = _print_gestures if inference_worker is None else _print_predictions
+
+    await asyncio.gather(*[glove.run() for glove in gloves],
+                         *[printer(portspec, glove) for portspec, glove in zip(portspecs, gloves)])
+
+
+def _main():
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description='Segment and recognize gestures from one or more gloves, '
+                                                 'no GUI required')
+    parser.add_argument('ports', nargs='+', help='Serial ports the gloves are on')
+    parser.add_argument('--model', help='A .tflite or Keras model to recognize gestures with. '
+                                        'Without one, gestures just get segmented.')
+    parser.add_argument('--training-set', help='The training set the model was trained on, for its glyphs')
+    args = parser.parse_args()
+
+    inference_worker = None
+    if args.model:
+        if not args.training_set:
+            parser.error('--model needs --training-set, to know which glyph is which')
+
+        glyphs = GestureTrainingSet.load(args.training_set, lazy_raw_data=True).glyphs_represented
+        inference_worker = InferenceWorker(None, load_recognizer(args.model, glyphs))
+        inference_worker.start()
+
+    try:
+        asyncio.run(_run_gloves(args.ports, inference_worker))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if inference_worker is not None:
+            inference_worker.stop()
+
+
+if __name__ == "__main__":
+    _main()
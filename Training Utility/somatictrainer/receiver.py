@@ -0,0 +1,384 @@
+import logging
+import threading
+import time
+import warnings
+
+import numpy as np
+from serial import SerialException
+
+from somatictrainer.util import ReadLine
+
+# One sample as sent by the glove - finger states, raw (yaw, pitch, roll), acceleration and microseconds since the last
+sample_dtype = np.dtype([('f', '?', 4), ('b', '<f8', 3), ('a', '<f8', 3), ('t', '<f8')])
+
+# Fixed-size little-endian record the glove sends once it's acknowledged >ATB. Checksum is the byte sum,
+# mod 256, of everything from fingers through t.
+binary_packet_dtype = np.dtype([('magic', '<u2'), ('fingers', 'u1'), ('b', '<f4', 3), ('a', '<f4', 3), ('t', '<u4'),
+                                ('checksum', 'u1')])
+binary_packet_magic = b'\xa5\x5a'
+
+ack = 'ack'
+binary_ack = 'binary ack'  # The glove will only send binary packets from here on
+
+
+def parse_packet(incoming):
+    """
+    Packet format:
+    >[./|],[./|],[./|],[./|],
+    [float o.h],[float o.p],[float o.r],
+    [float a.x], [float a.y], [float a.z], [us since last sample]
+
+    :type incoming: str
+    :return: A (fingers, bearing, acceleration, microseconds) tuple, ack or binary_ack if the glove acknowledged us,
+    or None if the packet's corrupt
+    """
+
+    if incoming.count('>') != 1:
+        return None
+
+    # Strip crap that arrived before the delimeter, and also the delimiter itself
+    incoming = incoming[incoming.index('>') + 1:].rstrip()
+
+    if incoming == 'OK':
+        return ack
+
+    if incoming == 'OKB':
+        return binary_ack
+
+    if incoming.count(',') != 10:
+        return None
+
+    tokens = incoming.split(',')
+
+    try:
+        return ([token == '.' for token in tokens[:4]],
+                [float(t) for t in tokens[4:7]],
+                [float(t) for t in tokens[7:10]],
+                float(tokens[-1]))
+    except ValueError:
+        return None
+
+
+def parse_packets(lines):
+    """
+    Parse a whole batch of text packets at once. Every number in the batch gets converted in one numpy call,
+    instead of eleven Python calls per packet.
+
+    :param lines: Packets as returned by ReadLine.read_all_lines
+    :type lines: list of bytes
+    :return: The samples as an array of sample_dtype, any acks in the order they arrived,
+    and how many lines were used up. Parsing stops after a binary_ack, since everything after it is binary.
+    :rtype: (np.array, list, int)
+    """
+
+    payloads = []
+    acks = []
+    used = len(lines)
+
+    for index, line in enumerate(lines):
+        if line.count(b'>') != 1:
+            continue
+
+        # Strip crap that arrived before the delimeter, and also the delimiter itself
+        payload = line[line.index(b'>') + 1:].rstrip()
+
+        if payload.count(b',') == 10:
+            payloads.append(payload)
+        elif payload == b'OK':
+            acks.append(ack)
+        elif payload == b'OKB':
+            acks.append(binary_ack)
+            used = index + 1
+            break
+
+    if not payloads:
+        return np.zeros(0, dtype=sample_dtype), acks, used
+
+    # Finger states are always one character each, so the first eight bytes of every packet are like '.,|,.,|,'
+    heads = np.frombuffer(b''.join(payload[:8] for payload in payloads), dtype=np.uint8).reshape(-1, 8)
+    well_formed = np.all(heads[:, 1::2] == ord(','), axis=1) \
+        & np.all((heads[:, 0::2] == ord('.')) | (heads[:, 0::2] == ord('|')), axis=1)
+
+    if not well_formed.all():
+        payloads = [payload for payload, ok in zip(payloads, well_formed) if ok]
+        heads = heads[well_formed]
+
+    try:
+        with warnings.catch_warnings():
+            # Older numpy only warns about garbage in the string, newer numpy throws
+            warnings.simplefilter('error', DeprecationWarning)
+            numbers = np.fromstring(b','.join(payload[8:] for payload in payloads), sep=',')
+    except (ValueError, DeprecationWarning):
+        numbers = None
+
+    if numbers is None or len(numbers) != 7 * len(payloads):
+        # Somebody's corrupt - go one at a time so the rest survive
+        parsed = [parse_packet('>' + payload.decode(errors='replace')) for payload in payloads]
+        parsed = [packet for packet in parsed if isinstance(packet, tuple)]
+        samples = np.zeros(len(parsed), dtype=sample_dtype)
+        for i, packet in enumerate(parsed):
+            samples[i] = packet
+        return samples, acks, used
+
+    numbers = numbers.reshape(-1, 7)
+
+    samples = np.zeros(len(payloads), dtype=sample_dtype)
+    samples['f'] = heads[:, 0::2] == ord('.')
+    samples['b'] = numbers[:, 0:3]
+    samples['a'] = numbers[:, 3:6]
+    samples['t'] = numbers[:, 6]
+
+    return samples, acks, used
+
+
+def decode_binary_packets(buffer):
+    """
+    Decode every complete binary packet in buffer at once. Corrupt packets are skipped by hunting for the next
+    magic number, so a dropped byte only costs the packets it touches.
+
+    :type buffer: bytes or bytearray
+    :return: The samples as an array of sample_dtype, and how many bytes of buffer were used up.
+    Whatever's left over is the start of a packet that hasn't finished arriving.
+    :rtype: (np.array, int)
+    """
+
+    packet_size = binary_packet_dtype.itemsize
+    data = np.frombuffer(buffer, dtype=np.uint8)
+    good_runs = []
+    position = 0
+
+    while len(data) - position >= packet_size:
+        count = (len(data) - position) // packet_size
+        packets = data[position:position + count * packet_size].reshape(count, packet_size)
+
+        valid = (packets[:, 0] == binary_packet_magic[0]) & (packets[:, 1] == binary_packet_magic[1]) \
+            & (packets[:, 2:-1].sum(axis=1, dtype=np.uint8) == packets[:, -1])
+
+        first_invalid = count if valid.all() else int(np.argmin(valid))
+        good_runs.append(packets[:first_invalid])
+        position += first_invalid * packet_size
+
+        if first_invalid == count:
+            break
+
+        resync = buffer.find(binary_packet_magic, position + 1)
+        if resync < 0:
+            # Hang onto the last byte in case it's the first half of the next magic number
+            position = len(data) - 1
+            break
+        position = resync
+
+    if not good_runs:
+        return np.zeros(0, dtype=sample_dtype), position
+
+    packets = np.concatenate(good_runs).reshape(-1).view(binary_packet_dtype)
+
+    output = np.zeros(len(packets), dtype=sample_dtype)
+    output['f'] = (packets['fingers'][:, np.newaxis] >> np.arange(4)) & 1
+    output['b'] = packets['b']
+    output['a'] = packets['a']
+    output['t'] = packets['t']
+
+    return output, position
+
+
+class SampleRingBuffer:
+    """
+    Fixed-size ring of samples shared by exactly one writer thread and one reader thread.
+    Each side only ever advances its own counter, so no locking is needed.
+    """
+
+    def __init__(self, capacity=4096):
+        self.samples = np.zeros(capacity, dtype=sample_dtype)
+        self.capacity = capacity
+
+        self._written = 0  # Only the writer touches this
+        self._read = 0  # Only the reader touches this
+        self.dropped = 0
+
+    def __len__(self):
+        return self._written - self._read
+
+    def push(self, fingers, bearing, acceleration, microseconds):
+        """
+        :return: False if the buffer's full and the sample was dropped
+        :rtype: bool
+        """
+        if self._written - self._read >= self.capacity:
+            self.dropped += 1
+            return False
+
+        self.samples[self._written % self.capacity] = (fingers, bearing, acceleration, microseconds)
+        self._written += 1
+        return True
+
+    def push_many(self, samples):
+        """
+        :param samples: Array of sample_dtype
+        :return: How many samples didn't fit and were dropped
+        :rtype: int
+        """
+        room = self.capacity - (self._written - self._read)
+        dropped = max(0, len(samples) - room)
+        samples = samples[:len(samples) - dropped]
+
+        indices = (self._written + np.arange(len(samples))) % self.capacity
+        self.samples[indices] = samples
+
+        self._written += len(samples)
+        self.dropped += dropped
+        return dropped
+
+    def drain(self, max_count=None):
+        """
+        :param max_count: Most samples to take at once, or None for everything available
+        :return: Oldest samples first, copied out of the ring
+        :rtype: np.array
+        """
+        available = self._written - self._read
+        if max_count is not None:
+            available = min(available, max_count)
+
+        start = self._read % self.capacity
+        indices = (start + np.arange(available)) % self.capacity
+        output = self.samples[indices]
+
+        self._read += available
+        return output
+
+    def clear(self):
+        """
+        Throw away everything that's been written so far. Only call this from the reader thread.
+        """
+        self._read = self._written
+
+
+class SerialReceiver(threading.Thread):
+    """
+    Reads and parses packets off the glove's serial port in the background, so samples keep coming no matter
+    how busy the GUI is. Samples go into a ring buffer; acks and lost connections go on the GUI's queue.
+    """
+
+    logger = logging.getLogger('SerialReceiver')
+
+    # This many text packets in a row while we're expecting binary means the glove reset and forgot about >ATB
+    text_packets_before_renegotiating = 5
+
+    def __init__(self, port, queue, capacity=4096):
+        """
+        :type port: serial.Serial
+        :param queue: Where to post {'type': 'ack'} and {'type': 'disconnected'} messages for the GUI
+        :type queue: queue.Queue
+        :param capacity: How many samples to buffer before dropping them
+        :type capacity: int
+        """
+        threading.Thread.__init__(self, name='SerialReceiver', daemon=True)
+
+        self.port = port
+        self.queue = queue
+        self.samples = SampleRingBuffer(capacity)
+
+        self._line_reader = ReadLine(port)
+        self._stopping = threading.Event()
+
+        # Flips once the glove acknowledges >ATB - see binary_packet_dtype
+        self.binary = False
+        self._binary_buffer = bytearray()
+        self._text_packets_in_binary = 0
+        self._log_parsing = False
+
+    def stop(self, timeout=1):
+        self._stopping.set()
+        if threading.current_thread() is not self and self.is_alive():
+            self.join(timeout=timeout)
+
+    def run(self):
+        self.logger.info('Now receiving')
+
+        try:
+            while not self._stopping.is_set():
+                if self.binary:
+                    self._receive_binary_packets()
+                else:
+                    self._receive_lines()
+        except (SerialException, OSError, TypeError, AttributeError):
+            # Closing the port out from under us makes pyserial throw all sorts of things
+            if not self._stopping.is_set():
+                self.logger.exception('Lost serial connection, bailing out')
+                self.queue.put({'type': 'disconnected'}, block=False)
+
+        self.logger.info('No longer receiving')
+
+    def _receive_lines(self):
+        lines = self._line_reader.read_all_lines()
+        if not lines:
+            time.sleep(0.001)
+            return
+
+        samples, acks, used = parse_packets(lines)
+
+        if self._log_parsing:
+            self.logger.debug('Parsed {} samples from {} lines'.format(len(samples), len(lines)))
+
+        if len(samples) and self.samples.push_many(samples):
+            self.logger.warning('Sample buffer full - dropped {} samples so far'.format(self.samples.dropped))
+
+        for packet in acks:
+            if packet is ack:
+                self.logger.info('Received ack')
+                self.queue.put({'type': 'ack'}, block=False)
+            else:
+                self.logger.info('Glove switched to binary packets')
+                self.binary = True
+
+                # Whatever came in after the ack is already binary - put it back together
+                leftovers = lines[used:]
+                self._binary_buffer = bytearray(b''.join(line + b'\n' for line in leftovers))
+                self._binary_buffer.extend(self._line_reader.buf)
+                del self._line_reader.buf[:]
+
+    def _receive_binary_packets(self):
+        waiting = self.port.in_waiting
+        if waiting:
+            self._binary_buffer += self.port.read(waiting)
+        elif len(self._binary_buffer) < binary_packet_dtype.itemsize:
+            time.sleep(0.001)
+            return
+
+        samples, used = decode_binary_packets(self._binary_buffer)
+
+        if len(samples):
+            self._text_packets_in_binary = 0
+
+        if used > len(samples) * binary_packet_dtype.itemsize:
+            # Some of that wasn't binary - see if it's the glove talking text at us again
+            text_samples, _, _ = parse_packets(bytes(self._binary_buffer[:used]).split(b'\n'))
+            self._text_packets_in_binary += len(text_samples)
+
+            if self._text_packets_in_binary >= self.text_packets_before_renegotiating:
+                self._fall_back_to_text()
+                return
+
+        del self._binary_buffer[:used]
+
+        if self._log_parsing:
+            self.logger.debug('Decoded {} binary packets'.format(len(samples)))
+
+        if len(samples) and self.samples.push_many(samples):
+            self.logger.warning('Sample buffer full - dropped {} samples so far'.format(self.samples.dropped))
+
+    def _fall_back_to_text(self):
+        """
+        Go back to reading text packets and ask for binary again. If the glove still knows binary packets it'll
+        send >OKB and _receive_lines switches us back, otherwise we just carry on in text.
+        """
+        self.logger.warning('Glove is sending text packets again - falling back to text and re-sending >ATB')
+
+        self.binary = False
+        self._text_packets_in_binary = 0
+
+        # The text packets we just noticed go back through the line reader, so they aren't lost
+        self._line_reader.buf[0:0] = self._binary_buffer
+        self._binary_buffer = bytearray()
+
+        self.port.write(bytes('>ATB\r\n'.encode('utf-8')))
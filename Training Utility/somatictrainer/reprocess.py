@@ -0,0 +1,137 @@
+import argparse
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from somatictrainer.gestures import Gesture, GestureTrainingSet, standard_gesture_length, gesture_cone_angle
+from somatictrainer.util import standardize_raw_bearings, process_samples, process_samples_batch
+
+logger = logging.getLogger('reprocess')
+
+
+def rebuild_bearings(raw_bearings_list, cone_angle=gesture_cone_angle):
+    """
+    Re-derive standardized bearings from raw recordings. Runs in a worker process.
+
+    :param raw_bearings_list: Raw (yaw, pitch, roll) readings for each gesture
+    :type raw_bearings_list: list of np.array
+    :type cone_angle: float
+    :return: New bearings for each gesture, or None where a gesture couldn't be processed
+    :rtype: list
+    """
+
+    traces = [standardize_raw_bearings(raw_bearings, cone_angle) for raw_bearings in raw_bearings_list]
+
+    try:
+        return list(process_samples_batch(traces, standard_gesture_length))
+    except (AttributeError, ValueError):
+        pass
+
+    # Somebody in this chunk is bogus - fall back to one at a time so the rest of the chunk survives
+    output = []
+    for trace in traces:
+        try:
+            output.append(process_samples(trace, standard_gesture_length))
+        except (AttributeError, ValueError):
+            output.append(None)
+
+    return output
+
+
+def reprocess(training_set, chunk_size=500, workers=None, cone_angle=gesture_cone_angle, progress=None):
+    """
+    Build a copy of a training set with every gesture's bearings rebuilt from its raw data,
+    spread across a process pool. Gestures without usable raw data keep their old bearings.
+
+    :type training_set: GestureTrainingSet
+    :type chunk_size: int
+    :param workers: Number of worker processes, or None for one per core
+    :type workers: int
+    :type cone_angle: float
+    :param progress: Called with (gestures done, gestures total) as chunks come back
+    :rtype: GestureTrainingSet
+    """
+
+    examples = list(training_set.examples)
+    rebuildable = [index for index, example in enumerate(examples) if len(example.raw_data) > 1]
+    new_bearings = [example.bearings for example in examples]
+
+    failures = 0
+    done = 0
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+        for start in range(0, len(rebuildable), chunk_size):
+            indices = rebuildable[start:start + chunk_size]
+            future = executor.submit(rebuild_bearings, [examples[i].raw_bearings() for i in indices], cone_angle)
+            futures[future] = indices
+
+        for future in as_completed(futures):
+            indices = futures[future]
+            for index, bearings in zip(indices, future.result()):
+                if bearings is None:
+                    logger.warning('Couldn\'t reprocess gesture {} for glyph {}, keeping old bearings'.format(
+                        examples[index].uuid, examples[index].glyph))
+                    failures += 1
+                else:
+                    new_bearings[index] = bearings
+
+            done += len(indices)
+            if progress:
+                progress(done, len(rebuildable))
+
+    output = GestureTrainingSet()
+    for example, bearings in zip(examples, new_bearings):
+        output.add(Gesture(example.glyph, bearings, example.raw_data, example.uuid))
+
+    logger.info('Reprocessed {} of {} gestures ({} without raw data, {} failed)'.format(
+        len(rebuildable) - failures, len(examples), len(examples) - len(rebuildable), failures))
+
+    return output
+
+
+def _main():
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description='Rebuild every gesture in a training set from its raw data')
+    parser.add_argument('input', help='Training set to reprocess')
+    parser.add_argument('output', nargs='?', help='Where to save the result. Defaults to <input>_reprocessed.db')
+    parser.add_argument('--chunk-size', type=int, default=500, help='Gestures handed to a worker at a time')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes. Defaults to one per core.')
+    parser.add_argument('--cone-angle', type=float, default=np.degrees(gesture_cone_angle),
+                        help='Gesture cone angle in degrees')
+    args = parser.parse_args()
+
+    output_pathspec = args.output
+    if not output_pathspec:
+        output_pathspec = os.path.splitext(args.input)[0] + '_reprocessed.db'
+
+    if os.path.abspath(output_pathspec) == os.path.abspath(args.input):
+        parser.error('Refusing to overwrite the input file')
+
+    benchmark = time.perf_counter()
+    training_set = GestureTrainingSet.load(args.input)
+    logger.info('Loaded {} gestures in {:.2f} sec'.format(len(training_set.examples),
+                                                          time.perf_counter() - benchmark))
+
+    def show_progress(done, total):
+        sys.stderr.write('\rReprocessed {}/{}'.format(done, total))
+        if done == total:
+            sys.stderr.write('\n')
+        sys.stderr.flush()
+
+    benchmark = time.perf_counter()
+    reprocessed = reprocess(training_set, chunk_size=args.chunk_size, workers=args.workers,
+                            cone_angle=np.radians(args.cone_angle), progress=show_progress)
+    logger.info('Reprocessing took {:.2f} sec'.format(time.perf_counter() - benchmark))
+
+    reprocessed.save(output_pathspec)
+    logger.info('Saved {}'.format(output_pathspec))
+
+
+if __name__ == "__main__":
+    _main()
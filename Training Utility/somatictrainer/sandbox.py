@@ -1,55 +1,169 @@
 import random
-import time
 
 import requests
-import tensorflow.keras as keras
-import tensorflow as tf
-import sklearn.model_selection
 import logging
 import numpy as np
-import hexdump
-from datetime import datetime
 
-from somatictrainer.gestures import GestureTrainingSet, Gesture
+from somatictrainer.augment import augment_raw_bearings
+from somatictrainer.gestures import GestureTrainingSet, gesture_cone_angle
 
 logging.basicConfig(level=logging.DEBUG)
 
 
-class Callbacks(keras.callbacks.Callback):
-    def on_train_begin(self, logs=None):
-        logging.info('Starting training!')
-
-    def on_train_end(self, logs=None):
-        logging.info('Training over!')
-
-    def on_train_batch_begin(self, batch, logs=None):
-        logging.info('Starting batch {}. Logs: {}'.format(batch, logs))
-
-    def on_train_batch_end(self, batch, logs=None):
-        logging.info('Ending batch {}. Logs: {}'.format(batch, logs))
-
-    def on_epoch_begin(self, epoch, logs=None):
-        logging.info('Starting epoch {}'.format(epoch))
-
-    def on_epoch_end(self, epoch, logs=None):
-        logging.info('Ending epoch {}. Logs: {}'.format(
-            epoch, logs))
+# TensorFlow, sklearn and friends take seconds to import, so they're only imported where they're used.
+# That way anybody who just wants generate_training_sentence doesn't wait on them.
+
+
+def make_logging_callback():
+    """
+    :return: A Keras callback that logs every step of training
+    :rtype: keras.callbacks.Callback
+    """
+    import tensorflow.keras as keras
+
+    class Callbacks(keras.callbacks.Callback):
+        def on_train_begin(self, logs=None):
+            logging.info('Starting training!')
+
+        def on_train_end(self, logs=None):
+            logging.info('Training over!')
+
+        def on_train_batch_begin(self, batch, logs=None):
+            logging.info('Starting batch {}. Logs: {}'.format(batch, logs))
+
+        def on_train_batch_end(self, batch, logs=None):
+            logging.info('Ending batch {}. Logs: {}'.format(batch, logs))
+
+        def on_epoch_begin(self, epoch, logs=None):
+            logging.info('Starting epoch {}'.format(epoch))
+
+        def on_epoch_end(self, epoch, logs=None):
+            logging.info('Ending epoch {}. Logs: {}'.format(
+                epoch, logs))
+
+    return Callbacks()
+
+
+def make_dataset(bearings, labels, indices, num_classes, batch_size=32, shuffle=True, shuffle_buffer_size=2048,
+                 cache_pathspec=None, chunk_size=1024):
+    """
+    Stream examples into Keras a chunk at a time, instead of copying the whole corpus into memory first.
+    Labels get one-hotted a batch at a time on the way out.
+
+    :param bearings: Every example's bearings - a memory map is fine
+    :type bearings: np.array
+    :param labels: Every example's label, encoded per get_character_map('encoding')
+    :type labels: np.array
+    :param indices: Which examples to use
+    :type indices: np.array
+    :type num_classes: int
+    :type batch_size: int
+    :param shuffle: Reshuffle every epoch - chunks get read in a random order, then examples get mixed
+    through a buffer of shuffle_buffer_size. When caching, the chunk order is whatever the first epoch's was.
+    :type shuffle: bool
+    :type shuffle_buffer_size: int
+    :param cache_pathspec: Where to cache examples after the first epoch, if anywhere. By default every epoch
+    reads straight from bearings again, which costs next to nothing when it's a memory map.
+    '' caches them in memory - only do that if the whole corpus fits.
+    :type cache_pathspec: str
+    :param chunk_size: Examples to read off disk at a time
+    :type chunk_size: int
+    :rtype: tf.data.Dataset
+    """
+    import tensorflow as tf
+
+    indices = np.sort(indices)  # Read front to back, memory maps like that
+
+    def read_chunks():
+        starts = np.arange(0, len(indices), chunk_size)
+        if shuffle:
+            # Examples are saved grouped by glyph, so a buffer's worth read in order is mostly one class.
+            # Chunks are still read front to back, they just come from all over.
+            np.random.default_rng().shuffle(starts)
+
+        for start in starts:
+            chunk = indices[start:start + chunk_size]
+            yield np.asarray(bearings[chunk], dtype=np.float32), np.asarray(labels[chunk], dtype=np.int64)
+
+    dataset = tf.data.Dataset.from_generator(
+        read_chunks,
+        output_signature=(tf.TensorSpec((None,) + tuple(bearings.shape[1:]), tf.float32),
+                          tf.TensorSpec((None,), tf.int64))).unbatch()
+
+    if cache_pathspec is not None:
+        dataset = dataset.cache(cache_pathspec)
+
+    if shuffle:
+        dataset = dataset.shuffle(shuffle_buffer_size, reshuffle_each_iteration=True)
+
+    return dataset.batch(batch_size) \
+        .map(lambda batch, batch_labels: (batch, tf.one_hot(batch_labels, num_classes)),
+             num_parallel_calls=tf.data.experimental.AUTOTUNE) \
+        .prefetch(tf.data.experimental.AUTOTUNE)
+
+
+def make_augmented_dataset(bearings, labels, raw_bearings, raw_offsets, indices, num_classes, batch_size=32,
+                           shuffle_buffer_size=2048, cone_angle=gesture_cone_angle):
+    """
+    Like make_dataset, except every batch is freshly distorted copies of the examples, rebuilt from their raw data
+    by augment_raw_bearings. Batches get augmented in parallel while the model trains on earlier ones.
+    Examples without raw data go through as they are.
+
+    :param raw_bearings: Every example's raw readings back to back - a memory map is fine
+    :type raw_bearings: np.array
+    :param raw_offsets: Example i's readings are raw_bearings[raw_offsets[i]:raw_offsets[i + 1]]
+    :type raw_offsets: np.array
+    :type cone_angle: float
+    :rtype: tf.data.Dataset
+    """
+    import tensorflow as tf
+
+    example_shape = tuple(bearings.shape[1:])
+
+    def augment(batch_indices):
+        # Batches are augmented on several threads at once, so each gets its own generator
+        rng = np.random.default_rng()
+        raw_bearings_list = [raw_bearings[raw_offsets[index]:raw_offsets[index + 1]] for index in batch_indices]
+        return augment_raw_bearings(raw_bearings_list, bearings[batch_indices], rng, cone_angle)
+
+    def augment_batch(batch_indices):
+        batch = tf.numpy_function(augment, [batch_indices], tf.float32)
+        batch.set_shape((None,) + example_shape)
+        return batch, tf.one_hot(tf.gather(labels, batch_indices), num_classes)
+
+    return tf.data.Dataset.from_tensor_slices(np.asarray(indices, dtype=np.int64)) \
+        .shuffle(shuffle_buffer_size, reshuffle_each_iteration=True) \
+        .batch(batch_size) \
+        .map(augment_batch, num_parallel_calls=tf.data.experimental.AUTOTUNE) \
+        .prefetch(tf.data.experimental.AUTOTUNE)
 
 
 def make_model():
-    filename = 'training_set_2.db'
-
-    corpus = GestureTrainingSet.load(
-        'E:\\Dropbox\\Projects\\Source-Controlled Projects\\Somatic\\Training Utility\\' + filename)
+    import tensorflow.keras as keras
+    import tensorflow as tf
+    import sklearn.model_selection
+    import hexdump
 
-    data, labels = corpus.to_training_set()
+    filename = 'training_set_2.db'
 
-    one_hot_labels = keras.utils.to_categorical(labels, num_classes=np.max(labels) + 1)
+    bearings, labels, glyphs, raw_bearings, raw_offsets = GestureTrainingSet.load_training_columns(
+        'E:\\Dropbox\\Projects\\Source-Controlled Projects\\Somatic\\Training Utility\\' + filename,
+        with_raw_bearings=True)
+    num_classes = len(glyphs)
 
-    x_train, x_test, y_train, y_test = sklearn.model_selection.train_test_split(
-        data, one_hot_labels, test_size=0.1, shuffle=True, stratify=one_hot_labels)
+    # Only the indices get split, the data stays put
+    train_indices, test_indices = sklearn.model_selection.train_test_split(
+        np.arange(len(labels)), test_size=0.1, shuffle=True, stratify=labels)
 
     batch_size = 32
+    augment = True  # Train on randomly distorted gestures - see augment.py
+
+    if augment:
+        train_data = make_augmented_dataset(bearings, labels, raw_bearings, raw_offsets, train_indices, num_classes,
+                                            batch_size)
+    else:
+        train_data = make_dataset(bearings, labels, train_indices, num_classes, batch_size)
+    test_data = make_dataset(bearings, labels, test_indices, num_classes, batch_size, shuffle=False)
 
     model = keras.Sequential()
     # model.add(keras.layers.LSTM(batch_size, activation='sigmoid', recurrent_activation='relu',
@@ -59,11 +173,11 @@ def make_model():
     # model.add(keras.layers.LSTM(64))
     # model.add(keras.layers.Dropout(0.2))
 
-    model.add(keras.layers.Flatten(input_shape=data.shape[1:]))
+    model.add(keras.layers.Flatten(input_shape=bearings.shape[1:]))
     model.add(keras.layers.Dense(batch_size, activation='relu'))
     for i in range(4):
         model.add(keras.layers.Dense(100, activation='relu'))
-    model.add(keras.layers.Dense(np.max(labels) + 1, activation='softmax'))
+    model.add(keras.layers.Dense(num_classes, activation='softmax'))
 
     model.compile(loss='categorical_crossentropy',
                   optimizer='adam',
@@ -71,10 +185,9 @@ def make_model():
 
     model.summary()
 
-    model.fit(x_train, y_train, epochs=500, batch_size=batch_size,
-              shuffle=True, verbose=True, validation_data=(x_test, y_test))
+    model.fit(train_data, epochs=500, verbose=True, validation_data=test_data)
 
-    model.evaluate(data, one_hot_labels, batch_size=batch_size)
+    model.evaluate(make_dataset(bearings, labels, np.arange(len(labels)), num_classes, batch_size, shuffle=False))
 
     if '.' in filename:
         filename = filename[:filename.rindex('.')]
@@ -97,8 +210,8 @@ def make_model():
     # converter.allow_custom_ops = True
 
     def rep_data_gen():
-        for val in x_test:
-            yield [np.array(val, dtype=np.float32, ndmin=2)]
+        for index in test_indices:
+            yield [np.array(bearings[index], dtype=np.float32, ndmin=2)]
 
     converter.representative_dataset = rep_data_gen
 
@@ -109,7 +222,7 @@ def make_model():
     for chunk in hexdump.chunks(tflite_model, 16):
         hex_lines.append('0x' + hexdump.dump(chunk, sep=', 0x'))
 
-    char_map = corpus.get_character_map()
+    char_map = {i: glyph for i, glyph in enumerate(glyphs)}
 
     with open(filename + '_model.h', 'w') as f:
         f.write('const unsigned char modelBin[] = {\n')
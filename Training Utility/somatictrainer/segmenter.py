@@ -0,0 +1,135 @@
+import logging
+from collections import deque
+
+import numpy as np
+
+from somatictrainer.gestures import Gesture, standard_gesture_length, gesture_cone_angle, raw_sample_dtype
+from somatictrainer.util import bearing_delta, process_samples
+
+logger = logging.getLogger('GestureSegmenter')
+
+
+class GestureSegmenter:
+    """
+    Picks gestures out of the glove's stream of samples - the trainer and the headless pipeline both go through this.
+    Feed it samples in order, and it hands back a Gesture whenever one finishes.
+    """
+
+    pointer_gesture = [True, True, True, False]
+
+    def __init__(self, cone_angle=gesture_cone_angle):
+        self.gesture_cone_angle = cone_angle
+        self.minimum_velocity_to_start_gesture = 5.0
+        self.maximum_velocity_to_end_gesture = 1.5
+        self.gesture_lockout_time = 0.2  # Seconds to ignore gestures, to allow user to reposition their hand
+
+        self.recording = False
+        self.bearing = None  # The last sample's bearing - relative to the start of the gesture while recording
+        self.gesture_buffer = []
+        self.raw_data_buffer = np.empty(256, dtype=raw_sample_dtype)
+        self.raw_data_count = 0
+        self.current_gesture_duration = 0
+        self.last_gesture_duration = 0  # Microseconds the last finished gesture took
+        self.bearing_zero = None
+        self.last_unprocessed_bearing_received = None
+        self.angular_velocity_window = deque(maxlen=5)
+
+        # Go by the glove's clock, not ours - samples can sit in a queue for a while before we see them
+        self.microseconds_elapsed = 0
+        self.last_gesture_timestamp = -np.inf
+
+    def feed(self, fingers, bearing, acceleration, microseconds):
+        """
+        :type fingers: list of bool
+        :type bearing: np.array
+        :type acceleration: np.array
+        :type microseconds: float
+        :return: The gesture that this sample finished, if any. When a gesture finishes but can't be processed,
+        this is None and recording just stops.
+        :rtype: Gesture
+        """
+
+        self.microseconds_elapsed += microseconds
+
+        raw_bearing = bearing
+        bearing = np.array([bearing[0], bearing[1]])  # We don't care about roll
+
+        if self.last_unprocessed_bearing_received is not None:
+            frequency = 1000000 / microseconds if microseconds else 0
+            norm = np.linalg.norm(bearing_delta(self.last_unprocessed_bearing_received, bearing))
+            # Noise can push a big enough jump past 1, and arcsin would give us NaN
+            angular_velocity = np.arcsin(min(norm, 1)) * frequency
+            self.angular_velocity_window.append(angular_velocity)
+        else:
+            angular_velocity = 0
+
+        self.last_unprocessed_bearing_received = bearing
+
+        if not self.recording:
+            gesture_eligible = angular_velocity >= self.minimum_velocity_to_start_gesture \
+                               and list(fingers) == self.pointer_gesture
+
+            if not gesture_eligible and list(fingers) == self.pointer_gesture:
+                logger.debug('Correct hand sign, but too slow')
+        else:
+            gesture_eligible = len(self.angular_velocity_window) > 0 \
+                               and np.average(self.angular_velocity_window) >= self.maximum_velocity_to_end_gesture
+
+            if not gesture_eligible:
+                logger.debug('Stopping recording because hand slowed down')
+
+        if gesture_eligible \
+                and (self.microseconds_elapsed - self.last_gesture_timestamp) / 1000000 <= self.gesture_lockout_time:
+            gesture_eligible = False
+            logger.debug('Locked out from gesturing')
+
+        if self.bearing_zero is not None:
+            # Constrain gesture to a cone, then scale bearings to ML-ready 0.0-1.0 values
+            bearing = np.clip(bearing_delta(self.bearing_zero, bearing),
+                              -1 / 2 * self.gesture_cone_angle,
+                              1 / 2 * self.gesture_cone_angle)
+            bearing /= self.gesture_cone_angle
+            bearing += 0.5
+
+        if gesture_eligible:
+            if not self.recording:
+                self.bearing_zero = bearing
+                bearing = np.array([0.5, 0.5])
+                self.recording = True
+
+            self.bearing = bearing
+            self.gesture_buffer.append(bearing)
+
+            if self.raw_data_count == len(self.raw_data_buffer):
+                self.raw_data_buffer = np.resize(self.raw_data_buffer, 2 * len(self.raw_data_buffer))
+            self.raw_data_buffer[self.raw_data_count] = (raw_bearing, acceleration, microseconds)
+            self.raw_data_count += 1
+            self.current_gesture_duration += microseconds
+            return None
+
+        self.bearing = bearing
+
+        if not self.recording:
+            return None
+
+        logger.info('Sample done, {} points'.format(len(self.gesture_buffer)))
+
+        try:
+            new_gesture = Gesture('', process_samples(np.array(self.gesture_buffer), standard_gesture_length),
+                                  self.raw_data_buffer[:self.raw_data_count].copy())
+            self.last_gesture_timestamp = self.microseconds_elapsed
+        except (AttributeError, ValueError):
+            logger.exception("Couldn't create gesture")
+            new_gesture = None
+
+        self.last_gesture_duration = self.current_gesture_duration
+        self.cancel_gesture()
+        return new_gesture
+
+    def cancel_gesture(self):
+        self.recording = False
+        del self.gesture_buffer[:]
+        self.raw_data_count = 0
+        self.current_gesture_duration = 0
+        self.bearing_zero = None
+        self.last_unprocessed_bearing_received = None
@@ -0,0 +1,65 @@
+import argparse
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from somatictrainer import exit_after_first_frame_variable
+
+logger = logging.getLogger('startup_benchmark')
+
+
+def time_startup(runs=5, command=None):
+    """
+    Launch the trainer like a user would, with python -m somatictrainer, and time how long it takes to get its
+    first frame on screen.
+
+    :param runs: How many times to launch it
+    :type runs: int
+    :param command: What to launch instead of the trainer
+    :type command: list of str
+    :return: Seconds from launch to first frame, for each run
+    :rtype: list of float
+    """
+
+    if command is None:
+        command = [sys.executable, '-m', 'somatictrainer']
+
+    environment = dict(os.environ)
+    environment[exit_after_first_frame_variable] = '1'
+    package_parent = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    timings = []
+    for run in range(runs):
+        benchmark = time.perf_counter()
+        result = subprocess.run(command, cwd=package_parent, env=environment,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        timings.append(time.perf_counter() - benchmark)
+
+        if result.returncode:
+            # Usually there's no display to open a window on
+            logger.error('Trainer exited with status {}:\n{}'.format(
+                result.returncode, result.stderr.decode(errors='replace').strip()[-2000:]))
+            result.check_returncode()
+
+        logger.info('Run {}: {:.3f} sec'.format(run + 1, timings[-1]))
+
+    return timings
+
+
+def _main():
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description='Time how long the trainer takes to start up')
+    parser.add_argument('--runs', type=int, default=5, help='Times to launch the trainer')
+    args = parser.parse_args()
+
+    timings = time_startup(args.runs)
+    logger.info('Startup took {:.3f} sec median, {:.3f} best, {:.3f} worst'.format(
+        statistics.median(timings), min(timings), max(timings)))
+
+
+if __name__ == "__main__":
+    _main()
@@ -0,0 +1,502 @@
+import hashlib
+import json
+import logging
+import os
+from collections import OrderedDict
+from functools import lru_cache
+
+import numpy as np
+from PIL import Image, ImageTk
+
+
+def bearings_hash(bearings):
+    """
+    :return: A short digest of a gesture's bearings, so thumbnails go stale if the gesture gets reprocessed.
+    Hashed at float32, which is how columnar saves store them, so a save and reload doesn't change the digest.
+    :rtype: str
+    """
+    return hashlib.blake2b(np.ascontiguousarray(bearings, dtype=np.float32).tobytes(), digest_size=8).hexdigest()
+
+
+def thumbnail_key(gesture):
+    """
+    :type gesture: Gesture
+    :rtype: str
+    """
+    return '{}-{}'.format(gesture.uuid, bearings_hash(gesture.bearings))
+
+
+def thumbnail_directory_for(pathspec):
+    """
+    :param pathspec: A training set's save file
+    :return: Where to keep that training set's thumbnails
+    :rtype: str
+    """
+    return os.path.normpath(pathspec) + '.thumbnails'
+
+
+@lru_cache(maxsize=8)
+def _color_ramp(path_length):
+    """
+    :return: RGBA colour of each segment of a path, fading from green to blue
+    :rtype: np.array
+    """
+    i = np.arange(1, path_length)
+    ramp = np.full((path_length - 1, 4), 255, dtype=np.uint8)
+    ramp[:, 0] = 0
+    ramp[:, 1] = (255 - i * 255 / path_length).astype(int)
+    ramp[:, 2] = (i * 255 / path_length).astype(int)
+    ramp.setflags(write=False)
+    return ramp
+
+
+def _round_up(values):
+    """
+    PIL's ROUND_UP, which rounds halves away from zero. float32 in, float32 arithmetic, like the C.
+    """
+    half = np.float32(0.5)
+    return np.where(values >= 0, np.floor(values + half), -np.floor(np.abs(values) + half)).astype(np.int64)
+
+
+def _round_down(values):
+    """
+    PIL's ROUND_DOWN, which rounds halves towards zero
+    """
+    half = np.asarray(0.5, dtype=values.dtype)
+    return np.where(values >= 0, np.ceil(values - half), -np.ceil(np.abs(values) - half)).astype(np.int64)
+
+
+def _roundf(values):
+    """
+    C's roundf - halves go away from zero, unlike np.round
+    """
+    return (np.sign(values) * np.floor(np.abs(values.astype(np.float64)) + 0.5)).astype(np.float32)
+
+
+def _wide_line_spans(x0, y0, x1, y1, line_thiccness, height):
+    """
+    Rasterize a batch of line segments exactly the way ImageDraw does for widths over 1 - each one's a
+    four-sided polygon, filled a scanline at a time. Follows ImagingDrawWideLine and polygon_generic in PIL's Draw.c,
+    quirks included, just for every segment at once.
+
+    :param x0, y0, x1, y1: Whole-pixel endpoints of every segment
+    :type x0, y0, x1, y1: np.array
+    :return: (segment, y, first x, last x) of every horizontal run to fill, unclipped in x
+    :rtype: (np.array, np.array, np.array, np.array)
+    """
+
+    dx = x1 - x0
+    dy = y1 - y0
+    hypotenuses = np.hypot(dx, dy)
+    hypotenuses[hypotenuses == 0] = np.inf  # These are points, and only get ratios of 0
+
+    small_hypotenuse = (line_thiccness - 1) / 2.0
+    ratio_max = int(_round_up(np.float64(small_hypotenuse))) / hypotenuses
+    ratio_min = int(_round_down(np.float64(small_hypotenuse))) / hypotenuses
+    dxmin = _round_down(ratio_min * dy)
+    dxmax = _round_down(ratio_max * dy)
+    dymin = _round_down(ratio_min * dx)
+    dymax = _round_down(ratio_max * dx)
+
+    vertices = [(x0 - dxmin, y0 + dymax), (x1 - dxmin, y1 + dymax), (x1 + dxmax, y1 - dymin), (x0 + dxmax, y0 - dymin)]
+    edges = []
+    for (start_x, start_y), (end_x, end_y) in zip(vertices, vertices[1:] + vertices[:1]):
+        flat = start_y == end_y
+        with np.errstate(divide='ignore', invalid='ignore'):
+            slope = np.where(flat, np.float32(0),
+                             (end_x - start_x).astype(np.float32) / (end_y - start_y).astype(np.float32))
+        edges.append({'x0': start_x, 'y0': start_y, 'xmin': np.minimum(start_x, end_x),
+                      'xmax': np.maximum(start_x, end_x), 'ymin': np.minimum(start_y, end_y),
+                      'ymax': np.maximum(start_y, end_y), 'flat': flat, 'dx': slope.astype(np.float32)})
+
+    segments = np.arange(len(x0))
+    runs = []
+
+    # Horizontal edges get drawn as they are
+    for edge in edges:
+        flat = np.flatnonzero(edge['flat'])
+        runs.append((segments[flat], edge['ymin'][flat], edge['xmin'][flat], edge['xmax'][flat]))
+
+    # Then every scanline the polygon touches
+    polygon_ymin = np.min([edge['ymin'] for edge in edges], axis=0)
+    polygon_ymax = np.max([edge['ymax'] for edge in edges], axis=0)
+    first_row = np.maximum(polygon_ymin, 0)
+    row_counts = np.maximum(np.minimum(polygon_ymax, height - 1) - first_row + 1, 0)
+
+    rows = np.repeat(segments, row_counts)
+    ys = np.arange(len(rows)) - np.repeat(np.cumsum(row_counts) - row_counts, row_counts) + first_row[rows]
+
+    # Every edge's numbers, lined up with the scanlines
+    edges = [{key: values[rows] for key, values in edge.items()} for edge in edges]
+    polygon_ymax = polygon_ymax[rows]
+
+    def x_at(edge, y, where=slice(None)):
+        return (y - edge['y0'][where]).astype(np.float32) * edge['dx'][where] + edge['x0'][where].astype(np.float32)
+
+    crossings = []
+    for i, current in enumerate(edges):
+        crossing = ~current['flat'] & (ys >= current['ymin']) & (ys <= current['ymax'])
+        xs = x_at(current, ys)
+
+        # Needed to draw consistent polygons
+        doubled = crossing & (ys == current['ymax']) & (ys < polygon_ymax)
+
+        # Connect discontiguous corners. This only ever happens at the ends of an edge, so only look there.
+        corners = np.flatnonzero(crossing & ~doubled & ((ys == current['ymin']) | (ys == current['ymax']))
+                                 & (current['dx'] != 0))
+        if i and len(corners):
+            corner_ys = ys[corners]
+            corner_xs = xs[corners]
+            offsets = np.where(corner_ys == current['ymax'][corners], -1, 1)
+            adjacent_x = x_at(current, corner_ys + offsets, corners)
+            unjoined = np.ones(len(corners), dtype=bool)
+
+            for other in edges[:i]:
+                other_ymin, other_ymax = other['ymin'][corners], other['ymax'][corners]
+                joined = unjoined & ~other['flat'][corners] & (other['dx'][corners] != 0) \
+                    & ((corner_ys == other_ymin) | (corner_ys == other_ymax)) \
+                    & (corner_ys + offsets >= other_ymin) & (corner_ys + offsets <= other_ymax) \
+                    & (_roundf(corner_xs) == _roundf(x_at(other, corner_ys, corners)))
+
+                other_adjacent_x = x_at(other, corner_ys + offsets, corners)
+                one = np.float32(1)
+                past = joined & (corner_xs > adjacent_x + one) & (corner_xs > other_adjacent_x + one)
+                short = joined & ~past & (corner_xs < adjacent_x - one) & (corner_xs < other_adjacent_x - one)
+                corner_xs = np.where(past, _roundf(np.maximum(adjacent_x, other_adjacent_x)) + one, corner_xs)
+                corner_xs = np.where(short, _roundf(np.minimum(adjacent_x, other_adjacent_x)) - one, corner_xs)
+                unjoined &= ~joined
+
+            xs[corners] = corner_xs
+
+        crossings.append(np.where(crossing, xs, np.float32(np.inf)))
+        crossings.append(np.where(doubled, xs, np.float32(np.inf)))
+
+    crossings = np.sort(np.stack(crossings, axis=1), axis=1)
+    crossing_counts = np.isfinite(crossings).sum(axis=1)
+
+    # Fill between each pair - an odd one out at the end gets left alone
+    for pair in range(len(edges)):
+        filled = np.flatnonzero(2 * pair + 1 < crossing_counts)
+        runs.append((rows[filled], ys[filled], _round_up(crossings[filled, 2 * pair]),
+                     _round_down(crossings[filled, 2 * pair + 1])))
+
+    # Segments that go nowhere are just a point
+    points = np.flatnonzero((dx == 0) & (dy == 0))
+    runs.append((points, y0[points], x0[points], x0[points]))
+
+    return tuple(np.concatenate(column) for column in zip(*runs))
+
+
+def render_thumbnails(paths, height, width, line_thiccness, xpad=0, ypad=0):
+    """
+    Draw a batch of gestures at once, each as a line fading from green to blue on white.
+    For line_thiccness of 2 and up, this is pixel for pixel what ImageDraw.line draws one segment at a time.
+
+    :param paths: Standardized bearings of every gesture, all the same length
+    :type paths: np.array or list of np.array
+    :return: RGBA pixels, shaped (gestures, height, width, 4)
+    :rtype: np.array
+    """
+
+    paths = np.asarray(paths, dtype=np.float64)
+    if paths.ndim == 2:
+        paths = paths[np.newaxis]
+
+    count, path_length = paths.shape[:2]
+    output = np.full((count, height, width, 4), 255, dtype=np.uint8)
+    if not count or path_length < 2:
+        return output
+
+    centers = (paths.max(axis=1) - paths.min(axis=1))[:, np.newaxis, :] / 2
+    # ImageDraw chops coordinates down to whole pixels, towards zero
+    points = np.trunc((paths + 0.5 - centers) * [width - xpad * 2, height - ypad * 2]).astype(np.int64)
+
+    starts = points[:, :-1].reshape(-1, 2)
+    ends = points[:, 1:].reshape(-1, 2)
+    owners, ys, first_xs, last_xs = _wide_line_spans(starts[:, 0], starts[:, 1], ends[:, 0], ends[:, 1],
+                                                     line_thiccness, height)
+
+    # Clip to the image the same way PIL does, then turn runs into pixels
+    first_xs = np.maximum(first_xs, 0)
+    last_xs = np.minimum(last_xs, width - 1)
+    inside = (ys >= 0) & (ys < height) & (first_xs <= last_xs)
+    owners, ys, first_xs, last_xs = owners[inside], ys[inside], first_xs[inside], last_xs[inside]
+
+    lengths = last_xs - first_xs + 1
+    run_numbers = np.repeat(np.arange(len(lengths)), lengths)
+    xs = np.arange(len(run_numbers)) - np.repeat(np.cumsum(lengths) - lengths, lengths) + first_xs[run_numbers]
+    ys, owners = ys[run_numbers], owners[run_numbers]
+
+    # Later segments are drawn over earlier ones, same as drawing them one at a time
+    gestures = owners // (path_length - 1)
+    pixels = (gestures * height + ys) * width + xs
+    top = np.full(count * height * width, -1, dtype=np.int32)
+    np.maximum.at(top, pixels, owners.astype(np.int32))
+
+    drawn = np.flatnonzero(top >= 0)
+    output.reshape(-1, 4)[drawn] = _color_ramp(path_length)[top[drawn] % (path_length - 1)]
+
+    return output
+
+
+def tile_sprites(sprites, columns):
+    """
+    :param sprites: Same-sized RGBA images, shaped (count, height, width, 4)
+    :type sprites: np.array
+    :return: The sprites laid out in rows, left to right, padded with white
+    :rtype: np.array
+    """
+    count, height, width = sprites.shape[:3]
+    columns = max(1, min(count, columns))
+    rows = (count + columns - 1) // columns
+
+    padded = np.full((rows * columns, height, width, 4), 255, dtype=np.uint8)
+    padded[:count] = sprites
+    return padded.reshape(rows, columns, height, width, 4).swapaxes(1, 2).reshape(rows * height, columns * width, 4)
+
+
+class SpriteSheet:
+    """
+    Every cached thumbnail for one glyph, packed into a single PNG, plus a JSON index of which slot is whose.
+    """
+
+    columns = 20
+
+    def __init__(self, png_pathspec, index_pathspec):
+        self.png_pathspec = png_pathspec
+        self.index_pathspec = index_pathspec
+
+        self.slots = {}
+        self.sheet = None
+        self.sprite_size = None
+        self.new_sprites = {}
+
+        if os.path.isfile(index_pathspec) and os.path.isfile(png_pathspec):
+            try:
+                with open(index_pathspec, 'r') as f:
+                    index = json.load(f)
+                self.sprite_size = tuple(index['size'])
+                self.slots = {key: slot for slot, key in enumerate(index['keys'])}
+                with Image.open(png_pathspec) as sheet:
+                    self.sheet = np.asarray(sheet.convert('RGBA'))
+            except (OSError, ValueError, KeyError):
+                logging.getLogger('ThumbnailCache').warning(
+                    'Sprite sheet {} is unreadable, starting it over'.format(png_pathspec))
+                self.slots = {}
+                self.sheet = None
+
+    def __contains__(self, key):
+        return key in self.new_sprites or (self.sheet is not None and key in self.slots)
+
+    @property
+    def dirty(self):
+        return bool(self.new_sprites)
+
+    def get(self, key):
+        """
+        :return: RGBA pixels, shaped (height, width, 4)
+        :rtype: np.array
+        """
+        if key in self.new_sprites:
+            return self.new_sprites[key]
+
+        slot = self.slots.get(key)
+        if slot is None or self.sheet is None:
+            return None
+
+        width, height = self.sprite_size
+        x = (slot % self.columns) * width
+        y = (slot // self.columns) * height
+        return self.sheet[y:y + height, x:x + width]
+
+    def put(self, key, sprite):
+        self.new_sprites[key] = sprite
+
+    def save(self, keys_to_keep=None):
+        """
+        Rewrite the sheet with everything old and new.
+
+        :param keys_to_keep: Sprites to write out, or None for all of them. Anything else is dropped.
+        :type keys_to_keep: set
+        """
+
+        keys = list(self.slots) + [key for key in self.new_sprites if key not in self.slots]
+        if keys_to_keep is not None:
+            keys = [key for key in keys if key in keys_to_keep]
+
+        sprites = [self.get(key) for key in keys]
+        sprites = [(key, sprite) for key, sprite in zip(keys, sprites) if sprite is not None]
+
+        if not sprites:
+            for pathspec in (self.png_pathspec, self.index_pathspec):
+                if os.path.exists(pathspec):
+                    os.remove(pathspec)
+            self.slots = {}
+            self.sheet = None
+            self.new_sprites = {}
+            return
+
+        height, width = sprites[0][1].shape[:2]
+        sheet = tile_sprites(np.stack([sprite for key, sprite in sprites]), self.columns)
+
+        Image.fromarray(sheet, 'RGBA').save(self.png_pathspec + '.tmp', format='PNG')
+        with open(self.index_pathspec + '.tmp', 'w') as f:
+            json.dump({'size': [width, height], 'keys': [key for key, sprite in sprites]}, f)
+
+        os.replace(self.png_pathspec + '.tmp', self.png_pathspec)
+        os.replace(self.index_pathspec + '.tmp', self.index_pathspec)
+
+        self.sheet = sheet
+        self.sprite_size = (width, height)
+        self.slots = {key: slot for slot, (key, sprite) in enumerate(sprites)}
+        self.new_sprites = {}
+
+
+class ThumbnailCache:
+    """
+    Hands out PhotoImages of gestures. The most recently used ones stay in memory, everything rendered gets
+    written to per-glyph sprite sheets on disk, and only cache misses get rendered from scratch.
+    Entries are keyed by UUID and a hash of the bearings, so reprocessed gestures get new thumbnails.
+    """
+
+    logger = logging.getLogger('ThumbnailCache')
+
+    def __init__(self, render, directory=None, capacity=1000, loaded_sheets=4):
+        """
+        :param render: Draws a batch of gestures' bearings, like render_thumbnails
+        :type render: callable
+        :param directory: Where to keep the sprite sheets, or None to keep them in memory only
+        :type directory: str
+        :param capacity: PhotoImages to keep around
+        :type capacity: int
+        :param loaded_sheets: Sprite sheets to keep in memory. Ones with new thumbnails get saved on their way out.
+        :type loaded_sheets: int
+        """
+        self.render = render
+        self.directory = directory
+        self.capacity = capacity
+        self.loaded_sheets = loaded_sheets
+
+        self._photos = OrderedDict()
+        self._sheets = OrderedDict()
+        self._unsheeted = OrderedDict()  # (glyph, sprite) of thumbnails rendered while there was no directory
+
+    def set_directory(self, directory):
+        """
+        Switch to another training set's sprite sheets, saving anything new for the old one first.
+        PhotoImages already made stay cached, and anything rendered without a directory goes on the new one's sheets.
+        """
+        if directory != self.directory:
+            self.flush()
+            self.directory = directory
+            self._sheets.clear()
+
+            if directory is not None:
+                for key, (glyph, sprite) in self._unsheeted.items():
+                    sheet = self._sheet_for(glyph)
+                    if key not in sheet:
+                        sheet.put(key, sprite)
+                self._unsheeted.clear()
+
+    def get(self, gesture):
+        """
+        :type gesture: Gesture
+        :rtype: ImageTk.PhotoImage
+        """
+        key = thumbnail_key(gesture)
+
+        photo = self._photos.get(key)
+        if photo is not None:
+            self._photos.move_to_end(key)
+            return photo
+
+        if self.directory is None:
+            sprite = self.render([gesture.bearings])[0]
+
+            self._unsheeted[key] = (gesture.glyph, sprite)
+            if len(self._unsheeted) > self.capacity:
+                self._unsheeted.popitem(last=False)
+        else:
+            self.prefetch([gesture])
+            sprite = self._sheet_for(gesture.glyph).get(key)
+
+        photo = ImageTk.PhotoImage(image=Image.fromarray(sprite, 'RGBA'))
+        self._photos[key] = photo
+        if len(self._photos) > self.capacity:
+            self._photos.popitem(last=False)
+
+        return photo
+
+    def prefetch(self, gestures):
+        """
+        Render every gesture that isn't on a sprite sheet yet, all in one go
+
+        :type gestures: list of Gesture
+        """
+        if self.directory is None:
+            return
+
+        missing = []
+        for gesture in gestures:
+            key = thumbnail_key(gesture)
+            if key not in self._photos and key not in self._sheet_for(gesture.glyph):
+                missing.append((gesture, key))
+
+        if not missing:
+            return
+
+        sprites = self.render([gesture.bearings for gesture, key in missing])
+        for (gesture, key), sprite in zip(missing, sprites):
+            self._sheet_for(gesture.glyph).put(key, sprite)
+
+        self.logger.debug('Rendered {} thumbnails'.format(len(missing)))
+
+    def flush(self, training_set=None):
+        """
+        Write new thumbnails to disk.
+
+        :param training_set: If given, thumbnails of gestures that aren't in it anymore get dropped from the sheets
+        :type training_set: GestureTrainingSet
+        """
+        if self.directory is None:
+            return
+
+        dirty = [(glyph, sheet) for glyph, sheet in self._sheets.items() if sheet.dirty]
+        if not dirty:
+            return
+
+        os.makedirs(self.directory, exist_ok=True)
+
+        for glyph, sheet in dirty:
+            keys_to_keep = None
+            if training_set is not None:
+                keys_to_keep = {thumbnail_key(example) for example in training_set.get_examples_for(glyph)}
+            sheet.save(keys_to_keep)
+
+        self.logger.debug('Saved {} sprite sheets to {}'.format(len(dirty), self.directory))
+        self._trim_sheets()
+
+    def _sheet_for(self, glyph):
+        sheet = self._sheets.get(glyph)
+        if sheet is not None:
+            self._sheets.move_to_end(glyph)
+            return sheet
+
+        # Glyphs include control characters, so name the files by code point
+        name = '_'.join('{:04x}'.format(ord(character)) for character in glyph) or 'unlabeled'
+        sheet = SpriteSheet(os.path.join(self.directory, name + '.png'), os.path.join(self.directory, name + '.json'))
+
+        self._sheets[glyph] = sheet
+        self._trim_sheets()
+        return sheet
+
+    def _trim_sheets(self):
+        # The newest sheet always stays, since somebody's about to use it
+        while len(self._sheets) > max(1, self.loaded_sheets):
+            glyph, sheet = self._sheets.popitem(last=False)
+
+            # Save unsaved thumbnails on the way out, rather than holding every sheet we've touched until the next save
+            if sheet.dirty:
+                os.makedirs(self.directory, exist_ok=True)
+                sheet.save()
+                self.logger.debug('Saved sprite sheet for {!r} to make room'.format(glyph))
@@ -1,5 +1,4 @@
 import logging
-import time
 
 import numpy as np
 import quaternion
@@ -123,192 +122,257 @@ def custom_euler_to_quat(yaw, pitch, roll):
     return q
 
 
-def process_samples(samples: np.array, desired_length):
-    logger = logging.getLogger('process_samples()')
-
-    benchmark = time.perf_counter()
-
-    def clock_that_step(description, benchmark):
-        logger.debug('{} took {:.0f} ms'.format(description.capitalize(), (time.perf_counter() - benchmark) * 1000))
-        return time.perf_counter()
-
-    if not len(samples) > 1:
-        raise AttributeError('Sample list is empty')
-
-    logger.debug('Normalizing:\n{0!r}'.format(samples))
+def standardize_raw_bearings(raw_bearings, gesture_cone_angle):
+    """
+    Turn a gesture's raw (yaw, pitch, ...) readings into the trace process_samples expects,
+    the same way handle_sample does while recording: relative to the first reading, constrained to the gesture
+    cone, scaled to 0.0-1.0 with the first point at (0.5, 0.5).
 
-    # Strip redundant bearings
-    unique_bearings = [samples[0]]
-    for index, bearing in enumerate(samples):
-        if not index:
-            continue
+    :type raw_bearings: np.array
+    :type gesture_cone_angle: float
+    :rtype: np.array
+    """
 
-        if np.isclose(bearing[0], samples[index - 1, 0]) and np.isclose(bearing[1], samples[index - 1, 1]):
-            logger.debug('Discarding redundant point ({:.3f}, {:.3f})'.format(bearing[0], bearing[1]))
-        else:
-            unique_bearings.append(bearing)
+    raw_bearings = np.asarray(raw_bearings, dtype=float)[:, :2]
 
-    samples = np.array(unique_bearings)
+    bearings = raw_bearings[0] - raw_bearings
+    bearings[bearings > np.pi] -= 2 * np.pi
+    bearings[bearings < -np.pi] += 2 * np.pi
 
-    benchmark = clock_that_step('Stripping dupes', benchmark)
+    bearings = np.clip(bearings, -1 / 2 * gesture_cone_angle, 1 / 2 * gesture_cone_angle)
+    bearings /= gesture_cone_angle
+    bearings += 0.5
 
-    # Remap standardized bearings so gestures are the same size
-    yaw_min = min(samples[:, 0])
-    yaw_max = max(samples[:, 0])
+    return bearings
 
-    pitch_min = min(samples[:, 1])
-    pitch_max = max(samples[:, 1])
 
-    magnitude = np.linalg.norm([yaw_max - yaw_min, pitch_max - pitch_min])
-    fudge_factor = 1 / 10
+def process_samples(samples: np.array, desired_length):
+    """
+    Normalize a raw (yaw, pitch) trace into desired_length evenly-spaced points scaled into 0-1.
+    Consecutive duplicates are dropped, slop near the start and end points is trimmed,
+    then the curve is resampled by arc length.
+    This runs on the Tk thread after every gesture, so it's all vectorized - no per-point loops or logging.
+
+    :type samples: np.array
+    :type desired_length: int
+    :rtype: np.array
+    :raises AttributeError: If there are fewer than two samples
+    :raises ValueError: If every sample is the same point
+    """
 
-    logger.debug('Yaw min: {:.3f} Pitch min: {:.3f} Yaw max: {:.3f} Pitch max: {:.3f} Trim length: {:.3f}'.format(
-        yaw_min, pitch_min, yaw_max, pitch_max, magnitude * fudge_factor))
+    if not len(samples) > 1:
+        raise AttributeError('Sample list is empty')
 
-    early_crap_count = 0
+    samples = np.asarray(samples, dtype=float)[:, :2]
 
-    for i in range(1, len(samples)):
-        if np.linalg.norm([samples[i, 0] - samples[0, 0],
-                           samples[i, 1] - samples[0, 1]]) > magnitude * fudge_factor:
-            logger.debug('Done stripping leading points - ({:.3f}, {:.3f}) is far enough from start point '
-                         '({:.3f}, {:.3f}). Had to be {:.3f} units away, and is {:.3f}.'.format(
-                samples[i, 0], samples[i, 1], samples[0, 0], samples[0, 1],
-                magnitude * fudge_factor,
-                np.linalg.norm([samples[i, 0] - samples[0, 0],
-                                samples[i, 1] - samples[0, 1]])))
-            break
-        else:
-            logger.debug('Stripping leading point ({:.3f}, {:.3f}) - too close to start point ({:.3f}, {:.3f}). '
-                         'Must be {:.3f} units away, but is {:.3f}.'.format(
-                samples[i, 0], samples[i, 1], samples[0, 0], samples[0, 1],
-                magnitude * fudge_factor,
-                np.linalg.norm([samples[i, 0] - samples[0, 0],
-                                samples[i, 1] - samples[0, 1]])))
-            early_crap_count += 1
+    # Strip redundant bearings - each point is compared to the one before it in the original trace
+    keepers = np.ones(len(samples), dtype=bool)
+    keepers[1:] = ~_isclose(samples[1:], samples[:-1]).all(axis=1)
+    samples = samples[keepers]
 
-    start_point = samples[0]
+    # Remap standardized bearings so gestures are the same size
+    mins = samples.min(axis=0)
+    spans = samples.max(axis=0) - mins
 
-    trimmed = samples[early_crap_count + 1:].tolist()
+    magnitude = np.sqrt(spans.dot(spans))  # Same as np.linalg.norm, minus the overhead
+    fudge_factor = 1 / 10
+    trim_length = magnitude * fudge_factor
 
-    samples = np.array([start_point] + trimmed)
+    # Strip leading points that are too close to the start point, but keep the start point itself
+    far_from_start = np.flatnonzero(_distances_from(samples[1:], samples[0]) > trim_length)
+    first_keeper = far_from_start[0] + 1 if len(far_from_start) else len(samples)
+    samples = np.concatenate((samples[:1], samples[first_keeper:]))
 
-    benchmark = clock_that_step('Trimming early slop', benchmark)
+    # Same goes for the endpoint. The start point is never stripped here.
+    far_from_end = np.flatnonzero(_distances_from(samples[1:-1], samples[-1]) > trim_length)
+    last_keeper = far_from_end[-1] + 1 if len(far_from_end) else 0
+    samples = np.concatenate((samples[:last_keeper + 1], samples[-1:]))
 
-    # logger.debug('Early crap stripped: {}'.format(samples))
+    # Standardize bearings 'curve' to evenly-spaced points
+    cumulative_segment_lengths = np.zeros(len(samples))
+    np.cumsum(_distances_from(samples[1:], samples[:-1]), out=cumulative_segment_lengths[1:])
 
-    late_crap_count = 0
+    curve_length = cumulative_segment_lengths[-1]
+    if not curve_length > 0:
+        raise ValueError('Gesture has no length - every point in it is the same')
 
-    for i in range(2, len(samples)):
-        if np.linalg.norm([samples[-i, 0] - samples[- 1, 0],
-                           samples[-i, 1] - samples[- 1, 1]]) > magnitude * fudge_factor:
-            logger.debug('Done stripping trailing points - ({:.3f}, {:.3f}) is far enough from endpoint '
-                         '({:.3f}, {:.3f}). Had to be {:.3f} units away, and is {:.3f}.'.format(
-                samples[-i, 0], samples[-i, 1], samples[-1, 0], samples[-1, 1],
-                magnitude * fudge_factor,
-                np.linalg.norm([samples[-i, 0] - samples[- 1, 0],
-                                samples[-i, 1] - samples[- 1, 1]])))
+    target_segment_length = curve_length / (desired_length - 1)
+    target_lengths = np.arange(1, desired_length) * target_segment_length
+
+    # Each point lands in the first segment whose end is past the target length, or close enough to it
+    first_longer_samples = np.searchsorted(cumulative_segment_lengths, target_lengths)
+    while True:
+        close_enough = _isclose(cumulative_segment_lengths[first_longer_samples - 1], target_lengths)
+        close_enough &= first_longer_samples > 0
+        if not close_enough.any():
             break
-        else:
-            logger.debug('Stripping trailing point ({:.3f}, {:.3f}) - too close to endpoint ({:.3f}, {:.3f}). '
-                         'Must be {:.3f} units away, but is {:.3f}.'.format(
-                samples[-i, 0], samples[-i, 1], samples[-1, 0], samples[-1, 1],
-                magnitude * fudge_factor,
-                np.linalg.norm([samples[-i, 0] - samples[- 1, 0],
-                                samples[-i, 1] - samples[- 1, 1]])))
-            late_crap_count += 1
-
-    if late_crap_count:
-        endpoint = samples[-1]
-        trimmed = samples[:(late_crap_count + 1) * -1].tolist()
-        samples = np.array(trimmed + [endpoint])
-
-    logger.debug('Late crap stripped: {}'.format(samples))
+        first_longer_samples -= close_enough
 
-    benchmark = clock_that_step('Trimming late slop', benchmark)
+    if first_longer_samples[-1] >= len(cumulative_segment_lengths):
+        raise AttributeError("Entire line isn't long enough?!")
 
-    # Standardize bearings 'curve' to evenly-spaced points
+    low_points = samples[first_longer_samples - 1]
+    high_points = samples[first_longer_samples]
+    low_lengths = cumulative_segment_lengths[first_longer_samples - 1]
+    position_along_segment = ((target_lengths - low_lengths) /
+                              (cumulative_segment_lengths[first_longer_samples] - low_lengths))
 
-    cumulative_segment_lengths = [0]
-    for index, sample in enumerate(samples):
-        if index == 0:
-            continue
+    standardized_bearings = np.empty((desired_length, 2))
+    standardized_bearings[0] = samples[0]
+    standardized_bearings[1:] = low_points + position_along_segment[:, np.newaxis] * (high_points - low_points)
 
-        segment_length = np.linalg.norm([sample[0] - samples[index - 1][0], sample[1] - samples[index - 1][1]])
+    # Move lowest and leftest points to the edge, then rescale, preserving proportions
+    standardized_bearings -= mins
+    standardized_bearings /= spans.max()
 
-        cumulative_segment_lengths.append(segment_length + cumulative_segment_lengths[index - 1])
-        logger.debug('Segment ending in point {} length {:.3f} Cumul: {:.3f}'.format(
-            index, segment_length, cumulative_segment_lengths[index]))
+    return standardized_bearings
 
-    curve_length = cumulative_segment_lengths[-1]
-    target_segment_length = curve_length / (desired_length - 1)
 
-    benchmark = clock_that_step('Calculating segment lengths', benchmark)
+def process_samples_batch(traces, desired_length):
+    """
+    Normalize many raw (yaw, pitch) traces in one go - same output as calling process_samples on each of them.
+    The traces are concatenated into one ragged array and processed together, trace boundaries tracked by
+    offset. Only the cumulative curve lengths get padded out to a (traces, longest trace) array.
+
+    :param traces: Variable-length raw traces, each shaped (n, 2) with n > 1
+    :type traces: list of np.array
+    :type desired_length: int
+    :return: Standardized bearings for every trace, shaped (len(traces), desired_length, 2)
+    :rtype: np.array
+    :raises AttributeError: If any trace has fewer than two samples
+    :raises ValueError: If every sample in any trace is the same point
+    """
 
-    # logger.debug(
-    #     'Segment lengths: {} - {} segments, {} points'.format(segment_lengths, len(segment_lengths), len(samples)))
-    logger.debug('Total length: {:.2f} Target segment length: {:.4f}'.format(curve_length, target_segment_length))
+    trace_count = len(traces)
+    if not trace_count:
+        return np.empty((0, desired_length, 2))
 
-    standardized_bearings = [samples[0]]
-    first_longer_sample = 0
+    lengths = np.array([len(trace) for trace in traces])
+    if np.any(lengths < 2):
+        raise AttributeError('Sample list #{} is empty'.format(np.flatnonzero(lengths < 2)[0]))
 
-    for i in range(1, desired_length):
-        target_length = i * target_segment_length
+    samples = np.concatenate([np.asarray(trace, dtype=float)[:, :2] for trace in traces])
+    trace_ids = np.repeat(np.arange(trace_count), lengths)
 
-        logger.debug('Looking to place a point at {:.3f} units along curve'.format(target_length))
+    def keep_only(keepers):
+        kept_samples = samples[keepers]
+        kept_trace_ids = trace_ids[keepers]
+        kept_lengths = np.bincount(kept_trace_ids, minlength=trace_count)
+        kept_starts = np.concatenate(([0], np.cumsum(kept_lengths)[:-1]))
+        positions = np.arange(len(kept_samples)) - kept_starts[kept_trace_ids]
+        return kept_samples, kept_trace_ids, kept_lengths, kept_starts, positions
 
-        if cumulative_segment_lengths[first_longer_sample] > target_length:
-            logger.debug('Previous point at {:.3f} units along curve still works'.format(
-                cumulative_segment_lengths[first_longer_sample]))
+    # Strip redundant bearings, never comparing a trace's first point with the end of the trace before it
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    keepers = np.ones(len(samples), dtype=bool)
+    keepers[1:] = ~_isclose(samples[1:], samples[:-1]).all(axis=1)
+    keepers[starts] = True
+    samples, trace_ids, lengths, starts, positions = keep_only(keepers)
 
-        else:
-            while cumulative_segment_lengths[first_longer_sample] < target_length \
-                    and not np.isclose(cumulative_segment_lengths[first_longer_sample], target_length):
-                logger.debug(
-                    'Cumulative length of {:.3f} is too short - advancing to segment ending at point {}'.format(
-                        cumulative_segment_lengths[first_longer_sample], first_longer_sample))
-                first_longer_sample += 1
+    # Remap standardized bearings so gestures are the same size
+    mins = np.minimum.reduceat(samples, starts, axis=0)
+    spans = np.maximum.reduceat(samples, starts, axis=0) - mins
 
-                if first_longer_sample >= len(cumulative_segment_lengths):
-                    raise AttributeError("Entire line isn't long enough?!")
+    fudge_factor = 1 / 10
+    trim_lengths = _distances_from(spans, 0) * fudge_factor
+
+    # Strip leading points that are too close to their trace's start point
+    far_from_start = _distances_from(samples, samples[starts][trace_ids]) > trim_lengths[trace_ids]
+    first_keepers = np.minimum.reduceat(
+        np.where(far_from_start & (positions > 0), positions, lengths[trace_ids]), starts)
+    samples, trace_ids, lengths, starts, positions = keep_only(
+        (positions == 0) | (positions >= first_keepers[trace_ids]))
+
+    # Same goes for endpoints. Start points are never stripped here.
+    ends = starts + lengths - 1
+    is_endpoint = positions == lengths[trace_ids] - 1
+    far_from_end = _distances_from(samples, samples[ends][trace_ids]) > trim_lengths[trace_ids]
+    last_keepers = np.maximum.reduceat(
+        np.where(far_from_end & (positions > 0) & ~is_endpoint, positions, 0), starts)
+    samples, trace_ids, lengths, starts, positions = keep_only(
+        (positions <= last_keepers[trace_ids]) | is_endpoint)
+    ends = starts + lengths - 1
+
+    # Standardize bearings 'curves' to evenly-spaced points.
+    # Cumulative lengths are summed per trace in a padded array so they round exactly like process_samples.
+    padded_lengths = np.zeros((trace_count, lengths.max()))
+    segment_ends = np.flatnonzero(positions)
+    padded_lengths[trace_ids[segment_ends], positions[segment_ends]] = _distances_from(
+        samples[segment_ends], samples[segment_ends - 1])
+    np.cumsum(padded_lengths, axis=1, out=padded_lengths)
+    cumulative_segment_lengths = padded_lengths[trace_ids, positions]
+    del padded_lengths
+
+    curve_lengths = cumulative_segment_lengths[ends]
+    if not np.all(curve_lengths > 0):
+        raise ValueError('Gesture #{} has no length - every point in it is the same'.format(
+            np.flatnonzero(~(curve_lengths > 0))[0]))
+
+    target_segment_lengths = curve_lengths / (desired_length - 1)
+    target_lengths = np.arange(1, desired_length) * target_segment_lengths[:, np.newaxis]
+
+    # A per-trace searchsorted. Targets are evenly spaced, so count how many targets each cumulative length
+    # reaches (estimated by division, then nudged to match the exact products), then the number of lengths
+    # short of each target falls out of a per-trace histogram of those counts.
+    step_sizes = target_segment_lengths[trace_ids]
+    targets_reached = np.clip(np.floor(cumulative_segment_lengths / step_sizes), 0, desired_length - 1).astype(int)
+    while True:
+        overshot = (targets_reached > 0) & (targets_reached * step_sizes > cumulative_segment_lengths)
+        if not overshot.any():
+            break
+        targets_reached -= overshot
+    while True:
+        undershot = ((targets_reached < desired_length - 1)
+                     & ((targets_reached + 1) * step_sizes <= cumulative_segment_lengths))
+        if not undershot.any():
+            break
+        targets_reached += undershot
 
-        low_point = samples[first_longer_sample - 1]
-        high_point = samples[first_longer_sample]
-        position_along_segment = ((target_length - cumulative_segment_lengths[first_longer_sample - 1]) /
-                                  (cumulative_segment_lengths[first_longer_sample]
-                                   - cumulative_segment_lengths[first_longer_sample - 1]))
+    histogram = np.bincount(trace_ids * desired_length + targets_reached, minlength=trace_count * desired_length)
+    row_starts = starts[:, np.newaxis]
+    first_longer_samples = np.cumsum(histogram.reshape(trace_count, desired_length), axis=1)[:, :-1]
+    first_longer_samples += row_starts  # Now indexes into samples
 
-        standardized_point_x = low_point[0] + position_along_segment * (high_point[0] - low_point[0])
-        standardized_point_y = low_point[1] + position_along_segment * (high_point[1] - low_point[1])
+    while True:
+        close_enough = _isclose(cumulative_segment_lengths[first_longer_samples - 1], target_lengths)
+        close_enough &= first_longer_samples > row_starts
+        if not close_enough.any():
+            break
+        first_longer_samples -= close_enough
 
-        standardized_point = [standardized_point_x, standardized_point_y]
+    if np.any(first_longer_samples[:, -1] > ends):
+        raise AttributeError("Entire line #{} isn't long enough?!".format(
+            np.flatnonzero(first_longer_samples[:, -1] > ends)[0]))
 
-        logger.debug('Placed point {:.3f} units ({:.0f}%) along the {:.3f} line between {} and {} ==> {}'
-                     .format(target_length - cumulative_segment_lengths[first_longer_sample - 1],
-                             position_along_segment * 100,
-                             cumulative_segment_lengths[first_longer_sample]
-                             - cumulative_segment_lengths[first_longer_sample - 1],
-                             low_point, high_point, standardized_point))
+    # Wrap around within the trace like process_samples does, in the degenerate case of a target at 0
+    low_samples = np.where(first_longer_samples > row_starts, first_longer_samples - 1, ends[:, np.newaxis])
 
-        standardized_bearings.append(standardized_point)
+    low_points = samples[low_samples]
+    high_points = samples[first_longer_samples]
+    low_lengths = cumulative_segment_lengths[low_samples]
+    position_along_segment = ((target_lengths - low_lengths) /
+                              (cumulative_segment_lengths[first_longer_samples] - low_lengths))
 
-    logger.debug('Done interpolating. Scaling into 0-1 fractional dims')
+    standardized_bearings = np.empty((trace_count, desired_length, 2))
+    standardized_bearings[:, 0] = samples[starts]
+    standardized_bearings[:, 1:] = low_points + position_along_segment[..., np.newaxis] * (high_points - low_points)
 
-    benchmark = clock_that_step('Interpolation', benchmark)
+    # Move lowest and leftest points to the edge, then rescale, preserving proportions
+    standardized_bearings -= mins[:, np.newaxis]
+    standardized_bearings /= spans.max(axis=1)[:, np.newaxis, np.newaxis]
 
-    # Move lowest and leftest points to the edge
-    standardized_bearings = [[y - yaw_min, p - pitch_min] for y, p in standardized_bearings]
+    return standardized_bearings
 
-    # Rescale, preserving proportions
-    total_width = yaw_max - yaw_min
-    total_height = pitch_max - pitch_min
 
-    standardized_bearings = np.array([[custom_interpolate(y, 0, max(total_width, total_height), 0, 1),
-                                       custom_interpolate(p, 0, max(total_width, total_height), 0, 1)]
-                                      for y, p in standardized_bearings])
+def _isclose(a, b):
+    # np.isclose with default tolerances, but without the overhead - this gets called for every gesture
+    return np.abs(a - b) <= 1e-08 + 1e-05 * np.abs(b)
 
-    clock_that_step('Resizing', benchmark)
 
-    return standardized_bearings
+def _distances_from(points, origins):
+    # Row-wise dot products via matmul round the same as calling np.linalg.norm on each point
+    deltas = points - origins
+    return np.sqrt(np.matmul(deltas[..., np.newaxis, :], deltas[..., :, np.newaxis])[..., 0, 0])
 
 
 def wrapped_delta(old, new):
@@ -340,7 +404,7 @@ class ReadLine:
         i = self.buf.find(b"\n")
         if i >= 0:
             r = self.buf[:i + 1]
-            self.buf = self.buf[i + 1:]
+            del self.buf[:i + 1]
             self.s.timeout = timeout
             return r
 
@@ -355,3 +419,23 @@ class ReadLine:
                 return r
             else:
                 self.buf.extend(data)
+
+    def read_all_lines(self):
+        """
+        Grab everything that's arrived and split it into lines in one go, without waiting for more.
+        An incomplete last line stays buffered for next time.
+
+        :return: Every complete line, without its newline
+        :rtype: list of bytes
+        """
+        waiting = self.s.in_waiting
+        if waiting:
+            self.buf.extend(self.s.read(waiting))
+
+        end = self.buf.rfind(b"\n")
+        if end < 0:
+            return []
+
+        lines = bytes(self.buf[:end]).split(b"\n")
+        del self.buf[:end + 1]
+        return lines
@@ -0,0 +1,259 @@
+import logging
+from queue import Queue
+from tkinter import messagebox
+
+import numpy as np
+
+from somatictrainer import app
+from somatictrainer.app import SomaticTrainerHomeWindow
+from somatictrainer.gestures import Gesture, GestureTrainingSet
+from somatictrainer.inference import InferenceWorker, Recognizer
+from somatictrainer.thumbnails import ThumbnailCache, render_thumbnails
+
+
+class StandInCanvas:
+    """
+    Just enough of a Tk Canvas to lay out the thumbnail grid without a display
+    """
+
+    def __init__(self, height):
+        self.height = height
+        self.top = 0
+        self.scrollregion = None
+        self.windows = {}
+
+    def winfo_height(self):
+        return self.height
+
+    def canvasy(self, y):
+        return self.top + y
+
+    def coords(self, window, x, y):
+        self.windows[window] = (x, y)
+
+    def configure(self, scrollregion):
+        self.scrollregion = scrollregion
+
+    def yview_moveto(self, fraction):
+        self.top = fraction * self.scrollregion[3]
+
+
+class StandInButton:
+    def __init__(self):
+        self.gesture = None
+        self.image = None
+
+    def configure(self, image):
+        self.image = image
+
+
+class StandInMenu:
+    def __init__(self):
+        self.states = {}
+
+    def entryconfigure(self, index, state):
+        self.states[index] = state
+
+
+class StandInCache:
+    def __init__(self):
+        self.gotten = []
+        self.prefetched = []
+
+    def get(self, gesture):
+        self.gotten.append(gesture)
+        return 'thumbnail of {}'.format(gesture.uuid)
+
+    def prefetch(self, gestures):
+        self.prefetched.append(list(gestures))
+
+
+def make_window(examples, canvas_height=150):
+    window = SomaticTrainerHomeWindow.__new__(SomaticTrainerHomeWindow)
+    window.thumbnail_canvas = StandInCanvas(canvas_height)
+    window.thumbnail_cache = StandInCache()
+    window.thumbnail_examples = list(examples)
+    window.thumbnail_buttons = []
+    window.thumbnail_columns = 5
+    window.thumbnail_cell_size = 56
+    window.thumbnail_prefetch_rows = 10
+
+    def make_thumbnail_button():
+        return StandInButton(), len(window.thumbnail_buttons)
+    window.make_thumbnail_button = make_thumbnail_button
+
+    window.update_thumbnail_scrollregion()
+    return window
+
+
+def make_examples(count):
+    rng = np.random.default_rng(0)
+    return [Gesture('a', rng.random((50, 2)), []) for _ in range(count)]
+
+
+def placed(window):
+    return {button.gesture: window.thumbnail_canvas.windows[slot] for button, slot in window.thumbnail_buttons
+            if button.gesture is not None}
+
+
+def test_grid_only_builds_buttons_for_visible_rows():
+    examples = make_examples(1000)
+    window = make_window(examples)
+    window.layout_thumbnails()
+
+    # 150px shows 2 whole rows and change, plus partial rows at the top and bottom
+    assert len(window.thumbnail_buttons) == 4 * 5
+    assert placed(window) == {example: ((i % 5) * 56, (i // 5) * 56) for i, example in enumerate(examples[:20])}
+    assert window.thumbnail_canvas.scrollregion == (0, 0, 5 * 56, 200 * 56)
+
+
+def test_grid_recycles_buttons_when_scrolled():
+    examples = make_examples(1000)
+    window = make_window(examples)
+    window.layout_thumbnails()
+
+    window.thumbnail_canvas.top = 100 * 56 + 10
+    window.layout_thumbnails()
+
+    assert len(window.thumbnail_buttons) == 20
+    assert placed(window) == {example: ((i % 5) * 56, (i // 5) * 56)
+                              for i, example in enumerate(examples[500:520], 500)}
+
+    # Buttons that already show the right gesture don't get their thumbnail fetched again
+    gotten = len(window.thumbnail_cache.gotten)
+    window.layout_thumbnails()
+    assert len(window.thumbnail_cache.gotten) == gotten
+
+
+def test_grid_parks_spare_buttons():
+    window = make_window(make_examples(7))
+    window.layout_thumbnails()
+
+    assert len(placed(window)) == 7
+    parked = [window.thumbnail_canvas.windows[slot] for button, slot in window.thumbnail_buttons
+              if button.gesture is None]
+    assert len(parked) == 13 and all(x < 0 and y < 0 for x, y in parked)
+
+
+def test_grid_prefetches_only_near_the_visible_rows():
+    examples = make_examples(1000)
+    window = make_window(examples)
+    window.layout_thumbnails()
+    assert window.thumbnail_cache.prefetched[-1] == examples[:(4 + 10) * 5]
+
+    window.thumbnail_canvas.top = 100 * 56
+    window.layout_thumbnails()
+    assert window.thumbnail_cache.prefetched[-1] == examples[90 * 5:114 * 5]
+
+
+def make_saving_window(tmp_path):
+    window = SomaticTrainerHomeWindow.__new__(SomaticTrainerHomeWindow)
+    window.training_set = GestureTrainingSet()
+    for example in make_examples(3):
+        window.training_set.add(example)
+    window.open_file_pathspec = str(tmp_path / 'set.db')
+    window.open_file_has_been_modified = True
+    window.change_count_since_last_save = 0
+    window.state = None
+    window.thumbnail_cache = ThumbnailCache(render_thumbnails)
+    window.queue = Queue()
+    window.logger = logging.getLogger('test')
+    return window
+
+
+def finish_saving(window):
+    window.training_set.wait_for_compaction()
+    command = window.queue.get(timeout=10)
+    assert command['type'] == 'saved'
+    window.on_saved(command['pathspec'], command['training-set'], command['future'])
+
+
+def test_saves_only_count_once_theyre_on_disk(tmp_path):
+    window = make_saving_window(tmp_path)
+
+    window.save_file()
+    assert window.open_file_has_been_modified
+    finish_saving(window)
+    assert not window.open_file_has_been_modified
+
+    # Changes made while the save was being written still need saving
+    window.open_file_has_been_modified = True
+    window.save_file()
+    window.training_set.add(make_examples(1)[0])
+    finish_saving(window)
+    assert window.open_file_has_been_modified
+
+
+def test_failed_saves_get_reported(tmp_path, monkeypatch):
+    window = make_saving_window(tmp_path)
+    window.training_set.save(window.open_file_pathspec)
+    errors = []
+    monkeypatch.setattr(messagebox, 'showerror', lambda title, message: errors.append(message))
+
+    def fail(pathspec, examples):
+        raise OSError('Disk full')
+    monkeypatch.setattr(window.training_set, '_save_examples', fail)
+
+    window.save_file()
+    finish_saving(window)
+
+    assert window.open_file_has_been_modified
+    assert len(errors) == 1 and 'Disk full' in errors[0]
+
+
+class Constant(Recognizer):
+    def __call__(self, bearings):
+        return np.ones((len(bearings), len(self.glyphs)))
+
+
+def make_recognizing_window(glyphs):
+    window = SomaticTrainerHomeWindow.__new__(SomaticTrainerHomeWindow)
+    window.training_set = GestureTrainingSet()
+    for glyph in glyphs:
+        window.training_set.add(Gesture(glyph, np.random.random((50, 2)), []))
+    window.inference = InferenceWorker(None)
+    window.model_menu = StandInMenu()
+    window.unload_model_entry_index = 1
+    window.logger = logging.getLogger('test')
+    return window
+
+
+def test_load_model_recognizes_with_the_open_sets_glyphs(monkeypatch):
+    window = make_recognizing_window('ba')
+    loaded = []
+    monkeypatch.setattr(app, 'load_recognizer', lambda pathspec, glyphs: loaded.append((pathspec, glyphs))
+                        or Constant(glyphs))
+
+    assert window.load_model('model.tflite')
+    assert window.inference.has_model
+    assert loaded == [('model.tflite', window.training_set.glyphs_represented)]
+    assert window.model_menu.states[1] == app.NORMAL
+
+    window.unload_model()
+    assert not window.inference.has_model
+    assert window.model_menu.states[1] == app.DISABLED
+
+
+def test_load_model_reports_bad_models(monkeypatch):
+    window = make_recognizing_window('ab')
+    errors = []
+    monkeypatch.setattr(messagebox, 'showerror', lambda title, message: errors.append(message))
+
+    def fail(pathspec, glyphs):
+        raise ValueError('Not a model')
+    monkeypatch.setattr(app, 'load_recognizer', fail)
+
+    assert not window.load_model('model.tflite')
+    assert not window.inference.has_model
+    assert len(errors) == 1 and 'Not a model' in errors[0]
+
+
+def test_load_model_needs_a_training_set(monkeypatch):
+    window = make_recognizing_window('')
+    messages = []
+    monkeypatch.setattr(messagebox, 'showinfo', lambda title, message: messages.append(message))
+    monkeypatch.setattr(app, 'load_recognizer', lambda pathspec, glyphs: Constant(glyphs))
+
+    assert not window.load_model('model.tflite')
+    assert not window.inference.has_model
+    assert len(messages) == 1
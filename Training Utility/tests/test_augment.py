@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from somatictrainer.augment import augment_raw_bearings, distort_traces
+from somatictrainer.gestures import gesture_cone_angle, standard_gesture_length
+from somatictrainer.util import process_samples, standardize_raw_bearings
+
+
+def make_circle(radius, count=60):
+    # Most of a circle, as raw (yaw, pitch, roll) readings
+    angles = np.linspace(0, 1.5 * np.pi, count)
+    return np.column_stack((radius * np.cos(angles) - radius, radius * np.sin(angles), np.zeros(count)))
+
+
+def test_undistorted_traces_come_back_as_they_were():
+    rng = np.random.default_rng(0)
+    traces = [np.cumsum(rng.random((count, 2)) * 0.01, axis=0) for count in rng.integers(2, 80, 16)]
+
+    distorted = distort_traces(traces, rng, max_rotation=0, max_stretch=0, jitter=0)
+    assert all(np.allclose(trace, output) for trace, output in zip(traces, distorted))
+
+
+@pytest.mark.parametrize('radius', [0.005, 0.05, 0.5])
+def test_jitter_scales_with_the_gesture(radius):
+    raw_bearings = make_circle(radius)
+    source = process_samples(standardize_raw_bearings(raw_bearings, gesture_cone_angle), standard_gesture_length)
+
+    augmented = augment_raw_bearings([raw_bearings] * 32, np.zeros((32, standard_gesture_length, 2)),
+                                     np.random.default_rng(0), max_rotation=0, max_stretch=0)
+
+    # Tiny glyphs get blown up to full size, and their jitter mustn't come with them
+    assert np.abs(augmented - source).mean() < 0.02
+
+
+@pytest.mark.parametrize('distortion', ['max_rotation', 'max_stretch', 'jitter'])
+def test_every_distortion_survives_processing(distortion):
+    # Anything process_samples undoes is just wasted work
+    raw_bearings = make_circle(0.05)
+    source = process_samples(standardize_raw_bearings(raw_bearings, gesture_cone_angle), standard_gesture_length)
+    distortions = dict({'max_rotation': 0, 'max_stretch': 0, 'jitter': 0}, **{distortion: 0.2})
+
+    augmented = augment_raw_bearings([raw_bearings] * 32, np.zeros((32, standard_gesture_length, 2)),
+                                     np.random.default_rng(0), **distortions)
+
+    assert np.abs(augmented - source).mean() > 0.01
@@ -0,0 +1,287 @@
+import os
+import pickle
+
+import numpy as np
+import pytest
+
+from somatictrainer.gestures import Gesture, GestureTrainingSet, raw_sample_dtype
+
+
+def make_gesture(rng, glyph='a', raw_length=10):
+    raw_data = np.zeros(raw_length, dtype=raw_sample_dtype)
+    raw_data['b'] = rng.random((raw_length, 3))
+    raw_data['t'] = 1000
+    return Gesture(glyph, rng.random((50, 2)), raw_data)
+
+
+def make_training_set(count=20, seed=0):
+    rng = np.random.default_rng(seed)
+    training_set = GestureTrainingSet()
+    for i in range(count):
+        training_set.add(make_gesture(rng, 'abc'[i % 3], raw_length=i % 7))
+    return training_set
+
+
+def uuids(training_set):
+    return {example.uuid for example in training_set.examples}
+
+
+def test_save_columnar_leaves_examples_alone(tmp_path):
+    training_set = make_training_set()
+    bearings_before = [example.bearings for example in training_set.examples]
+    raw_data_before = [example.raw_data for example in training_set.examples]
+
+    training_set.save_columnar(str(tmp_path / 'set'))
+
+    for example, bearings, raw_data in zip(training_set.examples, bearings_before, raw_data_before):
+        assert example.bearings is bearings
+        assert example.bearings.dtype == np.float64
+        assert example.raw_data is raw_data
+
+
+def test_columnar_generations_survive_resaves(tmp_path):
+    pathspec = str(tmp_path / 'set')
+    training_set = make_training_set()
+    training_set.save_columnar(pathspec)
+
+    loaded = GestureTrainingSet.load(pathspec)
+    loaded.add(make_gesture(np.random.default_rng(1), 'd'))
+    loaded.save_columnar(pathspec)
+    loaded.save_columnar(pathspec)
+
+    # Gestures still mapped to the first generation can still be read after it's cleaned up
+    for original in training_set.examples:
+        example = loaded.get(original.uuid)
+        assert np.allclose(original.bearings, example.bearings)
+        assert np.array_equal(original.raw_data, example.raw_data)
+
+    npy_files = sorted(filename for filename in os.listdir(pathspec) if filename.endswith('.npy'))
+    assert npy_files == sorted('{}.3.npy'.format(os.path.splitext(filename)[0])
+                               for filename in GestureTrainingSet.columnar_files.values())
+
+    reloaded = GestureTrainingSet.load(pathspec)
+    assert uuids(reloaded) == uuids(loaded)
+
+
+def test_loads_version_1_columnar_saves(tmp_path):
+    pathspec = str(tmp_path / 'set')
+    training_set = make_training_set()
+    training_set.save_columnar(pathspec)
+
+    # Rename everything back to how version 1 laid it out
+    column_pathspecs = GestureTrainingSet._columnar_pathspecs(pathspec, {'generation': 1})
+    for name, filename in GestureTrainingSet.columnar_files.items():
+        os.replace(column_pathspecs[name], os.path.join(pathspec, filename))
+    with open(os.path.join(pathspec, GestureTrainingSet.columnar_metadata_file), 'w') as f:
+        f.write('{"version": 1, "count": 20}')
+
+    loaded = GestureTrainingSet.load(pathspec)
+    assert uuids(loaded) == uuids(training_set)
+
+
+def test_journal_truncates_corruption_before_appending(tmp_path):
+    pathspec = str(tmp_path / 'set')
+    training_set = make_training_set(count=3)
+    training_set.save(pathspec)
+
+    rng = np.random.default_rng(1)
+    journaled = make_gesture(rng, 'd')
+    training_set.add(journaled)
+    training_set.save_incremental(pathspec)
+
+    # Garbage that fails to unpickle with something besides UnpicklingError
+    with open(pathspec + GestureTrainingSet.journal_suffix, 'ab') as f:
+        f.write(b'\x80\x04cno_such_module\nThing\n.')
+
+    loaded = GestureTrainingSet.load(pathspec)
+    assert loaded.get(journaled.uuid) is not None
+
+    appended = make_gesture(rng, 'e')
+    loaded.add(appended)
+    loaded.save_incremental(pathspec)
+
+    reloaded = GestureTrainingSet.load(pathspec)
+    assert reloaded.get(journaled.uuid) is not None
+    assert reloaded.get(appended.uuid) is not None
+    assert len(reloaded.examples) == 5
+
+
+def test_background_compaction_leaves_examples_alone(tmp_path):
+    pathspec = str(tmp_path / 'set')
+    training_set = make_training_set()
+    training_set.save_columnar(pathspec)
+    training_set = GestureTrainingSet.load(pathspec, lazy_raw_data=True)
+
+    training_set.add(make_gesture(np.random.default_rng(1), 'd'))
+    bearings_before = [example.bearings for example in training_set.examples]
+
+    training_set.compact(pathspec, background=True)
+    training_set.wait_for_compaction()
+
+    assert all(example.bearings is bearings for example, bearings in zip(training_set.examples, bearings_before))
+    assert uuids(GestureTrainingSet.load(pathspec)) == uuids(training_set)
+
+
+def test_save_columnar_keeps_lazy_raw_data_lazy(tmp_path):
+    pathspec = str(tmp_path / 'set')
+    training_set = make_training_set()
+    training_set.save_columnar(pathspec)
+
+    loaded = GestureTrainingSet.load(pathspec, lazy_raw_data=True)
+    loaded.remove(loaded.examples[3])
+    changed = loaded.examples[5]
+    changed.raw_data = training_set.examples[0].raw_data
+    loaded.add(make_gesture(np.random.default_rng(1), 'd'))
+
+    loaded.save_columnar(pathspec)
+
+    untouched = [example for example in loaded.examples[:-1] if example is not changed]
+    assert all(example._raw_data is None for example in untouched)
+    assert not untouched[0]._raw_data_loader.store._cache
+
+    reloaded = GestureTrainingSet.load(pathspec)
+    for example in loaded.examples:
+        assert np.array_equal(example.raw_data, reloaded.get(example.uuid).raw_data)
+
+
+def test_legacy_gestures_pickle_raw_data_as_dicts():
+    gesture = make_gesture(np.random.default_rng(0), raw_length=3)
+    legacy = gesture.to_legacy()
+
+    state = legacy.__getstate__()
+    assert state['raw_data'] == gesture.raw_data_as_dicts()
+    assert state['bearings'].dtype == np.float64
+    assert '_legacy' not in state
+    assert isinstance(gesture.__getstate__()['raw_data'], np.ndarray)
+
+    unpickled = pickle.loads(pickle.dumps(legacy))
+    assert unpickled.uuid == gesture.uuid
+    assert np.array_equal(unpickled.raw_data, gesture.raw_data)
+
+
+def test_compact_reports_when_its_done(tmp_path):
+    pathspec = str(tmp_path / 'set')
+    training_set = make_training_set()
+    training_set.save_columnar(pathspec)
+
+    training_set.add(make_gesture(np.random.default_rng(1), 'd'))
+    version = training_set.version
+    compaction = training_set.compact(pathspec)
+    training_set.add(make_gesture(np.random.default_rng(2), 'e'))
+
+    assert compaction.result(timeout=10) == version != training_set.version
+
+
+def test_compact_reports_failures(tmp_path, monkeypatch):
+    pathspec = str(tmp_path / 'set')
+    training_set = make_training_set()
+    training_set.save(pathspec)
+
+    def fail(pathspec, examples):
+        raise OSError('Disk full')
+    monkeypatch.setattr(training_set, '_save_examples', fail)
+
+    compaction = training_set.compact(pathspec)
+    training_set.wait_for_compaction()
+    assert isinstance(compaction.exception(), OSError)
+
+    with pytest.raises(OSError):
+        training_set.compact(pathspec, background=False)
+
+
+def check_index(training_set):
+    # Everything the set keeps incrementally, against what it'd be built from scratch
+    assert training_set.glyphs_represented == sorted({example.glyph for example in training_set.examples})
+    char_map = training_set.get_character_map('encoding')
+
+    bearings, labels = training_set.to_training_set()
+    assert np.array_equal(bearings, np.array([example.bearings for example in training_set.examples],
+                                             dtype=np.float32).reshape((-1, 50, 2)))
+    assert labels.tolist() == [char_map[example.glyph] for example in training_set.examples]
+
+    for example in training_set.examples:
+        assert training_set.get(example.uuid) is example
+    assert sum(training_set.count(glyph) for glyph in training_set.glyphs_represented) == len(training_set.examples)
+
+    rebuilt = GestureTrainingSet()
+    rebuilt.examples = list(training_set.examples)
+    rebuilt._rebuild_index()
+    rebuilt_bearings, rebuilt_labels = rebuilt.to_training_set()
+    assert np.array_equal(bearings, rebuilt_bearings) and np.array_equal(labels, rebuilt_labels)
+
+
+def test_index_survives_mixed_changes():
+    rng = np.random.default_rng(0)
+    training_set = GestureTrainingSet()
+    glyphs = 'mdxabz'
+
+    for step in range(300):
+        action = rng.integers(0, 5) if training_set.examples else 0
+        if action <= 1:
+            # New glyphs land before, between and after existing ones, shifting everybody's labels
+            training_set.add(make_gesture(rng, glyphs[rng.integers(0, len(glyphs))]))
+        elif action == 2:
+            training_set.remove(training_set.examples[rng.integers(0, len(training_set.examples))])
+        elif action == 3:
+            doomed = rng.choice(len(training_set.examples), min(3, len(training_set.examples)), replace=False)
+            training_set.remove_many([training_set.examples[i].uuid for i in doomed])
+        else:
+            training_set.move(training_set.examples[rng.integers(0, len(training_set.examples))],
+                              glyphs[rng.integers(0, len(glyphs))])
+
+        check_index(training_set)
+
+
+def test_exports_go_stale_when_the_set_changes():
+    rng = np.random.default_rng(0)
+    training_set = GestureTrainingSet()
+    for glyph in 'bbc':
+        training_set.add(make_gesture(rng, glyph))
+
+    bearings, labels = training_set.to_training_set()
+    assert training_set.to_training_set()[0] is bearings
+    with pytest.raises(ValueError):
+        labels[0] = 5
+
+    training_set.add(make_gesture(rng, 'a'))
+    new_bearings, new_labels = training_set.to_training_set()
+    assert new_bearings is not bearings and len(new_bearings) == 4
+    assert new_labels.tolist() == [1, 1, 2, 0]
+
+    training_set.remove(training_set.examples[0])
+    assert training_set.to_training_set()[1].tolist() == [0, 1, 2]
+
+
+def test_glyph_order_survives_reloading(tmp_path):
+    rng = np.random.default_rng(0)
+    training_set = GestureTrainingSet()
+    for i in range(30):
+        training_set.add(make_gesture(rng, 'ab'[i % 2]))
+
+    for i in (0, 7, 12):
+        training_set.remove(training_set.examples[i])
+    training_set.move(training_set.examples[3], 'b')
+
+    expected = {glyph: [example.uuid for example in training_set.get_examples_for(glyph)] for glyph in 'ab'}
+
+    for pathspec in (str(tmp_path / 'set.db'), str(tmp_path / 'columnar')):
+        if pathspec.endswith('.db'):
+            training_set.save(pathspec)
+        else:
+            training_set.save_columnar(pathspec)
+        loaded = GestureTrainingSet.load(pathspec)
+        assert {glyph: [example.uuid for example in loaded.get_examples_for(glyph)] for glyph in 'ab'} == expected
+
+    # Journaled changes land in the same places too
+    pathspec = str(tmp_path / 'set.db')
+    training_set.remove(training_set.get_examples_for('a')[2])
+    training_set.move(training_set.get_examples_for('a')[0], 'b')
+    training_set.save_incremental(pathspec)
+    training_set.compact(pathspec).result(timeout=10)
+    training_set.move(training_set.get_examples_for('b')[1], 'a')
+    training_set.save_incremental(pathspec)
+
+    loaded = GestureTrainingSet.load(pathspec)
+    for glyph in 'ab':
+        assert [example.uuid for example in loaded.get_examples_for(glyph)] == \
+            [example.uuid for example in training_set.get_examples_for(glyph)]
@@ -0,0 +1,99 @@
+from queue import Queue
+
+import numpy as np
+import pytest
+
+from somatictrainer.gestures import standard_gesture_length
+from somatictrainer.inference import InferenceWorker, KerasRecognizer, Recognizer, TFLiteRecognizer, load_recognizer
+
+tf = pytest.importorskip('tensorflow')
+
+
+@pytest.fixture(scope='module')
+def model():
+    tf.keras.utils.set_random_seed(0)
+    return tf.keras.Sequential([tf.keras.Input((standard_gesture_length, 2)),
+                                tf.keras.layers.Flatten(),
+                                tf.keras.layers.Dense(3, activation='softmax')])
+
+
+def make_bearings(count, seed=0):
+    return np.random.default_rng(seed).random((count, standard_gesture_length, 2))
+
+
+def test_keras_recognizer_matches_predict(model):
+    recognizer = KerasRecognizer(model, 'abc')
+    bearings = make_bearings(8)
+
+    assert np.allclose(recognizer(bearings), model.predict(bearings, verbose=0), atol=1e-6)
+
+    winners = np.argmax(model.predict(bearings, verbose=0), axis=1)
+    assert [glyph for glyph, confidence in recognizer.recognize(bearings)] == ['abc'[winner] for winner in winners]
+
+
+def test_keras_recognizer_never_retraces(model):
+    recognizer = KerasRecognizer(model, 'abc')
+    for count in (1, 5, 64, 3):
+        recognizer(make_bearings(count))
+
+    assert recognizer._predict.experimental_get_tracing_count() == 1
+
+
+def test_inference_worker_replies_with_context(model):
+    queue = Queue()
+    worker = InferenceWorker(queue)
+    worker.set_model(model, 'abc')
+    worker.start()
+
+    bearings = make_bearings(3)
+    try:
+        for i, gesture_bearings in enumerate(bearings):
+            worker.submit(gesture_bearings, request=i)
+        results = sorted((queue.get(timeout=10) for _ in bearings), key=lambda result: result['request'])
+    finally:
+        worker.stop()
+
+    expected = KerasRecognizer(model, 'abc').recognize(bearings)
+    assert [result['glyph'] for result in results] == [glyph for glyph, confidence in expected]
+    assert [result['confidence'] for result in results] == pytest.approx([confidence for glyph, confidence in expected])
+    assert all(result['type'] == 'inference' for result in results)
+
+
+def convert(model, pathspec, quantize=False):
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    if quantize:
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        converter.inference_input_type = tf.int8
+        converter.inference_output_type = tf.int8
+        converter.representative_dataset = lambda: ([np.array(bearings, dtype=np.float32, ndmin=3)]
+                                                    for bearings in make_bearings(32, seed=1))
+
+    with open(pathspec, 'wb') as f:
+        f.write(converter.convert())
+    return pathspec
+
+
+def test_recognizers_have_to_score_gestures():
+    with pytest.raises(TypeError):
+        Recognizer('abc')
+
+
+def test_tflite_recognizer_matches_keras(model, tmp_path):
+    recognizer = load_recognizer(convert(model, str(tmp_path / 'model.tflite')), 'abc')
+    assert isinstance(recognizer, TFLiteRecognizer)
+
+    bearings = make_bearings(8)
+    assert np.allclose(recognizer(bearings), model.predict(bearings, verbose=0), atol=1e-5)
+
+    # Tensors get reused, so a second round mustn't see leftovers from the first
+    assert np.allclose(recognizer(bearings[::-1]), model.predict(bearings[::-1], verbose=0), atol=1e-5)
+
+
+def test_tflite_recognizer_dequantizes(model, tmp_path):
+    recognizer = TFLiteRecognizer(convert(model, str(tmp_path / 'model.tflite'), quantize=True), 'abc')
+
+    bearings = make_bearings(8)
+    scores = recognizer(bearings)
+    assert scores.dtype == np.float32
+    assert np.allclose(scores, model.predict(bearings, verbose=0), atol=0.05)
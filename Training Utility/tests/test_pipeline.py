@@ -0,0 +1,40 @@
+import asyncio
+
+import numpy as np
+
+from somatictrainer.gestures import Gesture
+from somatictrainer.inference import InferenceWorker, Recognizer
+from somatictrainer.pipeline import recognize_gestures
+
+
+class LeftOrRight(Recognizer):
+    def __call__(self, bearings):
+        leftness = (bearings[:, -1, 0] < 0.5).astype(np.float32)
+        return np.stack((leftness, 1 - leftness), axis=1)
+
+
+def test_recognize_gestures_posts_predictions():
+    worker = InferenceWorker(None, LeftOrRight('lr'))
+    worker.start()
+
+    left = Gesture('', np.linspace([0.5, 0.5], [0.1, 0.5], 50), [])
+    right = Gesture('', np.linspace([0.5, 0.5], [0.9, 0.5], 50), [])
+
+    async def recognize():
+        gestures, predictions = asyncio.Queue(), asyncio.Queue()
+        task = asyncio.ensure_future(recognize_gestures(gestures, predictions, worker))
+
+        await gestures.put(left)
+        await gestures.put(right)
+        results = [await asyncio.wait_for(predictions.get(), 5) for _ in range(2)]
+
+        task.cancel()
+        return results
+
+    try:
+        results = asyncio.run(recognize())
+    finally:
+        worker.stop()
+
+    assert {(result['gesture'], result['glyph']) for result in results} == {(left, 'l'), (right, 'r')}
+    assert all(result['type'] == 'inference' and result['confidence'] == 1 for result in results)
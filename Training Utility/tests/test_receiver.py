@@ -0,0 +1,245 @@
+import numpy as np
+
+from queue import Queue
+
+from somatictrainer.receiver import SampleRingBuffer, SerialReceiver, ack, binary_ack, binary_packet_dtype, \
+    binary_packet_magic, decode_binary_packets, parse_packets, sample_dtype
+
+
+def make_samples(start, count):
+    samples = np.zeros(count, dtype=sample_dtype)
+    samples['t'] = np.arange(start, start + count)
+    return samples
+
+
+def test_ring_buffer_wraps_around():
+    ring = SampleRingBuffer(capacity=4)
+
+    assert ring.push_many(make_samples(0, 3)) == 0
+    assert list(ring.drain(2)['t']) == [0, 1]
+
+    # These go in the last slot and then around to the front
+    assert ring.push_many(make_samples(3, 2)) == 0
+    assert ring.push([True] * 4, [5, 5, 5], [0, 0, 0], 5)
+    assert len(ring) == 4
+
+    assert list(ring.drain()['t']) == [2, 3, 4, 5]
+    assert len(ring) == 0
+
+    # ...and keeps going after the counters have lapped the capacity a few times
+    for start in range(7, 30, 3):
+        ring.push_many(make_samples(start, 3))
+        assert list(ring.drain()['t']) == [start, start + 1, start + 2]
+
+
+def test_ring_buffer_drops_the_newest_when_full():
+    ring = SampleRingBuffer(capacity=4)
+
+    assert ring.push_many(make_samples(0, 6)) == 2
+    assert not ring.push([False] * 4, [0, 0, 0], [0, 0, 0], 6)
+    assert ring.dropped == 3
+
+    assert list(ring.drain()['t']) == [0, 1, 2, 3]
+
+    # Draining made room again
+    assert ring.push_many(make_samples(7, 2)) == 0
+    assert list(ring.drain()['t']) == [7, 8]
+
+
+def test_ring_buffer_clear_skips_whats_waiting():
+    ring = SampleRingBuffer(capacity=4)
+    ring.push_many(make_samples(0, 3))
+
+    ring.clear()
+
+    assert len(ring) == 0
+    assert len(ring.drain()) == 0
+    ring.push_many(make_samples(3, 4))
+    assert list(ring.drain()['t']) == [3, 4, 5, 6]
+
+
+def text_packet(t):
+    return '>.,|,.,|,0.1,0.2,{}.5,1,2,3,{}'.format(t, t).encode()
+
+
+def test_parse_packets_keeps_the_good_lines():
+    samples, acks, used = parse_packets([text_packet(0), b'>OK', text_packet(1)])
+
+    assert acks == [ack]
+    assert used == 3
+    assert list(samples['t']) == [0, 1]
+    assert samples['f'][0].tolist() == [True, False, True, False]
+    assert samples['b'][1].tolist() == [0.1, 0.2, 1.5]
+    assert samples['a'][1].tolist() == [1, 2, 3]
+
+
+def test_parse_packets_skips_malformed_lines():
+    lines = [
+        b'\x00\xffnoise' + text_packet(0),  # Junk before the delimiter is fine
+        text_packet(1)[5:],  # The tail end of a line we missed the start of
+        b'>.,|,.,|,0.1,0.2',  # Cut off partway through
+        text_packet(2) + b'>' + text_packet(3),  # Two packets mashed together
+        b'>x,|,.,|,0.1,0.2,0.3,1,2,3,4',  # Not a finger state
+        b'>.,|,.,|,0.1,nope,0.3,1,2,3,5',  # Not a number
+        b'>.,|,.,|,0.1,0.2,0.3,1,2,3,,',  # Right number of commas, missing the numbers
+        b'',
+        text_packet(6) + b'\r',
+    ]
+
+    samples, acks, used = parse_packets(lines)
+
+    assert acks == []
+    assert used == len(lines)
+    assert list(samples['t']) == [0, 6]
+    assert samples['b'][1].tolist() == [0.1, 0.2, 6.5]
+
+
+def test_parse_packets_stops_at_binary_ack():
+    samples, acks, used = parse_packets([text_packet(0), b'>OK', b'>OKB', b'\xa5Z binary, not a packet'])
+
+    assert acks == [ack, binary_ack]
+    assert used == 3
+    assert list(samples['t']) == [0]
+
+
+def binary_packet(t, fingers=0b0101):
+    packet = np.zeros(1, dtype=binary_packet_dtype)
+    packet['magic'] = np.frombuffer(binary_packet_magic, dtype='<u2')
+    packet['fingers'] = fingers
+    packet['b'] = [0.25, 0.5, t]
+    packet['a'] = [1, 2, 3]
+    packet['t'] = t
+
+    data = bytearray(packet.tobytes())
+    data[-1] = sum(data[2:-1]) % 256
+    return bytes(data)
+
+
+def test_decode_binary_packets():
+    samples, used = decode_binary_packets(binary_packet(0) + binary_packet(1))
+
+    assert used == 2 * binary_packet_dtype.itemsize
+    assert list(samples['t']) == [0, 1]
+    assert samples['f'][0].tolist() == [True, False, True, False]
+    assert samples['b'][1].tolist() == [0.25, 0.5, 1]
+    assert samples['a'][1].tolist() == [1, 2, 3]
+
+
+def test_decode_binary_packets_resyncs_after_bad_magic():
+    dropped_byte = binary_packet(1)[1:]
+    samples, used = decode_binary_packets(b'junk' + binary_packet(0) + dropped_byte + binary_packet(2))
+
+    assert list(samples['t']) == [0, 2]
+    assert used == 4 + 2 * binary_packet_dtype.itemsize + len(dropped_byte)
+
+
+def test_decode_binary_packets_skips_bad_checksums():
+    corrupt = bytearray(binary_packet(1))
+    corrupt[5] ^= 0xff
+
+    samples, used = decode_binary_packets(binary_packet(0) + bytes(corrupt) + binary_packet(2))
+
+    assert list(samples['t']) == [0, 2]
+    assert used == 3 * binary_packet_dtype.itemsize
+
+
+def test_decode_binary_packets_waits_for_split_packets():
+    data = binary_packet(0) + binary_packet(1) + binary_packet(2)
+    split = binary_packet_dtype.itemsize + 10
+
+    samples, used = decode_binary_packets(data[:split])
+    assert list(samples['t']) == [0]
+    assert used == binary_packet_dtype.itemsize
+
+    samples, used = decode_binary_packets(data[used:])
+    assert list(samples['t']) == [1, 2]
+
+
+def test_decode_binary_packets_keeps_half_a_magic_number():
+    samples, used = decode_binary_packets(b'x' * binary_packet_dtype.itemsize + binary_packet_magic[:1])
+
+    assert len(samples) == 0
+    assert used == binary_packet_dtype.itemsize
+
+    samples, _ = decode_binary_packets(binary_packet_magic[:1] + binary_packet(0)[1:])
+    assert list(samples['t']) == [0]
+
+
+class FakePort:
+    def __init__(self):
+        self.incoming = bytearray()
+        self.written = bytearray()
+        self.timeout = None
+
+    @property
+    def in_waiting(self):
+        return len(self.incoming)
+
+    def read(self, size=1):
+        data = bytes(self.incoming[:size])
+        del self.incoming[:size]
+        return data
+
+    def write(self, data):
+        self.written += data
+
+
+def receive(receiver, times=1):
+    for _ in range(times):
+        if receiver.binary:
+            receiver._receive_binary_packets()
+        else:
+            receiver._receive_lines()
+
+
+def test_receiver_switches_to_binary_on_ack():
+    port = FakePort()
+    receiver = SerialReceiver(port, Queue())
+
+    port.incoming += text_packet(0) + b'\n>OK\n>OKB\n' + binary_packet(1) + binary_packet(2)[:10]
+    receive(receiver)
+    assert receiver.binary
+    assert receiver.queue.get_nowait() == {'type': 'ack'}
+
+    port.incoming += binary_packet(2)[10:]
+    receive(receiver)
+
+    assert list(receiver.samples.drain()['t']) == [0, 1, 2]
+
+
+def test_receiver_renegotiates_when_the_glove_resets_to_text():
+    port = FakePort()
+    receiver = SerialReceiver(port, Queue())
+    receiver.binary = True
+
+    port.incoming += binary_packet(0)
+    receive(receiver)
+
+    # The glove reset, and it's back to sending text a few packets at a time
+    for t in range(1, 9, 2):
+        port.incoming += text_packet(t) + b'\n' + text_packet(t + 1) + b'\n'
+        receive(receiver)
+
+    assert not receiver.binary
+    assert port.written == b'>ATB\r\n'
+
+    # Carries on in text until the glove says otherwise
+    port.incoming += text_packet(9) + b'\n>OKB\n' + binary_packet(10)
+    receive(receiver, 2)
+
+    assert receiver.binary
+    assert list(receiver.samples.drain()['t'])[-3:] == [8, 9, 10]
+
+
+def test_receiver_doesnt_renegotiate_over_line_noise():
+    port = FakePort()
+    receiver = SerialReceiver(port, Queue())
+    receiver.binary = True
+
+    for t in range(10):
+        port.incoming += binary_packet(t) + (text_packet(t) + b'\n' if t % 3 == 0 else b'')
+        receive(receiver)
+
+    assert receiver.binary
+    assert port.written == b''
+    assert list(receiver.samples.drain()['t']) == list(range(10))
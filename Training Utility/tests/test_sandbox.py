@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from somatictrainer.gestures import standard_gesture_length
+from somatictrainer.sandbox import make_dataset
+
+tf = pytest.importorskip('tensorflow')
+
+
+def make_corpus(tmp_path, count=100):
+    bearings = np.lib.format.open_memmap(str(tmp_path / 'bearings.npy'), mode='w+', dtype=np.float32,
+                                         shape=(count, standard_gesture_length, 2))
+    bearings[:] = np.arange(count, dtype=np.float32)[:, np.newaxis, np.newaxis]
+    return bearings, np.arange(count) % 3
+
+
+def read_epoch(dataset):
+    examples, labels = [], []
+    for batch, batch_labels in dataset:
+        examples.extend(batch.numpy()[:, 0, 0].astype(int))
+        labels.extend(np.argmax(batch_labels.numpy(), axis=1))
+    return examples, labels
+
+
+def test_make_dataset_streams_without_caching(tmp_path):
+    bearings, labels = make_corpus(tmp_path)
+    indices = np.arange(0, 100, 2)
+
+    dataset = make_dataset(bearings, labels, indices, 3, batch_size=8, shuffle=False, chunk_size=16)
+
+    examples, epoch_labels = read_epoch(dataset)
+    assert examples == list(indices)
+    assert epoch_labels == list(labels[indices])
+
+    # Nothing's cached, so the next epoch reads the memory map again
+    bearings += 1000
+    assert read_epoch(dataset)[0] == list(indices + 1000)
+
+
+def test_make_dataset_caches_to_a_file(tmp_path):
+    bearings, labels = make_corpus(tmp_path)
+    cache_pathspec = str(tmp_path / 'cache')
+
+    dataset = make_dataset(bearings, labels, np.arange(100), 3, batch_size=10, cache_pathspec=cache_pathspec)
+    first, second = read_epoch(dataset)[0], read_epoch(dataset)[0]
+
+    assert sorted(first) == sorted(second) == list(range(100))
+    assert any(path.name.startswith('cache') for path in tmp_path.iterdir())
+
+
+def test_make_dataset_shuffles_across_chunks(tmp_path):
+    bearings, _ = make_corpus(tmp_path)
+    labels = np.arange(100) // 25  # Grouped by class, like a saved training set
+
+    # The buffer only holds one chunk, so without shuffling the chunks every epoch would start with class 0
+    dataset = make_dataset(bearings, labels, np.arange(100), 4, batch_size=10, shuffle_buffer_size=10, chunk_size=10)
+
+    epochs = [read_epoch(dataset) for _ in range(10)]
+    assert all(sorted(examples) == list(range(100)) for examples, epoch_labels in epochs)
+    assert len({epoch_labels[0] for examples, epoch_labels in epochs}) > 1
@@ -0,0 +1,70 @@
+import numpy as np
+
+from somatictrainer.segmenter import GestureSegmenter
+
+pointing = [True, True, True, False]
+interval = 10000  # Microseconds between samples - 100Hz, like the glove
+
+
+def swipe(segmenter, start, step, count, fingers=pointing):
+    """
+    Move the hand step radians of yaw per sample, then hold still until the segmenter gives up on the gesture.
+
+    :return: Whatever gestures came out
+    """
+    gestures = []
+    yaw = start
+
+    for _ in range(count):
+        yaw += step
+        gestures.append(segmenter.feed(fingers, np.array([yaw, 0.0, 0.0]), np.zeros(3), interval))
+
+    for _ in range(10):
+        gestures.append(segmenter.feed(fingers, np.array([yaw, 0.0, 0.0]), np.zeros(3), interval))
+
+    return [gesture for gesture in gestures if gesture is not None]
+
+
+def test_segmenter_finds_a_gesture():
+    segmenter = GestureSegmenter()
+
+    gestures = swipe(segmenter, 0, 0.06, 20)
+
+    assert len(gestures) == 1
+    assert not segmenter.recording
+    assert gestures[0].bearings.shape == (50, 2)
+    # All yaw, no pitch
+    assert np.ptp(gestures[0].bearings[:, 0]) > 0.5
+    assert np.ptp(gestures[0].bearings[:, 1]) < 0.01
+    assert len(gestures[0].raw_data) > 20
+    assert segmenter.last_gesture_duration == np.sum(gestures[0].raw_data['t'])
+
+
+def test_segmenter_needs_the_pointer_hand_sign():
+    segmenter = GestureSegmenter()
+
+    assert swipe(segmenter, 0, 0.06, 20, fingers=[True, True, True, True]) == []
+
+
+def test_segmenter_locks_out_by_the_gloves_clock():
+    segmenter = GestureSegmenter()
+    assert len(swipe(segmenter, 0, 0.06, 20)) == 1
+
+    # Holding still took 0.1 seconds of glove time, so this one starts inside the lockout...
+    segmenter.feed(pointing, np.array([0.0, 0.0, 0.0]), np.zeros(3), interval)
+    assert swipe(segmenter, 0, 0.06, 5) == []
+
+    # ...and long after it's over, gestures work again, however quickly we happen to be fed the samples
+    segmenter.feed(pointing, np.array([0.0, 0.0, 0.0]), np.zeros(3), 1000000)
+    assert len(swipe(segmenter, 0, 0.06, 20)) == 1
+
+
+def test_segmenter_survives_huge_jumps():
+    segmenter = GestureSegmenter()
+
+    segmenter.feed(pointing, np.array([0.0, 0.0, 0.0]), np.zeros(3), interval)
+    segmenter.feed(pointing, np.array([1.5, 1.5, 0.0]), np.zeros(3), interval)
+
+    # A jump that big would be NaN without clamping, and NaN would never start a gesture
+    assert not np.isnan(segmenter.angular_velocity_window).any()
+    assert segmenter.recording
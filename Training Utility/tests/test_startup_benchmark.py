@@ -0,0 +1,39 @@
+import logging
+import subprocess
+import sys
+
+import pytest
+
+from somatictrainer import exit_after_first_frame_variable
+from somatictrainer.startup_benchmark import time_startup
+
+
+def test_trainer_imports_without_tensorflow():
+    # Needs a fresh interpreter - the inference tests import TensorFlow into this one
+    result = subprocess.run([sys.executable, '-c', 'import sys, somatictrainer.app; '
+                                                   'print("tensorflow" in sys.modules)'],
+                            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True)
+    assert result.stdout.decode().strip() == 'False'
+
+
+def test_benchmark_doesnt_import_the_trainer():
+    # Otherwise the benchmark's own process pays for the GUI before it's timed anything
+    result = subprocess.run([sys.executable, '-c', 'import sys, somatictrainer.startup_benchmark; '
+                                                   'print(sorted({"somatictrainer.app", "tkinter", "PIL"} '
+                                                   '& set(sys.modules)))'],
+                            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True)
+    assert result.stdout.decode().strip() == '[]'
+
+
+def test_time_startup_times_every_run():
+    timings = time_startup(3, [sys.executable, '-c', 'import os; assert os.environ[{!r}]'.format(
+        exit_after_first_frame_variable)])
+
+    assert len(timings) == 3 and all(timing > 0 for timing in timings)
+
+
+def test_time_startup_reports_why_the_trainer_died(caplog):
+    with caplog.at_level(logging.ERROR, 'startup_benchmark'), pytest.raises(subprocess.CalledProcessError):
+        time_startup(1, [sys.executable, '-c', 'raise SystemExit("no display")'])
+
+    assert 'no display' in caplog.text
@@ -0,0 +1,152 @@
+import os
+
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw
+
+from somatictrainer import thumbnails
+from somatictrainer.gestures import Gesture, GestureTrainingSet
+from somatictrainer.thumbnails import SpriteSheet, ThumbnailCache, render_thumbnails, thumbnail_key
+
+
+def render(paths):
+    return render_thumbnails(paths, 20, 30, 2)
+
+
+def legacy_gesture_to_image(path, height, width, line_thiccness, xpad=0, ypad=0):
+    """
+    The app's _gesture_to_image as it was before render_thumbnails, drawing one segment at a time with ImageDraw.
+    Kept around to check the batch renderer against.
+    """
+    img = Image.new('RGBA', (height, width), (255, 255, 255, 255))
+    drawing = ImageDraw.Draw(img)
+
+    x_center = (max(path[:, 0] - min(path[:, 0]))) / 2
+    y_center = (max(path[:, 1] - min(path[:, 1]))) / 2
+
+    for i, coords in enumerate(path):
+        if i > 0:
+            prev_x_coord = (path[i - 1][0] + 0.5 - x_center) * (width - xpad * 2)
+            prev_y_coord = (path[i - 1][1] + 0.5 - y_center) * (height - ypad * 2)
+            x_coord = (coords[0] + 0.5 - x_center) * (width - xpad * 2)
+            y_coord = (coords[1] + 0.5 - y_center) * (height - ypad * 2)
+
+            green = int((i * -255) / len(path) + 255)
+            blue = int((i * 255) / len(path))
+            drawing.line(((prev_x_coord, prev_y_coord), (x_coord, y_coord)),
+                         fill=(0, green, blue, 255),
+                         width=line_thiccness)
+
+    return np.asarray(img)
+
+
+def make_gestures(count, glyph='a', seed=0):
+    rng = np.random.default_rng(seed)
+    return [Gesture(glyph, rng.random((50, 2)), []) for _ in range(count)]
+
+
+@pytest.mark.parametrize('size, line_thiccness, pad', [(50, 2, 2), (30, 3, 0), (64, 5, 4)])
+def test_render_thumbnails_matches_imagedraw(size, line_thiccness, pad):
+    rng = np.random.default_rng(size)
+    paths = np.concatenate([
+        np.cumsum(rng.normal(0, 0.03, (10, 50, 2)), axis=1),  # Wiggly, like real gestures
+        rng.random((10, 50, 2)),  # All over the place
+        rng.normal(0.5, 0.6, (10, 50, 2)),  # Off the edges
+    ])
+    paths[0, 10:20] = paths[0, 10]  # Standing still for a bit
+
+    rendered = render_thumbnails(paths, size, size, line_thiccness, pad, pad)
+
+    for path, thumbnail in zip(paths, rendered):
+        assert np.array_equal(thumbnail, legacy_gesture_to_image(path, size, size, line_thiccness, pad, pad))
+
+
+def test_sprite_sheet_round_trips_through_png(tmp_path):
+    png_pathspec, index_pathspec = str(tmp_path / 'a.png'), str(tmp_path / 'a.json')
+    gestures = make_gestures(25)
+    sprites = render([gesture.bearings for gesture in gestures])
+
+    sheet = SpriteSheet(png_pathspec, index_pathspec)
+    for gesture, sprite in zip(gestures, sprites):
+        sheet.put(thumbnail_key(gesture), sprite)
+    sheet.save()
+    assert not sheet.dirty
+
+    reloaded = SpriteSheet(png_pathspec, index_pathspec)
+    for gesture, sprite in zip(gestures, sprites):
+        assert np.array_equal(reloaded.get(thumbnail_key(gesture)), sprite)
+
+
+def test_unreadable_sprite_sheets_start_over(tmp_path):
+    png_pathspec, index_pathspec = str(tmp_path / 'a.png'), str(tmp_path / 'a.json')
+    with open(png_pathspec, 'wb') as f:
+        f.write(b'not a png')
+    with open(index_pathspec, 'w') as f:
+        f.write('{"size": [30, 20], "keys": ["x"]}')
+
+    sheet = SpriteSheet(png_pathspec, index_pathspec)
+    assert 'x' not in sheet
+
+
+def test_flush_drops_gestures_that_are_gone(tmp_path):
+    training_set = GestureTrainingSet()
+    gestures = make_gestures(3) + make_gestures(2, 'b', seed=1)
+    for gesture in gestures:
+        training_set.add(gesture)
+
+    cache = ThumbnailCache(render, str(tmp_path / 'thumbnails'))
+    cache.prefetch(gestures)
+    training_set.remove(gestures[0])
+    cache.flush(training_set)
+
+    assert sorted(os.listdir(str(tmp_path / 'thumbnails'))) == ['0061.json', '0061.png', '0062.json', '0062.png']
+
+    # A fresh cache finds everything that's left on disk, and renders nothing
+    rendered = []
+    cache = ThumbnailCache(lambda paths: rendered.append(len(paths)) or render(paths), str(tmp_path / 'thumbnails'))
+    cache.prefetch(gestures[1:])
+    assert not rendered
+    assert thumbnail_key(gestures[0]) not in cache._sheet_for('a')
+
+
+def test_sheets_get_saved_before_theyre_pushed_out(tmp_path):
+    directory = str(tmp_path / 'thumbnails')
+    cache = ThumbnailCache(render, directory, loaded_sheets=2)
+
+    glyphs = 'abcde'
+    gestures = {glyph: make_gestures(3, glyph, seed=seed) for seed, glyph in enumerate(glyphs)}
+    for glyph in glyphs:
+        cache.prefetch(gestures[glyph])
+
+    # Only the newest sheets are still in memory - the rest are on disk, without anybody calling flush
+    assert list(cache._sheets) == ['d', 'e']
+    assert all(cache._sheets[glyph].dirty for glyph in 'de')
+    assert sorted(os.listdir(directory)) == ['0061.json', '0061.png', '0062.json', '0062.png', '0063.json', '0063.png']
+
+    rendered = []
+    cache = ThumbnailCache(lambda paths: rendered.append(len(paths)) or render(paths), directory)
+    for glyph in 'abc':
+        cache.prefetch(gestures[glyph])
+    assert not rendered
+
+
+def test_thumbnails_from_before_theres_a_directory_get_saved(tmp_path, monkeypatch):
+    # PhotoImages need a Tk root, and there's no display here
+    monkeypatch.setattr(thumbnails.ImageTk, 'PhotoImage', lambda image: image)
+
+    training_set = GestureTrainingSet()
+    gestures = make_gestures(3)
+    for gesture in gestures:
+        training_set.add(gesture)
+
+    cache = ThumbnailCache(render)
+    for gesture in gestures:
+        cache.get(gesture)
+
+    directory = str(tmp_path / 'thumbnails')
+    cache.set_directory(directory)
+    cache.flush(training_set)
+
+    sheet = SpriteSheet(os.path.join(directory, '0061.png'), os.path.join(directory, '0061.json'))
+    for gesture, sprite in zip(gestures, render([gesture.bearings for gesture in gestures])):
+        assert np.array_equal(sheet.get(thumbnail_key(gesture)), sprite)
@@ -0,0 +1,149 @@
+import numpy as np
+import pytest
+
+from somatictrainer.util import custom_interpolate, process_samples, process_samples_batch
+
+
+def legacy_process_samples(samples, desired_length):
+    """
+    process_samples as it was before it got vectorized, minus the logging. Kept around to check the fast one against.
+    """
+    if not len(samples) > 1:
+        raise AttributeError('Sample list is empty')
+
+    unique_bearings = [samples[0]]
+    for index, bearing in enumerate(samples):
+        if not index:
+            continue
+        if not (np.isclose(bearing[0], samples[index - 1, 0]) and np.isclose(bearing[1], samples[index - 1, 1])):
+            unique_bearings.append(bearing)
+
+    samples = np.array(unique_bearings)
+
+    yaw_min = min(samples[:, 0])
+    yaw_max = max(samples[:, 0])
+    pitch_min = min(samples[:, 1])
+    pitch_max = max(samples[:, 1])
+
+    magnitude = np.linalg.norm([yaw_max - yaw_min, pitch_max - pitch_min])
+    fudge_factor = 1 / 10
+
+    early_crap_count = 0
+    for i in range(1, len(samples)):
+        if np.linalg.norm([samples[i, 0] - samples[0, 0],
+                           samples[i, 1] - samples[0, 1]]) > magnitude * fudge_factor:
+            break
+        early_crap_count += 1
+
+    samples = np.array([samples[0]] + samples[early_crap_count + 1:].tolist())
+
+    late_crap_count = 0
+    for i in range(2, len(samples)):
+        if np.linalg.norm([samples[-i, 0] - samples[- 1, 0],
+                           samples[-i, 1] - samples[- 1, 1]]) > magnitude * fudge_factor:
+            break
+        late_crap_count += 1
+
+    if late_crap_count:
+        endpoint = samples[-1]
+        samples = np.array(samples[:(late_crap_count + 1) * -1].tolist() + [endpoint])
+
+    cumulative_segment_lengths = [0]
+    for index, sample in enumerate(samples):
+        if index == 0:
+            continue
+        segment_length = np.linalg.norm([sample[0] - samples[index - 1][0], sample[1] - samples[index - 1][1]])
+        cumulative_segment_lengths.append(segment_length + cumulative_segment_lengths[index - 1])
+
+    curve_length = cumulative_segment_lengths[-1]
+    target_segment_length = curve_length / (desired_length - 1)
+
+    standardized_bearings = [samples[0]]
+    first_longer_sample = 0
+
+    for i in range(1, desired_length):
+        target_length = i * target_segment_length
+
+        if not cumulative_segment_lengths[first_longer_sample] > target_length:
+            while cumulative_segment_lengths[first_longer_sample] < target_length \
+                    and not np.isclose(cumulative_segment_lengths[first_longer_sample], target_length):
+                first_longer_sample += 1
+                if first_longer_sample >= len(cumulative_segment_lengths):
+                    raise AttributeError("Entire line isn't long enough?!")
+
+        low_point = samples[first_longer_sample - 1]
+        high_point = samples[first_longer_sample]
+        position_along_segment = ((target_length - cumulative_segment_lengths[first_longer_sample - 1]) /
+                                  (cumulative_segment_lengths[first_longer_sample]
+                                   - cumulative_segment_lengths[first_longer_sample - 1]))
+
+        standardized_bearings.append([low_point[0] + position_along_segment * (high_point[0] - low_point[0]),
+                                      low_point[1] + position_along_segment * (high_point[1] - low_point[1])])
+
+    standardized_bearings = [[y - yaw_min, p - pitch_min] for y, p in standardized_bearings]
+
+    total_width = yaw_max - yaw_min
+    total_height = pitch_max - pitch_min
+
+    return np.array([[custom_interpolate(y, 0, max(total_width, total_height), 0, 1),
+                      custom_interpolate(p, 0, max(total_width, total_height), 0, 1)]
+                     for y, p in standardized_bearings])
+
+
+def make_traces(seed=0):
+    """
+    Fixed traces covering the awkward cases - duplicate points, slop at either end, and two-point traces
+    """
+    rng = np.random.default_rng(seed)
+    traces = [np.array([[0.5, 0.5], [0.9, 0.7]]),
+              np.array([[0.5, 0.5], [0.5, 0.1]]),
+              np.array([[0.5, 0.5], [0.5, 0.5], [0.5, 0.5], [0.8, 0.5], [0.8, 0.5]]),
+              np.array([[0.5, 0.5], [0.500001, 0.5], [0.6, 0.6], [0.7, 0.5], [0.700001, 0.5]])]
+
+    for length in (3, 10, 60, 150):
+        for _ in range(5):
+            trace = 0.5 + np.cumsum(rng.normal(0, 0.02, (length, 2)), axis=0)
+            trace[0] = 0.5
+            # Repeat some points, the way a glove that didn't move between samples does
+            repeats = rng.integers(1, 4, length)
+            traces.append(np.repeat(trace, repeats, axis=0))
+
+    return traces
+
+
+@pytest.mark.parametrize('desired_length', [2, 50])
+def test_process_samples_matches_the_old_loop(desired_length):
+    for trace in make_traces():
+        assert np.array_equal(process_samples(trace, desired_length), legacy_process_samples(trace, desired_length))
+
+
+def test_process_samples_rejects_gestures_that_go_nowhere():
+    with pytest.raises(AttributeError):
+        process_samples(np.array([[0.5, 0.5]]), 50)
+
+    with pytest.raises(ValueError, match='no length'):
+        process_samples(np.full((10, 2), 0.5), 50)
+
+
+@pytest.mark.parametrize('desired_length', [2, 50])
+def test_process_samples_batch_matches_one_at_a_time(desired_length):
+    # Ragged, with two-point traces at either end and in the middle
+    traces = make_traces()
+    traces = traces[:2] + traces[4:] + traces[2:4]
+
+    batch = process_samples_batch(traces, desired_length)
+
+    assert batch.shape == (len(traces), desired_length, 2)
+    for trace, output in zip(traces, batch):
+        assert np.array_equal(output, process_samples(trace, desired_length))
+
+
+def test_process_samples_batch_rejects_what_process_samples_does():
+    traces = make_traces()
+    assert process_samples_batch([], 50).shape == (0, 50, 2)
+
+    with pytest.raises(AttributeError):
+        process_samples_batch(traces + [np.array([[0.5, 0.5]])], 50)
+
+    with pytest.raises(ValueError, match='#3 has no length'):
+        process_samples_batch(traces[:3] + [np.full((10, 2), 0.5)], 50)